@@ -0,0 +1,63 @@
+"""Benchmark the hierarchy index on a synthetic deep DAG.
+
+Every node below the first level has one primary parent one level up and,
+with some probability, an extra parent one or two levels up (multiple
+inheritance), which is what makes Cypher path expansion blow up. Extra
+parents stay close so the shortest path to a root remains long: the deepest
+node is at least half of `--depth` below its root. Run from the server
+directory:
+
+    python -m benchmarks.bench_ancestors --depth 500 --width 20
+"""
+import argparse
+import random
+import time
+
+from utils.hierarchy import HierarchyIndex
+
+def generate_dag(depth: int, width: int, extra_parent_rate: float, seed: int = 0):
+    rng = random.Random(seed)
+    nodes = [(f"N:{level}.{i}", None) for level in range(depth) for i in range(width)]
+    edges = []
+    for level in range(1, depth):
+        for i in range(width):
+            child = f"N:{level}.{i}"
+            edges.append((child, f"N:{level - 1}.{rng.randrange(width)}"))
+            if rng.random() < extra_parent_rate:
+                # Skipping more levels would shortcut the paths the benchmark is about
+                extra_level = level - 1 - rng.randrange(min(2, level))
+                edges.append((child, f"N:{extra_level}.{rng.randrange(width)}"))
+    return nodes, edges
+
+def timed(label, fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    elapsed = (time.perf_counter() - started) / repeat
+    print(f"{label:<40} {elapsed * 1e6:12.1f} us")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--depth", type=int, default=500)
+    parser.add_argument("--width", type=int, default=20)
+    parser.add_argument("--extra-parent-rate", type=float, default=0.3)
+    parser.add_argument("--repeat", type=int, default=1000)
+    args = parser.parse_args()
+
+    nodes, edges = generate_dag(args.depth, args.width, args.extra_parent_rate)
+    index = HierarchyIndex()
+    started = time.perf_counter()
+    index.build(nodes, edges)
+    print(f"built {len(nodes)} nodes / {len(edges)} edges in {time.perf_counter() - started:.3f}s")
+
+    deepest = f"N:{args.depth - 1}.0"
+    middle = f"N:{args.depth // 2}.0"
+    print(f"depth of {deepest}: {index.depth(deepest)}")
+    assert index.depth(deepest) >= (args.depth - 1) // 2, "the DAG is too shallow to measure deep ancestors"
+    timed("ancestors (deepest node)", lambda: index.ancestors(deepest), args.repeat)
+    timed("depth (deepest node)", lambda: index.depth(deepest), args.repeat)
+    timed("root_paths limit=100 (deepest node)", lambda: index.root_paths(deepest, 100), max(1, args.repeat // 100))
+    timed("reparent mid-level node", lambda: index.set_parents(middle, [f"N:0.{random.randrange(args.width)}"]), max(1, args.repeat // 100))
+
+if __name__ == "__main__":
+    main()
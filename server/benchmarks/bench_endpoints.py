@@ -0,0 +1,421 @@
+"""Benchmark every HTTP endpoint against an in-memory graph.
+
+Serves the app in process over ASGI with the Neo4j drivers swapped for the
+stand-ins in benchmarks.fake_neo4j, seeded with a synthetic hierarchy across
+a few databases. The numbers therefore cover routing, validation, auth,
+serialization, CSV processing and tree building, but no database time. Each
+scenario sends its share of `--requests`, `--concurrency` at a time, and
+reports p50/p95/p99 latency and throughput. Reads run before writes, so
+they see the seeded graph. One request per scenario is sent first, alone,
+and reported separately as `first ms`: it pays for any cache it warms.
+
+`--save` writes the results as JSON. `--baseline` compares each scenario's
+p95 with saved results and exits non-zero if one got slower by more than
+`--tolerance`, or if any request failed. Run from the server directory:
+
+    python -m benchmarks.bench_endpoints --requests 500 --concurrency 16
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from typing import Callable, NamedTuple
+
+os.environ.setdefault("SECRET_KEY", "benchmark")
+# Never connected to: the drivers are replaced before the app starts
+os.environ.setdefault("NEO4J_URI", "bolt://fake:7687")
+os.environ.setdefault("NEO4J_USER", "neo4j")
+os.environ.setdefault("NEO4J_PASSWORD", "benchmark")
+# The stand-in has no query plans to capture
+os.environ.setdefault("SLOW_QUERY_PROFILE", "false")
+
+import httpx
+
+from main import app
+from benchmarks.bench_extract import generate_ontology
+from benchmarks.fake_neo4j import FakeGraph, covered_queries, install
+from utils import auth
+from utils.entry_snapshot import encode_cursor
+from utils.label_index import normalized_label_properties
+
+DATABASES = ("MPO", "NCBITaxon", "ICD10CM")
+WORDS = (
+    "abnormal", "increased", "decreased", "cell", "tissue", "growth", "membrane", "protein",
+    "strain", "serotype", "resistance", "morphology", "motility", "colony", "spore", "toxin",
+)
+# (column, result key) of the timings printed per scenario
+TIMINGS = (("first ms", "first_ms"), ("p50 ms", "p50_ms"), ("p95 ms", "p95_ms"), ("p99 ms", "p99_ms"), ("req/s", "rps"))
+
+BENCH_USER = "bench"
+BENCH_PASSWORD = "correct horse battery staple"
+
+class Scenario(NamedTuple):
+    name: str
+    # Request number -> (method, url, httpx request arguments)
+    request: Callable[[int], tuple]
+    # Fraction of --requests sent; slow endpoints (bcrypt, uploads) get less
+    share: float = 1.0
+    # Endpoints that report some failures in a 200 body
+    failed: Callable = None
+
+class Seed(NamedTuple):
+    identifiers: dict  # database -> identifiers
+    labels: list
+    loaded_terms: list  # notations of Terms shaped like an ontology load
+    user_ids: list
+    doomed_user_ids: list  # deleted by the user_delete scenario
+
+def generate_graph(entries: int, users: int, doomed_users: int, seed: int = 0):
+    """A DAG of `entries` entries split over DATABASES, plus users; returns `(graph, seed)`.
+
+    Each database has a few roots; every other entry has a parent earlier in
+    its database and, sometimes, a second one. One entry in a hundred also
+    gets a child Term shaped like a loaded ontology term; every other one of
+    those holds two identifiers.
+    """
+    rng = random.Random(seed)
+    graph = FakeGraph()
+    identifiers, labels, loaded_terms = {}, [], []
+    per_database = max(1, entries // len(DATABASES))
+    for database in DATABASES:
+        nodes = []
+        roots = max(1, per_database // 100)
+        for i in range(per_database):
+            identifier = f"{database}:{i:07d}"
+            pref_label = f"{rng.choice(WORDS)} {rng.choice(WORDS)} {database.lower()} {i}"
+            alt_label = [f"{rng.choice(WORDS)} {i}", f"{database} {i}"]
+            properties = {
+                "identifier": identifier,
+                "notation": identifier,
+                "prefLabel": pref_label,
+                "altLabel": alt_label,
+                "refs": [f"PMID:{rng.randrange(10 ** 7)}"],
+                **normalized_label_properties(pref_label, alt_label),
+            }
+            node = graph.add_node(["Species" if i < roots else "Strain", "AllNodes"], properties)
+            if i >= roots:
+                graph.link(node, nodes[rng.randrange(i)])
+                if rng.random() < 0.1:
+                    graph.link(node, nodes[rng.randrange(i)])
+            nodes.append(node)
+            labels.append(pref_label)
+        identifiers[database] = [node.properties["identifier"] for node in nodes]
+
+        for i, node in enumerate(nodes[::100]):
+            notation = node.properties["identifier"] + "-T"
+            term = graph.add_node(["Term", "AllNodes"], {
+                "uri": f"http://example.org/{notation}",
+                # skos:notation and dc:identifier both map to identifier
+                "identifier": [notation, notation.replace(":", "_")] if i % 2 else notation,
+                "notation": notation,
+                "prefLabel": f"loaded {notation}",
+            })
+            graph.link(term, node)
+            loaded_terms.append(notation)
+
+    hashed = auth.pwd_context.hash(BENCH_PASSWORD)
+    graph.add_node(["User"], {"username": BENCH_USER, "password": hashed})
+
+    def add_users(prefix, count):
+        return [graph.add_node(["User"], {"username": f"{prefix}{i:05d}", "password": hashed}).id for i in range(count)]
+
+    return graph, Seed(
+        identifiers, labels, loaded_terms, add_users("user", users), add_users("zz-doomed", doomed_users)
+    )
+
+def _http_error(response):
+    return f"HTTP {response.status_code}: {response.text[:200]}" if response.status_code >= 400 else None
+
+def _error_body(response):
+    # For handlers that catch exceptions and answer 200 with the message
+    if response.status_code >= 400:
+        return _http_error(response)
+    body = response.json()
+    if "error" in body or set(body) == {"message"}:
+        return f"HTTP {response.status_code}: {response.text[:200]}"
+    return None
+
+def csv_upload(labels: list, rows: int, columns: int, seed: int = 0):
+    rng = random.Random(seed)
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow([f"column{i}" for i in range(columns)])
+    for _ in range(rows):
+        # Mostly known labels, in mixed case, plus some that do not resolve
+        writer.writerow([
+            rng.choice(labels).upper() if rng.random() < 0.8 else f"unknown {rng.randrange(1000)}"
+            for _ in range(columns)
+        ])
+    return out.getvalue().encode()
+
+def bulk_upload(request: int, rows: int, parent: str):
+    lines = [
+        json.dumps({
+            "typeOfEntry": "Strain",
+            "data": {
+                "identifier": f"BULK:{request}.{i}", "prefLabel": f"bulk strain {request} {i}", "altLabel": [f"b{i}"]
+            },
+            "parents": [parent],
+        })
+        for i in range(rows)
+    ]
+    return "\n".join(lines).encode()
+
+def _get(url, **kwargs):
+    return "GET", url, kwargs
+
+def scenarios(seed: Seed, token: str, ontology_path: str, args):
+    headers = {"Authorization": f"Bearer {token}"}
+    mpo = seed.identifiers["MPO"]
+    every = [identifier for ids in seed.identifiers.values() for identifier in ids]
+    # Mid-sized subtrees: not the roots, not the leaves
+    inner = mpo[len(mpo) // 100: len(mpo) // 10] or mpo
+    rng = random.Random(1)
+    labels = [rng.choice(seed.labels) for _ in range(1000)]
+    csv_body = csv_upload(seed.labels, args.csv_rows, 10)
+
+    def user(i):
+        return seed.user_ids[i % len(seed.user_ids)]
+
+    def database(i):
+        return DATABASES[i % len(DATABASES)]
+
+    def page_cursor(i):
+        return encode_cursor((every[i % len(every)], ""))
+
+    def search(i):
+        return f"{WORDS[i % len(WORDS)]} {WORDS[(i * 7) % len(WORDS)]}"
+
+    login_form = {"username": BENCH_USER, "password": BENCH_PASSWORD}
+    csv_file = {"file": ("labels.csv", csv_body, "text/csv")}
+    root_page = {"limit": 100, "count": "true", "fields": "key,label,leaf"}
+
+    return [
+        # Reads, on the seeded graph
+        Scenario("entry_all", lambda i: _get("/api/entry/all")),
+        Scenario("entry_all_page", lambda i: _get("/api/entry/all", params={"limit": 1000, "cursor": page_cursor(i)})),
+        Scenario("entry_search", lambda i: _get(f"/api/entry/search/{search(i)}")),
+        Scenario("entry_search_cache_stats", lambda i: _get("/api/entry/search_cache/stats")),
+        Scenario("entry_roots", lambda i: _get(f"/api/entry/database/{database(i)}"), failed=_error_body),
+        Scenario(
+            "entry_roots_depth3",
+            lambda i: _get(f"/api/entry/database/{database(i)}", params={"depth": 3}),
+            failed=_error_body
+        ),
+        Scenario("entry_roots_page", lambda i: _get("/api/entry/database/MPO", params=root_page), failed=_error_body),
+        Scenario(
+            "entry_children",
+            lambda i: _get(f"/api/entry/database/{inner[i % len(inner)]}/children", params={"depth": 2}),
+            failed=_error_body
+        ),
+        Scenario(
+            "entry_ancestors",
+            lambda i: _get(f"/api/entry/database/{mpo[-1 - i % len(mpo)]}/ancestors", params={"all_paths": "true"}),
+            failed=_error_body
+        ),
+        Scenario(
+            "entry_ancestors_loaded",
+            lambda i: _get(f"/api/entry/database/{seed.loaded_terms[i % len(seed.loaded_terms)]}/ancestors"),
+            failed=_error_body
+        ),
+        Scenario("entry_detail", lambda i: _get(f"/api/entry/{every[(i * 31) % len(every)]}")),
+        Scenario("entry_resolve", lambda i: ("POST", "/api/entry/resolve", {"json": {"labels": labels}}), share=0.2),
+        Scenario("entry_uploadfile", lambda i: ("POST", "/api/entry/uploadfile/", {"files": csv_file}), share=0.2),
+        Scenario("user_getone", lambda i: _get("/api/user/getone", params={"id": user(i)}, headers=headers)),
+        Scenario("user_getall", lambda i: _get("/api/user/getall", params={"limit": 100}, headers=headers)),
+        Scenario(
+            "user_search",
+            lambda i: _get("/api/user/search", params={"search": f"user0{i % 10}", "match": "prefix"}, headers=headers)
+        ),
+        Scenario(
+            "user_search_contains",
+            lambda i: _get("/api/user/search", params={"search": f"{i % 100:02d}"}, headers=headers)
+        ),
+        # bcrypt bound
+        Scenario("login", lambda i: ("POST", "/api/login", {"data": login_form}), share=0.05),
+        Scenario(
+            "user_create",
+            lambda i: ("POST", "/api/user/create", {"data": {"username": f"new{i:06d}", "password": "pw"}}),
+            share=0.05
+        ),
+        # Writes
+        Scenario(
+            "user_delete",
+            lambda i: ("DELETE", "/api/user/delete", {"data": {"id": seed.doomed_user_ids[i]}, "headers": headers})
+        ),
+        Scenario(
+            "entry_create",
+            lambda i: ("POST", "/api/entry/create", {"headers": headers, "json": {
+                "typeOfEntry": "Strain",
+                "data": {"identifier": f"NEW:{i:07d}", "prefLabel": f"new strain {i}", "altLabel": [f"n{i}"]},
+                "parents": [mpo[i % len(mpo)]],
+            }})
+        ),
+        Scenario(
+            "entry_update",
+            lambda i: ("PUT", "/api/entry/update", {"headers": headers, "json": {
+                # Alternating types also exercises the type-change statement
+                "typeOfEntry": ("Species", "Strain")[i % 2],
+                "data": {"identifier": mpo[(i * 13) % len(mpo)], "prefLabel": f"updated {i}"},
+            }})
+        ),
+        Scenario(
+            "entry_update_loaded",
+            lambda i: ("PUT", "/api/entry/update", {"headers": headers, "json": {
+                "typeOfEntry": ("Species", "Strain")[i % 2],
+                # The loaded Terms with a single identifier
+                "data": {"identifier": seed.loaded_terms[(i * 2) % len(seed.loaded_terms)], "prefLabel": f"typed {i}"},
+            }})
+        ),
+        Scenario(
+            "entry_bulk",
+            lambda i: ("POST", "/api/entry/bulk", {
+                "headers": headers,
+                "files": {"file": ("entries.jsonl", bulk_upload(i, args.bulk_rows, mpo[i % len(mpo)]), "application/jsonl")},
+            }),
+            share=0.1
+        ),
+        Scenario(
+            "entry_load_ontology",
+            lambda i: ("POST", "/api/entry/load_ontology", {"data": {
+                # A copy per request: concurrent loads of one file would share its checkpoint
+                "file_path": shutil.copyfile(ontology_path, f"{ontology_path}.{i}.nt"), "stream": "true", "resume": "false",
+            }}),
+            share=0.05,
+            failed=_error_body
+        ),
+        Scenario("metrics", lambda i: ("GET", "/metrics", {})),
+    ]
+
+def percentile(ordered: list, p: float):
+    """Nearest-rank percentile of an ascending list."""
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+async def run_scenario(client, scenario: Scenario, requests: int, concurrency: int):
+    """Send request 0 alone, then requests 1 to `requests`, `concurrency` at a time.
+
+    Returns the result row and the first error.
+    """
+    latencies, errors = [], []
+    failed = scenario.failed or _http_error
+
+    async def send(i):
+        method, url, kwargs = scenario.request(i)
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+            error = failed(response)
+        except Exception as e:
+            error = repr(e)
+        if error:
+            errors.append(error)
+        return time.perf_counter() - started
+
+    first = await send(0)
+    numbers = iter(range(1, requests + 1))
+
+    async def worker():
+        for i in numbers:
+            latencies.append(await send(i))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": len(errors),
+        "first_ms": first * 1e3,
+        "p50_ms": percentile(latencies, 50) * 1e3,
+        "p95_ms": percentile(latencies, 95) * 1e3,
+        "p99_ms": percentile(latencies, 99) * 1e3,
+        "rps": requests / elapsed,
+    }, errors[0] if errors else None
+
+async def run(args, graph, seed: Seed, ontology_path: str):
+    install(graph)
+    results = {}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            response = await client.post("/api/login", data={"username": BENCH_USER, "password": BENCH_PASSWORD})
+            response.raise_for_status()
+            token = response.json()["access_token"]
+
+            print(f"{'scenario':<26} {'requests':>8} {'errors':>6}", *(f"{column:>9}" for column, _ in TIMINGS))
+            for scenario in scenarios(seed, token, ontology_path, args):
+                if args.only and not any(scenario.name.startswith(prefix) for prefix in args.only):
+                    continue
+                requests = max(1, int(args.requests * scenario.share))
+                row, error = await run_scenario(client, scenario, requests, args.concurrency)
+                results[scenario.name] = row
+                timings = (f"{row[key]:>9.2f}" for _, key in TIMINGS)
+                print(f"{scenario.name:<26} {row['requests']:>8} {row['errors']:>6}", *timings)
+                if error:
+                    print(f"  first error: {error}", file=sys.stderr)
+    return results
+
+def regressions(results: dict, baseline: dict, tolerance: float):
+    """`(scenario, baseline p95, p95)` for the scenarios whose p95 grew by more than `tolerance`."""
+    return [
+        (name, baseline[name]["p95_ms"], row["p95_ms"])
+        for name, row in results.items()
+        if name in baseline and row["p95_ms"] > baseline[name]["p95_ms"] * (1 + tolerance)
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario, before its share")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--entries", type=int, default=30000)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--csv-rows", type=int, default=1000)
+    parser.add_argument("--bulk-rows", type=int, default=200)
+    parser.add_argument("--ontology-terms", type=int, default=2000)
+    parser.add_argument("--only", nargs="*", help="run the scenarios starting with these names")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare p95 with results saved by --save")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p95 slowdown against the baseline")
+    args = parser.parse_args()
+
+    missing = covered_queries()
+    if missing:
+        sys.exit(f"No fake graph handler for registered queries: {', '.join(missing)}")
+
+    started = time.perf_counter()
+    graph, seed = generate_graph(args.entries, args.users, args.requests + 1)
+    print(f"seeded {len(graph.nodes)} nodes in {time.perf_counter() - started:.1f}s")
+
+    with tempfile.TemporaryDirectory() as directory:
+        ontology_path = os.path.join(directory, "ontology.nt")
+        generate_ontology(args.ontology_terms).serialize(ontology_path, format="nt")
+        results = asyncio.run(run(args, graph, seed, ontology_path))
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    failed = sum(row["errors"] for row in results.values())
+    # Type changes must leave the label ontology loads MERGE on
+    untermed = [notation for notation in seed.loaded_terms if "Term" not in graph.by_notation(notation).labels]
+    if untermed:
+        print(f"{len(untermed)} loaded terms lost their Term label, e.g. {untermed[0]}", file=sys.stderr)
+        failed += len(untermed)
+    slower = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            slower = regressions(results, json.load(f), args.tolerance)
+        for name, before, after in slower:
+            print(f"{name}: p95 {before:.2f} ms -> {after:.2f} ms", file=sys.stderr)
+    if failed or slower:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""Micro-benchmark for `extract_all_data_icd10cm` on a generated ontology.
+
+Run from the server directory:
+
+    python -m benchmarks.bench_extract --terms 50000
+"""
+import argparse
+import time
+
+import rdflib
+from rdflib.namespace import RDFS, SKOS
+
+from utils.entry_helper import extract_all_data_icd10cm
+
+def generate_ontology(terms: int) -> rdflib.Graph:
+    """Build a graph shaped like an ICD-10-CM export: labels, notation and one parent per term."""
+    graph = rdflib.Graph()
+    base = "http://purl.bioontology.org/ontology/BENCH/"
+    for i in range(terms):
+        term = rdflib.URIRef(f"{base}T{i}")
+        graph.add((term, SKOS.prefLabel, rdflib.Literal(f"Term {i}")))
+        graph.add((term, SKOS.altLabel, rdflib.Literal(f"Synonym {i}")))
+        graph.add((term, SKOS.notation, rdflib.Literal(f"T{i:07d}")))
+        graph.add((term, rdflib.URIRef("http://purl.org/dc/terms/identifier"), rdflib.Literal(f"BENCH_{i}")))
+        if i:
+            graph.add((term, RDFS.subClassOf, rdflib.URIRef(f"{base}T{(i - 1) // 10}")))
+    return graph
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--terms", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    graph = generate_ontology(args.terms)
+    triples = len(graph)
+
+    best = float("inf")
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        extract_all_data_icd10cm(graph)
+        best = min(best, time.perf_counter() - started)
+
+    print(f"{triples} triples, best of {args.repeat}: {best:.3f}s ({triples / best:,.0f} triples/s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Benchmark login password checks and authenticated token decoding.
+
+Fires `--logins` concurrent password checks at the event loop, once inline
+(how login used to verify) and once through the password executor, and
+reports logins per second plus the worst event loop stall seen by a
+heartbeat task. Then times `decode_token` with and without the verified
+token cache. No database is needed. Run from the server directory:
+
+    python -m benchmarks.bench_login --logins 64
+"""
+import argparse
+import asyncio
+import os
+import time
+
+os.environ.setdefault("SECRET_KEY", "benchmark")
+
+from utils import auth
+
+async def heartbeat(interval: float, stalls: list, stop: asyncio.Event):
+    """Record how late each tick wakes up; a blocked loop shows up as a long stall."""
+    while not stop.is_set():
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        stalls.append(time.perf_counter() - expected)
+
+async def run_logins(check, logins: int):
+    stalls, stop = [], asyncio.Event()
+    ticker = asyncio.create_task(heartbeat(0.005, stalls, stop))
+    await asyncio.sleep(0.01)
+    started = time.perf_counter()
+    results = await asyncio.gather(*(check() for _ in range(logins)), return_exceptions=True)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await ticker
+    rejected = sum(isinstance(result, Exception) for result in results)
+    return elapsed, max(stalls, default=0.0), rejected
+
+def report(label, logins, elapsed, stall, rejected):
+    print(f"{label:<24} {logins / elapsed:8.1f} logins/s   max loop stall {stall * 1e3:8.1f} ms   rejected {rejected}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--decodes", type=int, default=20000)
+    args = parser.parse_args()
+
+    password = "correct horse battery staple"
+    hashed = auth.pwd_context.hash(password)
+
+    async def inline():
+        return auth.pwd_context.verify(password, hashed)
+
+    async def executor():
+        return await auth.verify_password(password, hashed)
+
+    print(f"{auth.PASSWORD_WORKERS} password workers, {auth.MAX_PENDING_PASSWORD_CHECKS} pending checks allowed")
+    report("inline", args.logins, *asyncio.run(run_logins(inline, args.logins)))
+    report("password executor", args.logins, *asyncio.run(run_logins(executor, args.logins)))
+    auth.shutdown_password_executor()
+
+    token = auth.create_access_token({"username": "bench", "id": "4:bench:0", "exp": int(time.time()) + 3600})
+    for label, cached in (("decode (uncached)", False), ("decode (cached)", True)):
+        auth.token_cache.clear()
+        started = time.perf_counter()
+        for _ in range(args.decodes):
+            if not cached:
+                auth.token_cache.clear()
+            auth.decode_token(token)
+        elapsed = (time.perf_counter() - started) / args.decodes
+        print(f"{label:<24} {elapsed * 1e6:8.2f} us")
+
+if __name__ == "__main__":
+    main()
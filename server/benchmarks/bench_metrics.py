@@ -0,0 +1,94 @@
+"""Measure what the metrics instrumentation adds per request and per query.
+
+Calls a bare ASGI app directly, with and without MetricsMiddleware, and a
+fake driver session with and without the `run_query` wrapper, so only the
+instrumentation is timed. Exits non-zero if the per-request overhead is
+above `--max-overhead-us`, so it can gate a build. Run from the server
+directory:
+
+    python -m benchmarks.bench_metrics --requests 200000
+"""
+import argparse
+import asyncio
+import sys
+import time
+from types import SimpleNamespace
+
+from utils import metrics
+from utils.queries import register, run_query
+
+ROUTE = SimpleNamespace(path="/api/entry/{identifier}")
+START = {"type": "http.response.start", "status": 200, "headers": []}
+BODY = {"type": "http.response.body", "body": b"{}"}
+
+BENCH_QUERY = register("bench_metrics", "RETURN 1 AS n")
+
+async def endpoint(scope, receive, send):
+    # What the router does before calling the handler
+    scope["route"] = ROUTE
+    await send(START)
+    await send(BODY)
+
+async def receive():
+    return {"type": "http.request", "body": b""}
+
+async def send(message):
+    pass
+
+async def per_request(app, requests: int):
+    started = time.perf_counter()
+    for _ in range(requests):
+        await app({"type": "http", "method": "GET", "path": "/api/entry/MPO:1"}, receive, send)
+    return (time.perf_counter() - started) / requests
+
+class FakeResult:
+    records = ({"n": 1},) * 10
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def consume(self):
+        return None
+
+class FakeSession:
+    def run(self, query, parameters=None, **kwargs):
+        return FakeResult()
+
+def per_query(run, queries: int):
+    session = FakeSession()
+    started = time.perf_counter()
+    for _ in range(queries):
+        for _ in run(session):
+            pass
+    return (time.perf_counter() - started) / queries
+
+def best_of(repeat, fn, *args):
+    return min(fn(*args) for _ in range(repeat))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--max-overhead-us", type=float, default=5.0)
+    args = parser.parse_args()
+
+    bare = asyncio.run(_best_async(args.repeat, endpoint, args.requests))
+    instrumented = asyncio.run(_best_async(args.repeat, metrics.MetricsMiddleware(endpoint), args.requests))
+    request_overhead = (instrumented - bare) * 1e6
+    print(f"{'request (bare)':<28} {bare * 1e6:8.2f} us")
+    print(f"{'request (instrumented)':<28} {instrumented * 1e6:8.2f} us")
+    print(f"{'request overhead':<28} {request_overhead:8.2f} us")
+
+    plain = best_of(args.repeat, per_query, lambda session: session.run(BENCH_QUERY), args.requests)
+    timed = best_of(args.repeat, per_query, lambda session: run_query(session, BENCH_QUERY), args.requests)
+    print(f"{'query overhead (10 rows)':<28} {(timed - plain) * 1e6:8.2f} us")
+
+    if request_overhead > args.max_overhead_us:
+        print(f"request overhead above {args.max_overhead_us} us", file=sys.stderr)
+        sys.exit(1)
+
+async def _best_async(repeat, app, requests):
+    return min([await per_request(app, requests) for _ in range(repeat)])
+
+if __name__ == "__main__":
+    main()
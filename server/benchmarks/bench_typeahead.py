@@ -0,0 +1,105 @@
+"""Benchmark the local typeahead index, optionally against the fulltext index.
+
+Without `--compare`, builds the index from generated labels and reports
+query latency for prefixes and misspellings. With `--compare`, loads the
+index from the configured Neo4j database instead and also reports recall@10
+of the local results against `entityLabelIndex` plus the fulltext latency.
+Run from the server directory:
+
+    python -m benchmarks.bench_typeahead --entries 100000
+    python -m benchmarks.bench_typeahead --compare --queries 200
+"""
+import argparse
+import itertools
+import random
+import statistics
+import time
+
+from utils.typeahead import TypeaheadIndex
+
+LETTERS = "abcdefghiklmnoprstuvy"
+
+def generate_labels(entries: int, vocabulary: int = 20000, seed: int = 0):
+    """`(identifier, notation, prefLabel, altLabel)` rows of pseudo-words with Zipf-like word frequencies."""
+    rng = random.Random(seed)
+    words = ["".join(rng.choice(LETTERS) for _ in range(rng.randint(3, 11))) for _ in range(vocabulary)]
+    cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, vocabulary + 1)))
+    phrase = lambda n: " ".join(rng.choices(words, cum_weights=cum_weights, k=n))
+    return [
+        (f"BENCH:{i:07d}", None, phrase(rng.randint(1, 5)), [phrase(rng.randint(1, 3))] if rng.random() < 0.5 else None)
+        for i in range(entries)
+    ]
+
+def sample_queries(labels, count: int, seed: int = 1):
+    """Half typed prefixes, half prefixes with one character dropped."""
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        label = rng.choice(labels)
+        prefix = label[:rng.randint(3, max(3, min(len(label), 12)))]
+        if len(queries) % 2 and len(prefix) > 4:
+            drop = rng.randrange(1, len(prefix) - 1)
+            prefix = prefix[:drop] + prefix[drop + 1:]
+        queries.append(prefix)
+    return queries
+
+def latencies(search, queries):
+    times = []
+    for query in queries:
+        started = time.perf_counter()
+        search(query)
+        times.append(time.perf_counter() - started)
+    return times
+
+def report(label, times):
+    times = sorted(times)
+    p99 = times[min(len(times) - 1, int(len(times) * 0.99))]
+    print(f"{label:<24} p50 {statistics.median(times) * 1e6:10.1f} us   p99 {p99 * 1e6:10.1f} us")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--compare", action="store_true", help="use the configured Neo4j and compare with fulltext")
+    args = parser.parse_args()
+
+    index = TypeaheadIndex()
+    started = time.perf_counter()
+    if args.compare:
+        index.load()
+        labels = [name for _, name, _ in index._entries.values() if isinstance(name, str)]
+    else:
+        rows = generate_labels(args.entries)
+        index.build(rows)
+        labels = [row[2] for row in rows]
+    print(f"built {len(index)} entries in {time.perf_counter() - started:.3f}s")
+
+    queries = sample_queries(labels, args.queries)
+    local = lambda query: index.search(query, 10)
+    report("local", latencies(local, queries))
+    report("local (prefixes)", latencies(local, queries[::2]))
+    report("local (misspelled)", latencies(local, queries[1::2]))
+
+    if args.compare:
+        from database import get_neo4j_driver
+        from utils.search import SEARCH_ENTRIES
+
+        with get_neo4j_driver().session() as session:
+            def fulltext(query):
+                return [
+                    record["term_code"]
+                    for record in session.run(SEARCH_ENTRIES, query=query, excludeNodes=[], limit=10)
+                ]
+
+            report("fulltext", latencies(fulltext, queries))
+            recalls = []
+            for query in queries:
+                expected = set(fulltext(query))
+                if expected:
+                    found = {entry["code"] for entry in local(query)}
+                    recalls.append(len(expected & found) / len(expected))
+            if recalls:
+                print(f"recall@10 vs fulltext    {statistics.mean(recalls):.3f} over {len(recalls)} queries")
+
+if __name__ == "__main__":
+    main()
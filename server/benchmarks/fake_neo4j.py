@@ -0,0 +1,700 @@
+"""In-memory stand-in for the Neo4j drivers, for benchmarking the endpoints.
+
+`FakeGraph` is a small property graph: nodes with labels and properties,
+and SUBCLASS_OF edges. Queries are dispatched on the name they were
+registered under in utils.queries, and each name has a Python function that
+answers it the way the Cypher would. Queries built at runtime
+(`create_entry` and friends with a different label) are matched after
+their backticked label is swapped for the registered one. Anything else,
+such as schema commands, returns no records.
+
+`install(graph)` makes `get_neo4j_driver()` and `get_async_neo4j_driver()`
+return fake drivers over `graph`. Server timings in the summaries are 0, so
+benchmarks measure the server's own code: serialization, CSV processing,
+tree building.
+"""
+import re
+from bisect import bisect_left
+from types import SimpleNamespace
+
+import database
+from utils.query_log import UPDATE_COUNTERS
+from utils.queries import QUERIES, UNREGISTERED, query_name
+
+SUBCLASS_OF = "SUBCLASS_OF"
+_LABEL = re.compile(r"`(?:[^`]|``)+`")
+_WORD = re.compile(r"\w+")
+
+class FakeNode:
+    __slots__ = ("id", "labels", "properties")
+
+    def __init__(self, node_id, labels, properties):
+        self.id = node_id
+        self.labels = list(labels)
+        self.properties = dict(properties)
+
+    @property
+    def element_id(self):
+        return f"4:fake:{self.id}"
+
+class FakeGraph:
+    """Nodes, SUBCLASS_OF edges and the indexes the real schema would have."""
+
+    def __init__(self):
+        self.nodes = {}
+        self.parents = {}  # child id -> set of parent ids
+        self.children = {}  # parent id -> set of child ids
+        self._next_id = 0
+        self._by_identifier = {}
+        self._by_notation = {}
+        self._by_uri = {}
+        self._by_username = {}
+        self._by_norm_label = {}
+        # Derived lookups, rebuilt after writes
+        self._root_keys = None  # sorted (key, id)
+        self._roots = {}  # (prefix, after) -> [(key, node)]
+        self._users = None  # sorted (username, id)
+        self._words = None  # fulltext stand-in: word -> ids
+
+    # Writes
+
+    def add_node(self, labels, properties):
+        node = FakeNode(self._next_id, labels, properties)
+        self._next_id += 1
+        self.nodes[node.id] = node
+        self._index(node)
+        self._changed()
+        return node
+
+    def set_properties(self, node, properties, replace=False):
+        self._unindex(node)
+        if replace:
+            node.properties = dict(properties)
+        else:
+            node.properties.update(properties)
+        node.properties = {key: value for key, value in node.properties.items() if value is not None}
+        self._index(node)
+        self._changed()
+
+    def delete_node(self, node):
+        self._unindex(node)
+        del self.nodes[node.id]
+        for parent in self.parents.pop(node.id, ()):
+            self.children[parent].discard(node.id)
+        for child in self.children.pop(node.id, ()):
+            self.parents[child].discard(node.id)
+        self._changed()
+
+    def link(self, child, parent):
+        """MERGE-like: returns False if the edge already existed."""
+        parents = self.parents.setdefault(child.id, set())
+        if parent.id in parents:
+            return False
+        parents.add(parent.id)
+        self.children.setdefault(parent.id, set()).add(child.id)
+        self._changed()
+        return True
+
+    def unlink_parents(self, child):
+        removed = self.parents.pop(child.id, set())
+        for parent in removed:
+            self.children[parent].discard(child.id)
+        self._changed()
+        return len(removed)
+
+    def _index(self, node):
+        props = node.properties
+        for key, index in (
+            ("identifier", self._by_identifier), ("notation", self._by_notation),
+            ("uri", self._by_uri), ("normLabel", self._by_norm_label),
+        ):
+            # List values never equal a scalar lookup, so they are not indexed
+            if isinstance(props.get(key), (str, int)):
+                index.setdefault(props[key], []).append(node.id)
+        if "User" in node.labels and props.get("username") is not None:
+            self._by_username[props["username"]] = node.id
+
+    def _unindex(self, node):
+        props = node.properties
+        for key, index in (
+            ("identifier", self._by_identifier), ("notation", self._by_notation),
+            ("uri", self._by_uri), ("normLabel", self._by_norm_label),
+        ):
+            ids = index.get(props.get(key)) if isinstance(props.get(key), (str, int)) else None
+            if ids and node.id in ids:
+                ids.remove(node.id)
+        if isinstance(props.get("username"), str) and self._by_username.get(props["username"]) == node.id:
+            del self._by_username[props["username"]]
+
+    def _changed(self):
+        self._root_keys = None
+        self._roots = {}
+        self._users = None
+        self._words = None
+
+    # Reads
+
+    def _first(self, index, key):
+        ids = index.get(key)
+        return self.nodes[ids[0]] if ids else None
+
+    def by_identifier(self, identifier):
+        return self._first(self._by_identifier, identifier)
+
+    def by_notation(self, notation):
+        return self._first(self._by_notation, notation)
+
+    def by_uri(self, uri):
+        return self._first(self._by_uri, uri)
+
+    def user(self, username):
+        node_id = self._by_username.get(username)
+        return None if node_id is None else self.nodes[node_id]
+
+    def users(self):
+        if self._users is None:
+            self._users = sorted(self._by_username.items())
+        return self._users
+
+    def entries(self):
+        return (node for node in self.nodes.values() if "AllNodes" in node.labels)
+
+    def has_parents(self, node):
+        return bool(self.parents.get(node.id))
+
+    def has_children(self, node):
+        return bool(self.children.get(node.id))
+
+    def parents_of(self, node):
+        return [self.nodes[parent] for parent in self.parents.get(node.id, ())]
+
+    def children_of(self, node):
+        return [self.nodes[child] for child in self.children.get(node.id, ())]
+
+    def root_keys(self):
+        """Sorted `(key, id)` of every entry, keyed by notation, else identifier."""
+        if self._root_keys is None:
+            keys = []
+            for node in self.entries():
+                props = node.properties
+                # STARTS WITH is null for list values
+                if isinstance(props.get("notation"), str):
+                    keys.append((props["notation"], node.id))
+                if isinstance(props.get("identifier"), str):
+                    keys.append((props["identifier"], node.id))
+            self._root_keys = sorted(keys)
+        return self._root_keys
+
+    def words(self):
+        if self._words is None:
+            words = {}
+            for node in self.entries():
+                props = node.properties
+                for field in ("prefLabel", "altLabel", "identifier"):
+                    values = props.get(field)
+                    for value in values if isinstance(values, list) else [values]:
+                        if isinstance(value, str):
+                            for word in _WORD.findall(value.lower()):
+                                words.setdefault(word, set()).add(node.id)
+            self._words = words
+        return self._words
+
+def _counters(**counts):
+    counters = SimpleNamespace(**{name: counts.get(name, 0) for name in UPDATE_COUNTERS})
+    counters.contains_updates = any(counts.values())
+    return counters
+
+def _data_pairs(node, with_data, exclude):
+    if not with_data:
+        return None
+    return [[key, value] for key, value in node.properties.items() if key not in exclude]
+
+def _labels(label_text):
+    return label_text[1:-1].replace("``", "`")
+
+# Query handlers: (graph, params, label) -> (records, counters); `label` is the
+# entry type of queries built at runtime
+
+def _all_entry_labels(graph, params, label):
+    return [
+        {"identifier": props["identifier"], "prefLabel": props.get("prefLabel"), "altLabel": props.get("altLabel")}
+        for props in (node.properties for node in graph.entries()) if props.get("identifier") is not None
+    ], _counters()
+
+def _merge_terms(graph, params, label, update=False):
+    created = properties = 0
+    for row in params["batch"]:
+        node = graph.by_uri(row["uri"])
+        if node is None:
+            graph.add_node(["Term", "AllNodes"], {"uri": row["uri"], **row["properties"]})
+            created += 1
+            properties += len(row["properties"]) + 1
+        elif update:
+            graph.set_properties(node, row["properties"])
+            if "AllNodes" not in node.labels:
+                node.labels.append("AllNodes")
+            properties += len(row["properties"])
+    return [], _counters(nodes_created=created, properties_set=properties)
+
+def _upsert_terms(graph, params, label):
+    return _merge_terms(graph, params, label, update=True)
+
+def _term_properties(graph, params, label):
+    nodes = (graph.by_uri(uri) for uri in params["uris"])
+    return [
+        {"uri": node.properties["uri"], "properties": dict(node.properties)}
+        for node in nodes if node is not None and "Term" in node.labels
+    ], _counters()
+
+def _merge_subclass_edges(graph, params, label, create_parents=False):
+    created = nodes = 0
+    for row in params["batch"]:
+        child = graph.by_uri(row["child"])
+        parent = graph.by_uri(row["parent"])
+        if child is None:
+            continue
+        if parent is None:
+            if not create_parents:
+                continue
+            parent = graph.add_node(["Term"], {"uri": row["parent"]})
+            nodes += 1
+        created += graph.link(child, parent)
+    return [], _counters(nodes_created=nodes, relationships_created=created)
+
+def _upsert_subclass_edges(graph, params, label):
+    return _merge_subclass_edges(graph, params, label, create_parents=True)
+
+def _remove_term_placeholders(graph, params, label):
+    placeholders = [node for node in graph.nodes.values() if "Term" in node.labels and "AllNodes" not in node.labels]
+    for node in placeholders:
+        graph.delete_node(node)
+    return [], _counters(nodes_deleted=len(placeholders))
+
+def _found_parents(graph, identifiers):
+    nodes = {}
+    for identifier in identifiers:
+        for node_id in graph._by_identifier.get(identifier, ()):
+            nodes[node_id] = graph.nodes[node_id]
+    return list(nodes.values())
+
+def _create_entry(graph, params, label):
+    existing = len(graph._by_identifier.get(params["identifier"], ()))
+    parents = _found_parents(graph, params["parents"])
+    node = None
+    if existing == 0 and (not params["parents"] or parents):
+        node = graph.add_node([label, "AllNodes"], params["properties"])
+        for parent in parents:
+            graph.link(node, parent)
+    record = {"existing": existing, "parentsFound": len(parents), "e": dict(node.properties) if node else None}
+    return [record], _counters(nodes_created=int(node is not None), relationships_created=len(parents) if node else 0)
+
+def _update_entry(graph, params, label):
+    node = graph.by_identifier(params["identifier"])
+    if node is None:
+        return [], _counters()
+    parents = _found_parents(graph, params["parents"])
+    if params["parents"] and not parents:
+        # The real query's changes are rolled back when the caller raises
+        old_types = [node_label for node_label in node.labels if node_label not in ("AllNodes", "Term")]
+        return [{"e": dict(node.properties), "oldTypes": old_types, "parentsFound": 0}], _counters()
+    old_types = [node_label for node_label in node.labels if node_label not in ("AllNodes", "Term")]
+    if label not in node.labels:
+        node.labels.append(label)
+    graph.set_properties(node, params["properties"])
+    deleted = 0
+    if parents:
+        deleted = graph.unlink_parents(node)
+        for parent in parents:
+            graph.link(node, parent)
+    record = {"e": dict(node.properties), "oldTypes": old_types, "parentsFound": len(parents)}
+    return [record], _counters(properties_set=len(params["properties"]), relationships_deleted=deleted)
+
+def _remove_entry_type(graph, params, label):
+    node = graph.by_identifier(params["identifier"])
+    if node is not None and label in node.labels:
+        node.labels.remove(label)
+        return [], _counters(labels_removed=1)
+    return [], _counters()
+
+def _resolve_pref_labels(graph, params, label):
+    records = []
+    for norm_label in params["labels"]:
+        identifiers = [
+            graph.nodes[node_id].properties.get("identifier")
+            for node_id in graph._by_norm_label.get(norm_label, ())
+        ]
+        identifiers = [identifier for identifier in identifiers if identifier is not None]
+        if identifiers:
+            records.append({"label": norm_label, "identifier": identifiers[0]})
+    return records, _counters()
+
+def _resolve_alt_labels(graph, params, label):
+    wanted = set(params["labels"])
+    found = {}
+    for node in graph.entries():
+        identifier = node.properties.get("identifier")
+        if identifier is None:
+            continue
+        for alt in node.properties.get("normAltLabels") or ():
+            if alt in wanted:
+                found.setdefault(alt, identifier)
+    return [{"label": alt, "identifier": identifier} for alt, identifier in found.items()], _counters()
+
+def _hierarchy_nodes(graph, params, label):
+    return [
+        {
+            "identifier": node.properties["identifier"],
+            "notation": node.properties.get("notation"),
+            "prefLabel": node.properties.get("prefLabel"),
+            "labels": list(node.labels),
+            "data": dict(node.properties) if params.get("withData") else None,
+        }
+        for node in graph.entries() if node.properties.get("identifier") is not None
+    ], _counters()
+
+def _hierarchy_edges(graph, params, label):
+    records = []
+    for child_id, parent_ids in graph.parents.items():
+        child = graph.nodes[child_id].properties.get("identifier")
+        for parent_id in parent_ids:
+            parent = graph.nodes[parent_id].properties.get("identifier")
+            if child is not None and parent is not None:
+                records.append({"child": child, "parent": parent})
+    return records, _counters()
+
+def _roots(graph, params):
+    """`[(key, node)]` of the roots in a database, as the root queries select them."""
+    cache_key = (params["prefix"], params.get("after"))
+    if cache_key not in graph._roots:
+        graph._roots[cache_key] = list(_find_roots(graph, *cache_key))
+    return graph._roots[cache_key]
+
+def _find_roots(graph, prefix, after):
+    keys = graph.root_keys()
+    seen = set()
+    for key, node_id in keys[bisect_left(keys, (prefix,)):]:
+        if not key.startswith(prefix):
+            break
+        node = graph.nodes[node_id]
+        notation = node.properties.get("notation")
+        if key != notation and isinstance(notation, str) and notation.startswith(prefix):
+            continue  # the notation branch already has this node
+        if (after is not None and key <= after) or graph.has_parents(node) or (key, node_id) in seen:
+            continue
+        seen.add((key, node_id))
+        yield key, node
+
+def _root_entries(graph, params, label):
+    records = []
+    limit = params.get("limit")
+    exclude = set(params.get("exclude") or ())
+    for key, node in _roots(graph, params):
+        if limit is not None and len(records) >= limit:
+            break
+        records.append({
+            "prefLabel": node.properties.get("prefLabel"),
+            "notation": key,
+            "hasIncomingRelationships": graph.has_children(node),
+            "data": _data_pairs(node, params.get("withData"), exclude),
+            "nodeLabel": list(node.labels),
+        })
+    return records, _counters()
+
+def _root_count(graph, params, label):
+    return [{"total": len({key for key, _ in _roots(graph, params)})}], _counters()
+
+def _children_entries(graph, params, label):
+    exclude = set(params.get("exclude") or ())
+    records = []
+    for key in params["keys"]:
+        parents = {}
+        for index in (graph._by_identifier, graph._by_notation):
+            for node_id in index.get(key, ()):
+                parents[node_id] = graph.nodes[node_id]
+        for parent in parents.values():
+            for child in graph.children_of(parent):
+                records.append({
+                    "parentKey": key,
+                    "hasIncomingRelationships": graph.has_children(child),
+                    "nodeLabel": list(child.labels),
+                    "identifier": child.properties.get("identifier"),
+                    "prefLabel": child.properties.get("prefLabel"),
+                    "data": _data_pairs(child, params.get("withData"), exclude),
+                    "parents": [
+                        {"name": other.properties.get("prefLabel"), "code": other.properties.get("identifier")}
+                        for other in graph.parents_of(child)
+                    ],
+                })
+    return records, _counters()
+
+def _all_entry_names(graph, params, label):
+    return [
+        {"name": node.properties.get("prefLabel"), "term_code": node.properties.get("notation")}
+        for node in graph.entries()
+    ], _counters()
+
+def _typeahead_entries(graph, params, label):
+    return [
+        {
+            "identifier": node.properties.get("identifier"),
+            "notation": node.properties.get("notation"),
+            "prefLabel": node.properties.get("prefLabel"),
+            "altLabel": node.properties.get("altLabel"),
+        }
+        for node in graph.entries()
+        if node.properties.get("identifier") is not None or node.properties.get("notation") is not None
+    ], _counters()
+
+def _search_entries(graph, params, label):
+    # Word matches stand in for Lucene scoring
+    words = graph.words()
+    scores = {}
+    for word in _WORD.findall(params["query"].lower()):
+        for node_id in words.get(word, ()):
+            scores[node_id] = scores.get(node_id, 0.0) + 1.0
+    exclude = set(params["excludeNodes"])
+    records = []
+    for node_id, score in sorted(scores.items(), key=lambda item: -item[1]):
+        props = graph.nodes[node_id].properties
+        code = props.get("notation") or props.get("identifier")
+        if code is None or code in exclude:
+            continue
+        records.append({"name": props.get("prefLabel"), "term_code": code, "score": score})
+        if len(records) >= params["limit"]:
+            break
+    return records, _counters()
+
+def _user_password(graph, params, label):
+    user = graph.user(params["username"])
+    if user is None:
+        return [], _counters()
+    return [{"password": user.properties.get("password"), "id": user.element_id}], _counters()
+
+def _existing_identifiers(graph, params, label):
+    return [
+        {"identifier": identifier}
+        for identifier in params["identifiers"] if graph._by_identifier.get(identifier)
+    ], _counters()
+
+def _create_entries(graph, params, label):
+    for row in params["rows"]:
+        graph.add_node([label, "AllNodes"], row)
+    return [], _counters(nodes_created=len(params["rows"]))
+
+def _link_parents(graph, params, label):
+    created = 0
+    for link in params["links"]:
+        child, parent = graph.by_identifier(link["child"]), graph.by_identifier(link["parent"])
+        if child is not None and parent is not None:
+            created += graph.link(child, parent)
+    return [], _counters(relationships_created=created)
+
+def _entry_detail(graph, params, label):
+    node = graph.by_identifier(params["identifier"])
+    if node is None:
+        return [], _counters()
+    return [{"data": dict(node.properties), "nodeLabel": list(node.labels)}], _counters()
+
+def _create_user(graph, params, label):
+    if graph.user(params["username"]) is not None:
+        return [], _counters()
+    graph.add_node(["User"], {"username": params["username"], "password": params["password"]})
+    return [], _counters(nodes_created=1, labels_added=1, properties_set=2)
+
+def _user_by_id(graph, node_id):
+    node = graph.nodes.get(node_id)
+    return node if node is not None and "User" in node.labels else None
+
+def _get_user(graph, params, label):
+    user = _user_by_id(graph, params["id"])
+    if user is None:
+        return [], _counters()
+    return [{"id": user.id, "username": user.properties["username"]}], _counters()
+
+def _user_page(graph, params, matches):
+    records = []
+    for username, node_id in graph.users():
+        if username > params["after"] and matches(username):
+            records.append({"id": node_id, "username": username})
+            if len(records) >= params["limit"]:
+                break
+    return records, _counters()
+
+def _list_users(graph, params, label):
+    return _user_page(graph, params, lambda username: True)
+
+def _search_users_prefix(graph, params, label):
+    return _user_page(graph, params, lambda username: username.startswith(params["search"]))
+
+def _search_users_contains(graph, params, label):
+    return _user_page(graph, params, lambda username: params["search"] in username)
+
+def _delete_user(graph, params, label):
+    user = _user_by_id(graph, params["id"])
+    if user is None:
+        return [], _counters()
+    graph.delete_node(user)
+    return [], _counters(nodes_deleted=1)
+
+HANDLERS = {
+    "all_entry_labels": _all_entry_labels,
+    "merge_terms": _merge_terms,
+    "merge_subclass_edges": _merge_subclass_edges,
+    "upsert_terms": _upsert_terms,
+    "term_properties": _term_properties,
+    "upsert_subclass_edges": _upsert_subclass_edges,
+    "remove_term_placeholders": _remove_term_placeholders,
+    "create_entry": _create_entry,
+    "update_entry": _update_entry,
+    "remove_entry_type": _remove_entry_type,
+    "resolve_pref_labels": _resolve_pref_labels,
+    "resolve_alt_labels": _resolve_alt_labels,
+    "hierarchy_nodes": _hierarchy_nodes,
+    "hierarchy_edges": _hierarchy_edges,
+    "root_entries": _root_entries,
+    "root_count": _root_count,
+    "children_entries": _children_entries,
+    "all_entry_names": _all_entry_names,
+    "typeahead_entries": _typeahead_entries,
+    "search_entries": _search_entries,
+    "user_password": _user_password,
+    "existing_identifiers": _existing_identifiers,
+    "create_entries": _create_entries,
+    "link_parents": _link_parents,
+    "entry_detail": _entry_detail,
+    "create_user": _create_user,
+    "get_user": _get_user,
+    "list_users": _list_users,
+    "search_users_prefix": _search_users_prefix,
+    "search_users_contains": _search_users_contains,
+    "delete_user": _delete_user,
+}
+
+def dispatch(graph, query, parameters):
+    """`(records, counters)` for `query`, answered from `graph`."""
+    name, label = query_name(query), None
+    if name == UNREGISTERED:
+        # Built at runtime: compare with the registered text for another label
+        labels = _LABEL.findall(query)
+        if labels:
+            name = query_name(_LABEL.sub("`Species`", query))
+            label = _labels(labels[0])
+    handler = HANDLERS.get(name)
+    if handler is None:
+        return [], _counters()
+    return handler(graph, parameters or {}, label)
+
+class FakeRecord(dict):
+    """Enough of `neo4j.Record` for the server: item access, `get` and `data`."""
+
+    def data(self, *keys):
+        return {key: self[key] for key in keys} if keys else dict(self)
+
+class FakeResult:
+    def __init__(self, records, counters):
+        self._records = [FakeRecord(record) for record in records]
+        self._summary = SimpleNamespace(
+            counters=counters, result_available_after=0, result_consumed_after=0, plan=None, profile=None
+        )
+
+    def __iter__(self):
+        records, self._records = self._records, []
+        return iter(records)
+
+    def single(self, strict: bool = False):
+        records, self._records = self._records, []
+        if strict and len(records) != 1:
+            raise ValueError(f"Expected a single record, got {len(records)}")
+        return records[0] if records else None
+
+    def data(self, *keys):
+        records, self._records = self._records, []
+        return [record.data(*keys) for record in records]
+
+    def consume(self):
+        self._records = []
+        return self._summary
+
+class FakeSession:
+    """Sync session and transaction in one; writes apply immediately, there is no rollback."""
+
+    def __init__(self, graph):
+        self._graph = graph
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        pass
+
+    def run(self, query, parameters=None, **kwargs):
+        return FakeResult(*dispatch(self._graph, query, {**(parameters or {}), **kwargs}))
+
+    def execute_write(self, work, *args, **kwargs):
+        return work(self, *args, **kwargs)
+
+    execute_read = execute_write
+
+class FakeAsyncResult(FakeResult):
+    async def __aiter__(self):
+        for record in FakeResult.__iter__(self):
+            yield record
+
+    async def single(self, strict: bool = False):
+        return FakeResult.single(self, strict)
+
+    async def data(self, *keys):
+        return FakeResult.data(self, *keys)
+
+    async def consume(self):
+        return FakeResult.consume(self)
+
+class FakeAsyncSession:
+    def __init__(self, graph):
+        self._graph = graph
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        pass
+
+    async def run(self, query, parameters=None, **kwargs):
+        return FakeAsyncResult(*dispatch(self._graph, query, {**(parameters or {}), **kwargs}))
+
+    async def execute_write(self, work, *args, **kwargs):
+        return await work(self, *args, **kwargs)
+
+    execute_read = execute_write
+
+class FakeDriver:
+    def __init__(self, graph):
+        self.graph = graph
+
+    def session(self, **config):
+        return FakeSession(self.graph)
+
+    def close(self):
+        pass
+
+class FakeAsyncDriver(FakeDriver):
+    def session(self, **config):
+        return FakeAsyncSession(self.graph)
+
+    async def close(self):
+        pass
+
+def install(graph):
+    """Point the shared drivers in `database` at `graph`."""
+    database._driver = FakeDriver(graph)
+    database._async_driver = FakeAsyncDriver(graph)
+
+def covered_queries():
+    """Registered query names without a handler; empty when every shape is covered."""
+    return sorted(set(QUERIES) - set(HANDLERS))
@@ -1,16 +1,14 @@
 from fastapi import APIRouter, Form, HTTPException, status
-from passlib.context import CryptContext
 
 from utils.auth import *
 
 router = APIRouter()
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 # Login
 @router.post("/login")
 async def login(username: str = Form(...), password: str = Form(...)):
-    user_id = authenticate_user(username, password)
+    # The lookup is async and bcrypt runs on the password executor, so the event loop never blocks
+    user_id = await authenticate_user(username, password)
     if user_id:
         access_token = create_access_token({"username": username, "id": user_id})
         return {"access_token": access_token, "token_type": "bearer"}
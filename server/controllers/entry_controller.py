@@ -1,27 +1,59 @@
 # controllers/entry_controller.py
-import csv
-from io import StringIO
+import asyncio
+import time
+from io import BytesIO
 from typing import List, Optional
-from fastapi import APIRouter, Body, File, Form, HTTPException, Query, UploadFile, status, Depends
+from fastapi import APIRouter, Body, File, Form, HTTPException, Query, Request, Response, UploadFile, status, Depends
 from fastapi.security import OAuth2PasswordBearer
-from fastapi.responses import StreamingResponse
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from fastapi.concurrency import run_in_threadpool
-from concurrent.futures import ProcessPoolExecutor
+from starlette.background import BackgroundTask
+from neo4j import AsyncSession
 
-from database import get_neo4j_driver
+from database import get_async_session
 
 #Models
 from models.entry_model import DataInput, DataInputProtein
 
 #Utilities
+from utils import metrics
 from utils.auth import get_current_user
+from utils.csv_workers import UploadSlot, get_csv_executor
 from utils.entry_helper import *
+from utils.entry_import import IMPORT_BATCH_SIZE, import_entries, import_format
+from utils.entry_snapshot import get_entry_snapshot
+from utils.hierarchy import HIERARCHY_CACHE, hierarchy_index, node_type
+from utils.label_index import label_index
+from utils.queries import register, run_query_async
+from utils.search import search_cache, search_entries as find_entries
+from utils.tree_helper import (
+    INTERNAL_PROPERTIES, MAX_TREE_DEPTH, count_root_entries, expand_tree, fetch_children_entries, fetch_root_entries,
+    parse_fields, parse_include, project_entries, project_entry_data, project_properties
+)
 from utils.file_helper import *
 
 router = APIRouter()
 
+# Largest page served by /all when paginating
+ALL_ENTRIES_PAGE_LIMIT = 5000
+
+# Most labels accepted by one /resolve request
+RESOLVE_MAX_LABELS = 50000
+
+# Most root paths returned by /ancestors?all_paths=true
+MAX_ROOT_PATHS = 100
+
+# Largest page of roots served by /database/{database}
+ROOT_ENTRIES_PAGE_LIMIT = 1000
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+ENTRY_DETAIL = register("entry_detail", """
+    MATCH (e:AllNodes {identifier: $identifier})
+    RETURN properties(e) AS data, labels(e) AS nodeLabel
+    LIMIT 1
+""", params={"identifier": "MPO:0000001"})
+
 @router.post("/create")
 async def create_entry(
     data: dict = Body(...),
@@ -64,217 +96,308 @@ async def update_entry(
             detail=f"An unexpected error occurred: {str(e)}"
         )
 
+@router.post("/bulk")
+async def bulk_import_entries(
+    file: UploadFile = File(...),
+    batch_size: int = Form(IMPORT_BATCH_SIZE, ge=1),
+    current_user: dict = Depends(get_current_user)
+):
+    """Create many entries from a JSON Lines (`.jsonl`) or CSV (`.csv`) file.
+
+    Rows are validated against DataInputSpecies/DataInputProtein and written
+    `batch_size` per transaction (see utils/entry_import). Returns counts and
+    a per-row report with the error for every row that was not created.
+    """
+    try:
+        fmt = import_format(file.filename)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    report = await run_in_threadpool(import_entries, file.file, fmt, batch_size)
+    return ORJSONResponse({"status": "200", **report})
+
 @router.get("/all")
-async def get_all_entries():
+async def get_all_entries(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(default=None, ge=1, le=ALL_ENTRIES_PAGE_LIMIT),
+    session: AsyncSession = Depends(get_async_session)
+):
     """Get all existing entries from all databases.
 
     Returns names and codes of all entries. Used for Landing Page Search Bar.
+    Served from a snapshot that is only rebuilt after writes: the full list
+    honours If-None-Match and is sent pre-compressed, while `limit`/`cursor`
+    page through it in code order.
     """
     try:
-        with get_neo4j_driver().session() as session:
-            result = session.run(
-                """
-                MATCH (e)
-                RETURN e.prefLabel AS name, e.notation AS term_code
-                """
-            )
-            entries = []
-            for record in result:
-                entries.append({
-                    "name": record["name"],
-                    "code": record["term_code"]
-                })
-
-        return {"status": "200", "entries": entries}
-
+        snapshot = await get_entry_snapshot(session)
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
+    if cursor is None and limit is None:
+        encoding, body = snapshot.negotiate(request.headers.get("accept-encoding"))
+        etag = snapshot.etags[encoding]
+        headers = {"ETag": etag, "Vary": "Accept-Encoding", "Cache-Control": "no-cache"}
+        if_none_match = request.headers.get("if-none-match", "")
+        if if_none_match.strip() == "*" or etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    try:
+        entries, next_cursor = snapshot.page(cursor, limit or ALL_ENTRIES_PAGE_LIMIT)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return ORJSONResponse({"status": "200", "entries": entries, "next_cursor": next_cursor})
+
 @router.get("/search/{searchQuery}")
-async def search_entries(searchQuery: str, selectedNodes: list[str] = Query(default=[])):
+async def search_entries(
+    searchQuery: str,
+    selectedNodes: list[str] = Query(default=[]),
+    session: AsyncSession = Depends(get_async_session)
+):
     """
     Search for the 10 closest terms to the provided query in Entity nodes based on prefLabel and altLabel,
     excluding nodes with identifiers in the selectedNodes list.
+
+    Results are cached per query until the next entry write (see utils/search).
     """
     try:
-        with get_neo4j_driver().session() as session:
-            result = session.run(
-                """
-                CALL db.index.fulltext.queryNodes('entityLabelIndex', $query)
-                YIELD node, score
-                WHERE 
-                    (node.notation IS NOT NULL OR node.identifier IS NOT NULL) AND
-                    NOT COALESCE(node.notation, node.identifier) IN $excludeNodes
-                RETURN node.prefLabel AS name, 
-                       COALESCE(node.notation, node.identifier) AS term_code, 
-                       score
-                ORDER BY score DESC
-                LIMIT 10
-                """,
-                {"query": searchQuery, "excludeNodes": selectedNodes}
-            )
-
-            entries = []
-            for record in result:
-                entries.append({
-                    "name": record["name"],
-                    "code": record["term_code"],
-                    "score": record["score"]
-                })
-
+        entries = await find_entries(session, searchQuery, selectedNodes)
         return {"status": "200", "entries": entries}
 
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
+@router.get("/search_cache/stats")
+async def get_search_cache_stats():
+    """Hit/miss counters and size of the search result cache."""
+    return {"status": "200", "stats": search_cache.stats()}
+
+def _tree_children_fetcher(session: AsyncSession, with_data: bool, exclude):
+    if HIERARCHY_CACHE:
+        async def fetch(keys):
+            return {key: project_entry_data(hierarchy_index.children_entries(key), exclude) for key in keys}
+        return fetch
+    return lambda keys: fetch_children_entries(session, keys, with_data, exclude)
+
 @router.get("/database/{database}")
-async def get_root_entries(database: str):
+async def get_root_entries(
+    database: str,
+    depth: int = Query(default=1, ge=1, le=MAX_TREE_DEPTH),
+    fields: Optional[str] = None,
+    include: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(default=None, ge=1, le=ROOT_ENTRIES_PAGE_LIMIT),
+    count: bool = False,
+    session: AsyncSession = Depends(get_async_session)
+):
     """Get all entries from a given database. 
     
-    Returns it in a Tree structure processable by PrimeVue.
+    Returns it in a Tree structure processable by PrimeVue. Served from the
+    in-memory hierarchy when HIERARCHY_CACHE is enabled. `depth` > 1 also
+    returns that many levels below the roots as nested `children`, and
+    `fields` (e.g. `key,label,leaf`) trims every entry to those fields.
+    Heavy properties such as `sequence` are left out of `data` unless named
+    in `include` (or `include=*`); `GET /{identifier}` has the full entry.
+
+    Roots come in notation order. `limit` pages through them: pass the
+    returned `next_cursor` as `cursor` for the following page. `count=true`
+    adds the `total` number of roots.
     """
     try:
-        # Neo4j query to fetch entries and their parent relationships
-        query = (
-            """
-            MATCH (e)
-            WHERE (e.notation STARTS WITH $database + ":" OR e.identifier STARTS WITH $database + ":") AND 
-                NOT((e)-[]->())
-            RETURN e.prefLabel AS prefLabel, 
-                COALESCE(e.notation, e.identifier) AS notation,
-                EXISTS(()-[]->(e)) AS hasIncomingRelationships,
-                e AS data,
-                labels(e) AS nodeLabel
-            """
-        )
+        selected_fields = parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    with_data = selected_fields is None or "data" in selected_fields
+    exclude = parse_include(include)
+
+    try:
+        if HIERARCHY_CACHE:
+            if not hierarchy_index.ready:
+                await run_in_threadpool(hierarchy_index.ensure_loaded)
+            root_entries = hierarchy_index.root_entries(database, cursor, None if limit is None else limit + 1)
+            has_more = limit is not None and len(root_entries) > limit
+            root_entries = project_entry_data(root_entries[:limit], exclude)
+            total = hierarchy_index.root_count(database) if count else None
+        else:
+            root_entries, has_more = await fetch_root_entries(session, database, with_data, exclude, cursor, limit)
+            total = await count_root_entries(session, database) if count else None
+
+        response = {"status": "200"}
+        if limit is not None:
+            response["next_cursor"] = root_entries[-1]["key"] if has_more else None
+        if count:
+            response["total"] = total
 
-        # Execute query
-        with get_neo4j_driver().session() as session:
-            result = session.run(query, database=database)
-            entry_dict = {}
-
-            for record in result:
-                entry = record["data"]
-                pref_label = record["prefLabel"]
-                notation = record["notation"]
-                has_incoming_relationships = record["hasIncomingRelationships"]
-                node_type = record["nodeLabel"]
-                
-                # Create entry data
-                entry_data = {
-                    "key": notation,
-                    "label": pref_label,
-                    "data": entry,
-                    "leaf": not has_incoming_relationships,
-                    "loading": True,
-                    "nodeType": node_type[1] if node_type[0] == "AllNodes" else node_type[0]
-                }
-                
-                # Store entry data
-                entry_dict[notation] = entry_data
-
-            root_entries = list(entry_dict.values())
-
-        return {"status": "200", "entries": root_entries}
+        await expand_tree(root_entries, depth, _tree_children_fetcher(session, with_data, exclude))
+        response["entries"] = project_entries(root_entries, selected_fields)
+        return response
 
     except Exception as e:
         # Handle exceptions, log error, and return an error response
         return {"status": "500", "error": str(e)}
 
 @router.get("/database/{node_notation}/children")
-async def get_children(node_notation: str):
-    """Get all children of the given node where a SUBCLASS_OF relationship exists."""
-    query = """
-        MATCH (child)-[:SUBCLASS_OF]->(parent)
-        WHERE (parent.identifier = $node_notation OR parent.notation = $node_notation)
-        WITH child, labels(child) AS nodeLabel
-        MATCH (child)-[:SUBCLASS_OF]->(allParents)
-        RETURN 
-            EXISTS(()-[]->(child)) AS hasIncomingRelationships,
-            nodeLabel AS nodeLabel,
-            child AS data,
-            collect({ name: allParents.prefLabel, code: allParents.identifier }) AS parents
+async def get_children(
+    node_notation: str,
+    depth: int = Query(default=1, ge=1, le=MAX_TREE_DEPTH),
+    fields: Optional[str] = None,
+    include: Optional[str] = None,
+    session: AsyncSession = Depends(get_async_session)
+):
+    """Get all children of the given node where a SUBCLASS_OF relationship exists.
+
+    `depth`, `fields` and `include` work as for `/database/{database}`.
     """
-    with get_neo4j_driver().session() as session:
-        result = session.run(query, node_notation=node_notation)
-
-        children_entries = [
-            {
-                "key": record["data"]["identifier"],
-                "label": record["data"]["prefLabel"],
-                "data": record["data"],
-                "leaf": not record["hasIncomingRelationships"],
-                "loading": True,
-                "nodeType": record["nodeLabel"][1] if record["nodeLabel"][0] == "AllNodes" else record["nodeLabel"][0],
-                "parents": record["parents"]
-            }
-            for record in result
-        ]
-        return {"status": "200", "entries": children_entries}
-
-@router.on_event("shutdown")
-async def shutdown_event():
-    get_neo4j_driver().close()
+    try:
+        selected_fields = parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    with_data = selected_fields is None or "data" in selected_fields
+
+    if HIERARCHY_CACHE and not hierarchy_index.ready:
+        await run_in_threadpool(hierarchy_index.ensure_loaded)
+    fetch_children = _tree_children_fetcher(session, with_data, parse_include(include))
+
+    children_entries = (await fetch_children([node_notation]))[node_notation]
+    await expand_tree(children_entries, depth, fetch_children)
+    return {"status": "200", "entries": project_entries(children_entries, selected_fields)}
+
+async def _stream_in_executor(chunks, slot: UploadSlot):
+    """Drive a blocking chunk generator on the CSV pool, releasing `slot` when done."""
+    executor = get_csv_executor()
+    pending = None
+    try:
+        while True:
+            pending = executor.submit(next, chunks, None)
+            chunk = await asyncio.wrap_future(pending)
+            if chunk is None:
+                break
+            yield chunk
+    finally:
+        # No await in here: when the client disconnects the stream is
+        # cancelled, and an await would stop it before the slot is released
+        slot.release()
+        if pending is not None and not pending.done():
+            # A worker is still inside `next(chunks)`; it closes them once that returns
+            pending.add_done_callback(lambda _: chunks.close())
+        else:
+            chunks.close()
 
 @router.post("/uploadfile/")
 async def upload_file(file: UploadFile = File(...)):
     """
-    Upload a CSV file, process it in parallel, and return the updated content as a CSV file.
+    Upload a CSV file, standardize its cells, and stream the updated content back as a CSV file.
+
+    At most MAX_CONCURRENT_UPLOADS uploads are processed at once; others wait
+    briefly for a slot and then get a 503.
     """
-    try:
-        content = await file.read()
-        csv_data = StringIO(content.decode("utf-8"))
-        csv_reader = csv.reader(csv_data)
-        
-        updated_csv = StringIO()
-        csv_writer = csv.writer(updated_csv)
-        
-        header = next(csv_reader)
-        csv_writer.writerow(header)
-
-        # Parallel Processing
-        with ProcessPoolExecutor() as executor:
-            updated_rows = list(executor.map(process_row, csv_reader))
-        
-        for row in updated_rows:
-            csv_writer.writerow(row)
-        
-        updated_csv.seek(0)
-        
-        return StreamingResponse(
-            updated_csv,
-            media_type="text/csv",
-            headers={"Content-Disposition": f"attachment; filename={file.filename.rsplit('.', 1)[0]}_standardized.csv"}
+    slot = UploadSlot()
+    if not await slot.acquire():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many uploads in progress, try again shortly",
+            headers={"Retry-After": "5"}
         )
+
+    try:
+        # Load (or refresh) the label dictionary, then every distinct cell is a dict lookup
+        await asyncio.get_running_loop().run_in_executor(get_csv_executor(), label_index.ensure_loaded)
     except Exception as e:
+        slot.release()
         return {"message": str(e)}
+
+    # FastAPI closes uploaded files when the handler returns, before a streamed
+    # body is sent, so take over the spooled upload and let the stream close it.
+    source, file.file = file.file, BytesIO()
+    return StreamingResponse(
+        _stream_in_executor(iter_standardized_csv(source), slot),
+        media_type="text/csv",
+        headers={"Content-Disposition": f"attachment; filename={file.filename.rsplit('.', 1)[0]}_standardized.csv"},
+        # Covers a response that is never iterated; no-op once the stream released it
+        background=BackgroundTask(slot.release)
+    )
     
+@router.post("/resolve")
+async def resolve_entry_labels(labels: list[str] = Body(..., embed=True, max_length=RESOLVE_MAX_LABELS)):
+    """Resolve labels (prefLabel or altLabel, case-insensitive) to identifiers in bulk.
+
+    Returns `{label: identifier}` with null for labels that did not match.
+    """
+    try:
+        results = await run_in_threadpool(resolve_labels, labels)
+        return {"status": "200", "results": results}
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
 @router.get("/database/{node_notation}/ancestors")
-async def get_ancestors(node_notation: str):
+async def get_ancestors(node_notation: str, all_paths: bool = False):
+    """Get the ancestors of a node, from its root down to its parent.
+
+    Served from the in-memory hierarchy index along the shortest root path.
+    `all_paths` also returns every root path (capped at MAX_ROOT_PATHS).
+    """
     try:
-        query = """
-            MATCH path = (startNode {identifier: $node_notation})-[:SUBCLASS_OF*]->(ancestor)
-            WHERE NOT (ancestor)-[:SUBCLASS_OF]->()
-            WITH [node IN reverse(nodes(path)) | COALESCE(node.notation, node.identifier)] AS ancestors
-            RETURN collect(DISTINCT ancestors) AS unique_ancestors
-            """
-        with get_neo4j_driver().session() as session:
-            result = session.run(query, node_notation=node_notation)
-            record = result.single()
-
-            unique_ancestors = record["unique_ancestors"][0]
-            unique_ancestors = [ancestor for ancestor in unique_ancestors if ancestor != node_notation]
-
-            return {"ancestors": unique_ancestors}
+        if not hierarchy_index.ready:
+            await run_in_threadpool(hierarchy_index.ensure_loaded)
+
+        ancestors = hierarchy_index.ancestors(node_notation)
+        if ancestors is None:
+            return {"message": f"No entry with identifier {node_notation}"}
+
+        response = {"ancestors": ancestors, "depth": hierarchy_index.depth(node_notation)}
+        if all_paths:
+            response["paths"] = hierarchy_index.root_paths(node_notation, MAX_ROOT_PATHS)
+        return response
     except Exception as e:
         return {"message": str(e)}
     
 @router.post("/load_ontology")
-async def load_ontology(file_path: str = Form(...)):
+async def load_ontology(
+    file_path: str = Form(...),
+    batch_size: int = Form(ONTOLOGY_BATCH_SIZE),
+    stream: bool = Form(False),
+    resume: bool = Form(True),
+    ontology: str = Form(DEFAULT_ONTOLOGY)
+):
+    """Load an ontology file into Neo4j.
+
+    With `stream`, N-Triples/Turtle files are parsed and written chunk by
+    chunk in bounded memory, resuming from the last checkpoint when `resume`.
+    `ontology` selects the property rewriting rules in utils/ontology_rules.
+    """
     try:
-        rdf_graph = parse_ttl(file_path)
-        triples = extract_all_data_icd10cm(rdf_graph)
-        create_nodes(triples)
-        return {"message": "Ontology loaded successfully"}
-    except:
-        return {"message": file_path}
\ No newline at end of file
+        if stream:
+            stats = await run_in_threadpool(load_ontology_stream, file_path, batch_size, resume, ontology)
+            return {"message": "Ontology loaded successfully", "stats": stats}
+
+        started = time.perf_counter()
+        rdf_graph = await run_in_threadpool(parse_ttl, file_path)
+        triples = await run_in_threadpool(extract_all_data_icd10cm, rdf_graph, ontology)
+        stats = await run_in_threadpool(create_nodes, triples, batch_size)
+        metrics.ONTOLOGY_TRIPLES.inc(len(rdf_graph))
+        metrics.ONTOLOGY_SECONDS.inc(time.perf_counter() - started)
+        return {"message": "Ontology loaded successfully", "stats": stats}
+    except Exception as e:
+        return {"message": file_path, "error": str(e)}
+
+# Keep last: matches any single path segment not claimed by the routes above
+@router.get("/{identifier}")
+async def get_entry(identifier: str, session: AsyncSession = Depends(get_async_session)):
+    """Get one entry with all of its properties, for detail views of lean tree/search results."""
+    result = await run_query_async(session, ENTRY_DETAIL, identifier=identifier)
+    record = await result.single()
+    if not record:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Identifier not found")
+    return {
+        "status": "200",
+        "entry": {
+            "key": identifier,
+            "label": record["data"].get("prefLabel"),
+            "data": project_properties(record["data"], INTERNAL_PROPERTIES),
+            "nodeType": node_type(record["nodeLabel"])
+        }
+    }
@@ -1,108 +1,156 @@
-from fastapi import APIRouter, HTTPException, status, Request, Depends
-from passlib.context import CryptContext
-from database import get_neo4j_driver
+from typing import Literal, Optional
+from fastapi import APIRouter, HTTPException, status, Request, Depends, Query
+from neo4j import AsyncSession
+from database import get_async_session
 from controllers.auth_controller import get_current_user
+from utils.auth import hash_password
+from utils.queries import WRITE, register, run_query_async
 
 router = APIRouter()
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Page size for /getall and /search when no limit is given, and the largest allowed
+USER_PAGE_SIZE = 100
+USER_PAGE_LIMIT = 1000
+
+# Usernames are unique, so MERGE both checks for and creates the user in one step
+CREATE_USER = register("create_user", """
+    MERGE (u:User {username: $username})
+    ON CREATE SET u.password = $password
+""", kind=WRITE, params={"username": "alice", "password": "hash"})
+
+GET_USER = register("get_user", """
+    MATCH (u:User) WHERE id(u) = $id
+    RETURN id(u) AS id, u.username AS username
+""", params={"id": 0})
+
+# Pages walk the username index in order; `after` is the last username of the previous page
+LIST_USERS = register("list_users", """
+    MATCH (u:User)
+    WHERE u.username > $after
+    RETURN id(u) AS id, u.username AS username
+    ORDER BY u.username
+    LIMIT $limit
+""", params={"after": "", "limit": USER_PAGE_SIZE})
+
+SEARCH_USERS_PREFIX = register("search_users_prefix", """
+    MATCH (u:User)
+    WHERE u.username STARTS WITH $search AND u.username > $after
+    RETURN id(u) AS id, u.username AS username
+    ORDER BY u.username
+    LIMIT $limit
+""", params={"search": "al", "after": "", "limit": USER_PAGE_SIZE})
+
+# Served by the `user_username_text` text index
+SEARCH_USERS_CONTAINS = register("search_users_contains", """
+    MATCH (u:User)
+    WHERE u.username CONTAINS $search AND u.username > $after
+    RETURN id(u) AS id, u.username AS username
+    ORDER BY u.username
+    LIMIT $limit
+""", params={"search": "li", "after": "", "limit": USER_PAGE_SIZE})
+
+DELETE_USER = register("delete_user", """
+    MATCH (u:User) WHERE id(u) = $id
+    DELETE u
+""", kind=WRITE, params={"id": 0})
+
+async def _user_page(session: AsyncSession, query: str, limit: int, **params):
+    """Run a paged user query; returns `{"users", "next_cursor"}`."""
+    result = await run_query_async(session, query, limit=limit, **params)
+    users = [{"id": record["id"], "username": record["username"]} async for record in result]
+    next_cursor = users[-1]["username"] if len(users) == limit else None
+    return {"users": users, "next_cursor": next_cursor}
 
 # Create user
 @router.post("/create")
-async def create_user(request: Request):
+async def create_user(request: Request, session: AsyncSession = Depends(get_async_session)):
     form_data = await request.form()
     username = form_data.get("username")
     password = form_data.get("password")
+    if not username or not password:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Username and password are required")
 
-    with get_neo4j_driver().session() as session:
-        # Check if user already exists
-        result = session.run("MATCH (u:User {username: $username}) RETURN u", username=username)
-        if result.single():
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User already exists")
-
-        # Hash the password
-        hashed_password = pwd_context.hash(password)
+    # Hash the password (bcrypt is CPU bound, keep it off the event loop)
+    hashed_password = await hash_password(password)
 
-        # Create user node in Neo4j
-        session.run(
-            "CREATE (u:User {username: $username, password: $password})",
-            username=username,
-            password=hashed_password,
-        )
+    # Create user node in Neo4j, unless the username is taken
+    result = await run_query_async(session, CREATE_USER, username=username, password=hashed_password)
+    summary = await result.consume()
+    if not summary.counters.nodes_created:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User already exists")
 
     return {"status": 200, "user": [username, password]}
 
 # GET one user
 @router.get("/getone")
-async def get_user(request: Request, current_user: dict = Depends(get_current_user)):
-    form_data = await request.form()
-    user_id = form_data.get("id")
-    try:
-        user_id = int(user_id)
-    except:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User ID is required")
-        
-    with get_neo4j_driver().session() as session:
-        result = session.run("MATCH (u:User) WHERE id(u) = $id RETURN u.id AS id, u.username AS username", id=user_id)
-        record = result.single()
-        if not record:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-        
-        user = {
-            "id": record["id"],
-            "username": record["username"],
-        }
+async def get_user(
+    id: int = Query(...),
+    current_user: dict = Depends(get_current_user),
+    session: AsyncSession = Depends(get_async_session)
+):
+    result = await run_query_async(session, GET_USER, id=id)
+    record = await result.single()
+    if not record:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+
+    user = {
+        "id": record["id"],
+        "username": record["username"],
+    }
 
     return user
 
 # GET all users
 @router.get("/getall")
-async def get_all_users(current_user: dict = Depends(get_current_user)):
-    with get_neo4j_driver().session() as session:
-        result = session.run("MATCH (u:User) RETURN id(u) AS id, u.username AS username")
-        users = []
-        for record in result:
-            users.append({
-                "id": record["id"],
-                "username": record["username"],
-            })
-    return users
+async def get_all_users(
+    cursor: Optional[str] = None,
+    limit: int = Query(default=USER_PAGE_SIZE, ge=1, le=USER_PAGE_LIMIT),
+    current_user: dict = Depends(get_current_user),
+    session: AsyncSession = Depends(get_async_session)
+):
+    """List users in username order, one page at a time.
+
+    Pass the returned `next_cursor` as `cursor` for the following page; it is
+    None on the last page.
+    """
+    return await _user_page(session, LIST_USERS, limit, after=cursor or "")
 
 # User Searchbar backend
 @router.get("/search")
-async def search_users(request: Request, current_user: dict = Depends(get_current_user)):
-    form_data = await request.form()
-    search_query = form_data.get("search")
-
-    with get_neo4j_driver().session() as session:
-        result = session.run(
-            "MATCH (u:User) WHERE u.username CONTAINS $search_query RETURN id(u) AS id, u.username AS username", search_query=search_query
-        )
-        users = []
-        for record in result:
-            users.append({
-                "id": record["id"],
-                "username": record["username"],
-            })
+async def search_users(
+    search: str = Query(..., min_length=1),
+    match: Literal["contains", "prefix"] = "contains",
+    cursor: Optional[str] = None,
+    limit: int = Query(default=USER_PAGE_SIZE, ge=1, le=USER_PAGE_LIMIT),
+    current_user: dict = Depends(get_current_user),
+    session: AsyncSession = Depends(get_async_session)
+):
+    """Find users whose username contains `search` (or starts with it, with `match=prefix`).
 
-    return users
+    Paged like `/getall`.
+    """
+    query = SEARCH_USERS_PREFIX if match == "prefix" else SEARCH_USERS_CONTAINS
+    return await _user_page(session, query, limit, search=search, after=cursor or "")
 
 # Delete User
 @router.delete("/delete")
-async def delete_user(request: Request, current_user: dict = Depends(get_current_user)):
+async def delete_user(
+    request: Request,
+    current_user: dict = Depends(get_current_user),
+    session: AsyncSession = Depends(get_async_session)
+):
     form_data = await request.form()
     user_id = form_data.get("id")
-    
+
     try:
         user_id = int(user_id)
     except:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User ID is required")
-    
-    with get_neo4j_driver().session() as session:
-        result = session.run("MATCH (u:User) WHERE id(u) = $id RETURN u", id=user_id)
-        if not result.single():
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-        
-        session.run("MATCH (u:User) WHERE id(u) = $id DELETE u", id=user_id)
+
+    # One statement: the counters say whether there was a user to delete
+    result = await run_query_async(session, DELETE_USER, id=user_id)
+    summary = await result.consume()
+    if not summary.counters.nodes_deleted:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
 
     return {"message": "User deleted successfully"}
@@ -1,9 +1,11 @@
 # database.py
 
 import os
+import threading
 from dotenv import load_dotenv
-from neo4j import GraphDatabase
-import sys
+from neo4j import AsyncGraphDatabase, GraphDatabase
+
+from utils.metrics import time_connection_acquisition
 
 # Load environment variables from .env file
 load_dotenv()
@@ -13,7 +15,61 @@ USER = os.getenv("NEO4J_USER")
 PASSWORD = os.getenv("NEO4J_PASSWORD")
 AUTH = (USER, PASSWORD)
 
-def get_neo4j_driver():
+# Connection pool settings, shared by the sync and async drivers
+MAX_POOL_SIZE = int(os.getenv("NEO4J_MAX_POOL_SIZE", "50"))
+ACQUISITION_TIMEOUT = float(os.getenv("NEO4J_ACQUISITION_TIMEOUT", "30"))
+LIVENESS_CHECK_TIMEOUT = float(os.getenv("NEO4J_LIVENESS_CHECK_TIMEOUT", "30"))
+MAX_CONNECTION_LIFETIME = float(os.getenv("NEO4J_MAX_CONNECTION_LIFETIME", "3600"))
+
+_driver = None
+_async_driver = None
+_driver_lock = threading.Lock()
+
+def _driver_config():
     if not URI or not USER or not PASSWORD:
         raise ValueError("One or more environment variables are not set: NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD")
-    return GraphDatabase.driver(URI, auth=AUTH)
\ No newline at end of file
+    return {
+        "auth": AUTH,
+        "max_connection_pool_size": MAX_POOL_SIZE,
+        "connection_acquisition_timeout": ACQUISITION_TIMEOUT,
+        "liveness_check_timeout": LIVENESS_CHECK_TIMEOUT,
+        "max_connection_lifetime": MAX_CONNECTION_LIFETIME,
+    }
+
+def get_neo4j_driver():
+    """Get the process-wide synchronous driver.
+
+    The driver owns a connection pool and is created once, on first use or by
+    the application lifespan. Callers must not close it.
+    """
+    global _driver
+    if _driver is None:
+        with _driver_lock:
+            if _driver is None:
+                _driver = time_connection_acquisition(GraphDatabase.driver(URI, **_driver_config()), "sync")
+    return _driver
+
+def get_async_neo4j_driver():
+    """Get the process-wide async driver used by the `async def` handlers."""
+    global _async_driver
+    if _async_driver is None:
+        with _driver_lock:
+            if _async_driver is None:
+                _async_driver = time_connection_acquisition(AsyncGraphDatabase.driver(URI, **_driver_config()), "async")
+    return _async_driver
+
+async def get_async_session():
+    """FastAPI dependency yielding a session borrowed from the shared async pool."""
+    async with get_async_neo4j_driver().session() as session:
+        yield session
+
+async def close_neo4j_drivers():
+    """Close both drivers and their pools. Called on application shutdown."""
+    global _driver, _async_driver
+    with _driver_lock:
+        driver, async_driver = _driver, _async_driver
+        _driver = _async_driver = None
+    if driver is not None:
+        driver.close()
+    if async_driver is not None:
+        await async_driver.close()
@@ -1,11 +1,41 @@
+import logging
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 
+from database import close_neo4j_drivers, get_async_neo4j_driver, get_neo4j_driver
+from utils import metrics, schema
+from utils.auth import get_password_executor, shutdown_password_executor
+from utils.csv_workers import get_csv_executor, shutdown_csv_executor
+from utils.query_log import shutdown_profile_executor
 from controllers.auth_controller import router as auth_router
 from controllers.user_controller import router as user_router
 from controllers.entry_controller import router as entry_router
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled driver per process for the lifetime of the app
+    get_neo4j_driver()
+    get_async_neo4j_driver()
+    get_csv_executor()
+    get_password_executor()
+    try:
+        await run_in_threadpool(schema.migrate)
+    except Exception:
+        # Keep serving; the schema can be fixed with `python -m utils.schema`
+        logger.exception("Schema migration failed")
+    yield
+    shutdown_csv_executor()
+    shutdown_password_executor()
+    shutdown_profile_executor()
+    await close_neo4j_drivers()
+
+app = FastAPI(lifespan=lifespan)
 
 # TODO remove once you setup on a proper server
 app.add_middleware(
@@ -16,6 +46,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if metrics.METRICS_ENABLED:
+    # Outermost, so the latency covers every other middleware
+    app.add_middleware(metrics.MetricsMiddleware)
+
+    @app.get("/metrics", include_in_schema=False)
+    def get_metrics():
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 app.include_router(auth_router, prefix="/api")
 app.include_router(user_router, prefix="/api/user")
 app.include_router(entry_router, prefix="/api/entry")
\ No newline at end of file
@@ -1,9 +1,15 @@
+import asyncio
 import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from jose import jwt
 from jose.exceptions import JWTError, ExpiredSignatureError
 from passlib.context import CryptContext
-from database import get_neo4j_driver
+from database import get_async_neo4j_driver
 from fastapi import Depends, HTTPException, Header, status
+from utils.queries import register, run_query_async
 
 # Initialize password context
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -12,6 +18,106 @@ SECRET_KEY = os.getenv("SECRET_KEY")
 if not SECRET_KEY:
     raise ValueError("SECRET_KEY environment variable not set")
 
+# bcrypt is CPU bound; a few dedicated threads keep login bursts from taking every core
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", "2"))
+# Hashes queued or running at once; further logins wait, then get a 503
+MAX_PENDING_PASSWORD_CHECKS = int(os.getenv("MAX_PENDING_PASSWORD_CHECKS", "16"))
+PASSWORD_QUEUE_TIMEOUT = float(os.getenv("PASSWORD_QUEUE_TIMEOUT", "5"))
+
+# Verified tokens remembered so repeat requests skip the JWT decode
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "4096"))
+
+USER_PASSWORD = register("user_password", """
+    MATCH (u:User {username: $username})
+    RETURN u.password AS password, elementId(u) AS id
+""", params={"username": "alice"})
+
+_password_executor = None
+_password_slots = asyncio.Semaphore(MAX_PENDING_PASSWORD_CHECKS)
+
+def get_password_executor():
+    """The shared password hashing executor, created on first use or by the app lifespan."""
+    global _password_executor
+    if _password_executor is None:
+        _password_executor = ThreadPoolExecutor(max_workers=PASSWORD_WORKERS, thread_name_prefix="password-worker")
+    return _password_executor
+
+def shutdown_password_executor():
+    global _password_executor
+    if _password_executor is not None:
+        _password_executor.shutdown(wait=False, cancel_futures=True)
+        _password_executor = None
+
+async def _run_password_job(fn, *args):
+    """Run `fn` on the password executor, or raise 503 if the queue stays full."""
+    try:
+        await asyncio.wait_for(_password_slots.acquire(), PASSWORD_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many logins in progress, try again shortly",
+            headers={"Retry-After": str(max(1, int(PASSWORD_QUEUE_TIMEOUT)))},
+        )
+    try:
+        return await asyncio.get_running_loop().run_in_executor(get_password_executor(), fn, *args)
+    finally:
+        _password_slots.release()
+
+async def hash_password(password: str):
+    """Hash a password off the event loop."""
+    return await _run_password_job(pwd_context.hash, password)
+
+async def verify_password(password: str, hashed: str):
+    """Check a password against its hash off the event loop."""
+    return await _run_password_job(pwd_context.verify, password, hashed)
+
+class TokenCache:
+    """LRU of verified tokens, keyed by signature.
+
+    An entry is only served for the exact header and payload it was verified
+    with, and only until the token's `exp` claim passes.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str):
+        signing_input, _, signature = token.rpartition(".")
+        with self._lock:
+            entry = self._entries.get(signature)
+            if entry is None:
+                return None
+            cached_input, claims, expires = entry
+            if cached_input != signing_input:
+                return None
+            if expires is not None and expires <= time.time():
+                del self._entries[signature]
+                return None
+            self._entries.move_to_end(signature)
+            return claims
+
+    def put(self, token: str, claims: dict):
+        if self.maxsize <= 0:
+            return
+        signing_input, _, signature = token.rpartition(".")
+        expires = claims.get("exp")
+        with self._lock:
+            self._entries[signature] = (signing_input, claims, expires)
+            self._entries.move_to_end(signature)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+token_cache = TokenCache(TOKEN_CACHE_SIZE)
+
 def get_token(authorization: str = Header(...)):
     """Get session token"""
     if not authorization or not authorization.startswith("Bearer "):
@@ -22,27 +128,27 @@ def get_token(authorization: str = Header(...)):
 # Decode and validate token
 def decode_token(token: str):
     """Decode token for authorization"""
+    decoded_token = token_cache.get(token)
+    if decoded_token is not None:
+        return decoded_token
     try:
         decoded_token = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-        return decoded_token
     except ExpiredSignatureError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token has expired")
     except JWTError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+    token_cache.put(token, decoded_token)
+    return decoded_token
 
 # Authenticate user credentials
-def authenticate_user(username: str, password: str):
+async def authenticate_user(username: str, password: str):
     """Check if given credentials are correct."""
-    with get_neo4j_driver().session() as session:
-        result = session.run(
-            "MATCH (u:User {username: $username}) RETURN u.password AS password, elementId(u) AS id",
-            username=username,
-        )
-        record = result.single()
-        if record and pwd_context.verify(password, record["password"]):
-            return record["id"]
-        else:
-            return None
+    async with get_async_neo4j_driver().session() as session:
+        result = await run_query_async(session, USER_PASSWORD, username=username)
+        record = await result.single()
+    if record and await verify_password(password, record["password"]):
+        return record["id"]
+    return None
 
 def create_access_token(data: dict):
     """Create access token for session"""
@@ -0,0 +1,51 @@
+"""Long-lived worker pool for CSV standardization.
+
+Uploads used to fork a fresh process pool each. Standardization is now
+I/O bound (label resolution) plus light CSV work, so a fixed thread pool
+created at startup serves every upload, and a semaphore caps how many
+uploads run at once.
+"""
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+CSV_WORKERS = int(os.getenv("CSV_WORKERS", "4"))
+MAX_CONCURRENT_UPLOADS = int(os.getenv("MAX_CONCURRENT_UPLOADS", "2"))
+# Seconds an upload waits for a free slot before getting a 503
+UPLOAD_QUEUE_TIMEOUT = float(os.getenv("UPLOAD_QUEUE_TIMEOUT", "10"))
+
+_executor = None
+_upload_slots = asyncio.Semaphore(MAX_CONCURRENT_UPLOADS)
+
+def get_csv_executor():
+    """The shared CSV executor, created on first use or by the app lifespan."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=CSV_WORKERS, thread_name_prefix="csv-worker")
+    return _executor
+
+def shutdown_csv_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+class UploadSlot:
+    """One of the MAX_CONCURRENT_UPLOADS slots. `release` is idempotent."""
+
+    def __init__(self):
+        self._held = False
+
+    async def acquire(self):
+        """Wait up to UPLOAD_QUEUE_TIMEOUT for a slot; returns False if none freed up."""
+        try:
+            await asyncio.wait_for(_upload_slots.acquire(), UPLOAD_QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            return False
+        self._held = True
+        return True
+
+    def release(self):
+        if self._held:
+            self._held = False
+            _upload_slots.release()
@@ -0,0 +1,105 @@
+"""Change notifications for entry writes.
+
+In-process caches derived from the graph register a listener here, and the
+write paths call `entries_changed` once their transaction has committed.
+Every call bumps a generation counter that caches can compare against.
+`LazyIndex` is the shared base of the in-process indexes kept this way.
+"""
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_generation = 0
+_listeners = []
+_lock = threading.Lock()
+
+def generation():
+    """Current write generation; changes whenever an entry is written."""
+    return _generation
+
+def add_listener(callback):
+    """Call `callback(change)` after every write (see `entries_changed`)."""
+    _listeners.append(callback)
+
+def entries_changed(change: dict = None):
+    """Record a committed write and notify listeners.
+
+    `change` describes a single entry write as
+    `{"identifier", "data", "parents", "typeOfEntry"}`, where `parents` is
+    None if the parent links were left alone. Pass None after bulk loads;
+    listeners should then treat everything as stale.
+    """
+    global _generation
+    with _lock:
+        _generation += 1
+    for callback in _listeners:
+        try:
+            callback(change)
+        except Exception:
+            # A broken cache must not fail the write that already committed
+            logger.exception("Entry change listener %r failed", callback)
+
+def as_list(value):
+    """A property value as a list: [] for None, `[value]` for a single value."""
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+def identifier_values(value):
+    """Distinct string values of an identifier or notation.
+
+    Loaded terms hold a list when several predicates map to the property
+    (mpo's skos:notation and dc:identifier both become `identifier`).
+    """
+    return [item for item in dict.fromkeys(as_list(value)) if isinstance(item, str)]
+
+class LazyIndex:
+    """In-process index derived from the graph, kept in sync through entry events.
+
+    Built from the graph on first use, patched when a single entry is written
+    and rebuilt after bulk loads. Subclasses implement `load` (rebuild from
+    the graph) and `patch` (apply one entry write); register `apply_change`
+    with `add_listener`.
+    """
+
+    def __init__(self):
+        self._stale = True
+        self._lock = threading.RLock()
+
+    @property
+    def ready(self):
+        """True once built and not invalidated by a bulk load."""
+        return not self._stale
+
+    def load(self):
+        raise NotImplementedError
+
+    def patch(self, identifier, change):
+        """Apply a single entry write (see `entries_changed`), holding the lock."""
+        raise NotImplementedError
+
+    def ensure_loaded(self):
+        """Load the index if it was never built or a bulk load made it stale."""
+        if not self._stale:
+            return
+        with self._lock:
+            if not self._stale:
+                return
+            loaded_at = generation()
+            self.load()
+            # A write that landed during the load may be missing from what it
+            # read (and was not patched in, being stale); reload next time
+            if generation() == loaded_at:
+                self._stale = False
+
+    def apply_change(self, change):
+        """`entries_changed` listener: patch one entry in place, or mark stale after bulk loads."""
+        if change is None:
+            self._stale = True
+            return
+        identifier = change.get("identifier")
+        if not identifier or self._stale:
+            return
+        with self._lock:
+            self.patch(identifier, change)
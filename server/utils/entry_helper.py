@@ -1,345 +1,570 @@
+import json
+import logging
+import os
 import re
+import time
 from fastapi import HTTPException, status
 import rdflib
 from database import get_neo4j_driver
 from collections import defaultdict
 
 from models.entry_model import DataInputSpecies, DataInputProtein
+from utils import metrics
+from utils.entry_events import as_list, entries_changed
+from utils.label_index import label_index, normalize_label, normalized_label_properties
+from utils.ontology_rules import DEFAULT_ONTOLOGY, PredicateResolver
+from utils.queries import WRITE, register, run_query
+from utils.rdf_stream import iter_chunk_graphs
+from utils.schema import ensure_schema
 
-def create_nodes(nodes):
-    relations_to_create = []
+logger = logging.getLogger(__name__)
+
+# Rows per UNWIND batch when loading ontologies
+ONTOLOGY_BATCH_SIZE = int(os.getenv("ONTOLOGY_BATCH_SIZE", "5000"))
+
+def _batches(items, batch_size):
+    """Yield successive lists of at most `batch_size` items."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+_TERM_ROWS = {"batch": [{"uri": "http://example.org/term", "properties": {"prefLabel": "term"}}]}
+_EDGE_ROWS = {"batch": [{"child": "http://example.org/child", "parent": "http://example.org/parent"}]}
+
+MERGE_TERMS = register("merge_terms", """
+    UNWIND $batch AS row
+    MERGE (entity:Term {uri: row.uri})
+    ON CREATE SET entity:AllNodes, entity += row.properties
+""", WRITE, _TERM_ROWS)
+
+MERGE_SUBCLASS_EDGES = register("merge_subclass_edges", """
+    UNWIND $batch AS row
+    MATCH (child:Term {uri: row.child})
+    MATCH (parent:Term {uri: row.parent})
+    MERGE (child)-[:SUBCLASS_OF]->(parent)
+""", WRITE, _EDGE_ROWS)
+
+UPSERT_TERMS = register("upsert_terms", """
+    UNWIND $batch AS row
+    MERGE (entity:Term {uri: row.uri})
+    SET entity:AllNodes, entity += row.properties
+""", WRITE, _TERM_ROWS)
+
+# A subject's triples may be spread over several chunks of a streamed load
+TERM_PROPERTIES = register("term_properties", """
+    UNWIND $uris AS uri
+    MATCH (entity:Term {uri: uri})
+    RETURN entity.uri AS uri, properties(entity) AS properties
+""", params={"uris": ["http://example.org/term"]})
+
+# Streaming variant: a parent may only show up in a later chunk, so edges
+# MERGE a placeholder Term that the parent's own record fills in later. It
+# only joins AllNodes (and so the entry listings) once UPSERT_TERMS fills it.
+UPSERT_SUBCLASS_EDGES = register("upsert_subclass_edges", """
+    UNWIND $batch AS row
+    MATCH (child:Term {uri: row.child})
+    MERGE (parent:Term {uri: row.parent})
+    MERGE (child)-[:SUBCLASS_OF]->(parent)
+""", WRITE, _EDGE_ROWS)
+
+# Placeholders for parents the file never described, dropped once a streamed
+# load finishes, as the batch loader never links to such parents
+REMOVE_TERM_PLACEHOLDERS = register("remove_term_placeholders", """
+    MATCH (placeholder:Term)
+    WHERE NOT placeholder:AllNodes
+    DETACH DELETE placeholder
+""", WRITE, scans=True)
+
+def _merge_terms(tx, batch):
+    run_query(tx, MERGE_TERMS, batch=batch).consume()
+
+def _merge_subclass_edges(tx, batch):
+    run_query(tx, MERGE_SUBCLASS_EDGES, batch=batch).consume()
+
+def _merge_term_properties(existing, properties):
+    """A term's `existing` properties merged with newly read ones.
+
+    Values from both are kept, without repeats, so a subject read in pieces
+    keeps every altLabel; reloading the same file changes nothing. The
+    normalized lookup properties are recomputed from the merged labels.
+    """
+    merged = {}
+    for key, value in properties.items():
+        if key in ("normLabel", "normAltLabels"):
+            continue
+        values = list(dict.fromkeys(as_list(existing.get(key)) + as_list(value)))
+        merged[key] = values if len(values) > 1 else values[0]
+    labels = {**existing, **merged}
+    merged.update(normalized_label_properties(labels.get("prefLabel"), labels.get("altLabel")))
+    return merged
+
+def _upsert_term_chunk(tx, node_rows, edge_rows):
+    result = run_query(tx, TERM_PROPERTIES, uris=[row["uri"] for row in node_rows])
+    existing = {record["uri"]: record["properties"] for record in result}
+    if existing:
+        node_rows = [
+            {"uri": row["uri"], "properties": _merge_term_properties(existing[row["uri"]], row["properties"])}
+            if row["uri"] in existing else row
+            for row in node_rows
+        ]
+    run_query(tx, UPSERT_TERMS, batch=node_rows).consume()
+    run_query(tx, UPSERT_SUBCLASS_EDGES, batch=edge_rows).consume()
+
+def _remove_term_placeholders(tx):
+    return run_query(tx, REMOVE_TERM_PLACEHOLDERS).consume().counters.nodes_deleted
+
+def _term_rows(nodes):
+    """Turn extracted nodes into UNWIND rows for terms and subClassOf edges."""
+    node_rows = []
+    edge_rows = []
+    for node_uri, data in nodes.items():
+        properties = {}
+        for key, values in data["properties"].items():
+            if key != "subClassOf":
+                # Several predicates may map to one property with the same value
+                values = list(dict.fromkeys(values))
+                properties[key] = values if len(values) > 1 else values[0]
+        properties.update(normalized_label_properties(properties.get("prefLabel"), properties.get("altLabel")))
+        node_rows.append({"uri": node_uri, "properties": properties})
+
+        if "subClassOf" in data["properties"]:
+            for superclass_uri in data["properties"]["subClassOf"]:
+                edge_rows.append({"child": node_uri, "parent": superclass_uri})
+    return node_rows, edge_rows
+
+def create_nodes(nodes, batch_size: int = ONTOLOGY_BATCH_SIZE):
+    """Write extracted ontology terms and their subClassOf edges to Neo4j.
+
+    Nodes and then edges are sent in `UNWIND $batch` chunks of `batch_size`
+    rows, each chunk in its own write transaction. Returns load statistics.
+    """
+    node_rows, relations_to_create = _term_rows(nodes)
+
+    started = time.perf_counter()
+    try:
+        with get_neo4j_driver().session() as session:
+            # Term.uri must be unique (and therefore indexed) so MERGE/MATCH by uri is a seek
+            ensure_schema(session)
+
+            for batch in _batches(node_rows, batch_size):
+                session.execute_write(_merge_terms, batch)
+            nodes_done = time.perf_counter()
+
+            # Edges go last so both endpoints already exist
+            for batch in _batches(relations_to_create, batch_size):
+                session.execute_write(_merge_subclass_edges, batch)
+    finally:
+        # Even a partially failed load has changed the graph
+        entries_changed()
+    finished = time.perf_counter()
+
+    node_seconds = nodes_done - started
+    edge_seconds = finished - nodes_done
+    stats = {
+        "nodes": len(node_rows),
+        "edges": len(relations_to_create),
+        "seconds": round(finished - started, 3),
+        "nodes_per_second": round(len(node_rows) / node_seconds, 1) if node_seconds else None,
+        "edges_per_second": round(len(relations_to_create) / edge_seconds, 1) if edge_seconds else None,
+    }
+    logger.info("Ontology load finished: %s", stats)
+    return stats
+
+def _checkpoint_path(file_path):
+    return file_path + ".checkpoint"
+
+def _file_version(file_path):
+    """Size and modification time, to tell whether a checkpoint was taken on this version of the file."""
+    stat = os.stat(file_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+def _read_checkpoint(file_path):
+    try:
+        with open(_checkpoint_path(file_path)) as f:
+            checkpoint = json.load(f)
+    except FileNotFoundError:
+        return None
+    if checkpoint.get("file") != _file_version(file_path):
+        # Its offset would point into different content
+        logger.warning("Ignoring the checkpoint of %s: the file changed after it was written", file_path)
+        return None
+    return checkpoint
+
+def _write_checkpoint(file_path, checkpoint):
+    # Write-then-rename so a crash never leaves a truncated checkpoint
+    tmp_path = _checkpoint_path(file_path) + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, _checkpoint_path(file_path))
+
+def load_ontology_stream(
+    file_path: str,
+    batch_size: int = ONTOLOGY_BATCH_SIZE,
+    resume: bool = True,
+    ontology: str = DEFAULT_ONTOLOGY
+):
+    """Stream an N-Triples/Turtle ontology into Neo4j without loading it whole.
+
+    The file is parsed in chunks of about `batch_size` subjects; each chunk is
+    written in one transaction and then checkpointed to `<file>.checkpoint`
+    as a byte offset. With `resume`, a failed load continues from the last
+    committed chunk, unless the file has changed since. Values are added to
+    what a term already holds rather than replacing it, since a subject's
+    triples may arrive over several chunks. Parents the file references but
+    never describes are unlinked at the end. Returns load statistics.
+    """
+    checkpoint = _read_checkpoint(file_path) if resume else None
+    if not checkpoint:
+        checkpoint = {"offset": 0, "nodes": 0, "edges": 0, "file": _file_version(file_path)}
+    start_offset = checkpoint["offset"]
+    total_bytes = os.path.getsize(file_path)
+
+    resolver = PredicateResolver(ontology)
+    started = time.perf_counter()
+    nodes_loaded = edges_loaded = 0
+    try:
+        with get_neo4j_driver().session() as session:
+            ensure_schema(session)
+
+            chunk_started = time.perf_counter()
+            for end_offset, graph in iter_chunk_graphs(file_path, start_offset, batch_size):
+                node_rows, edge_rows = _term_rows(extract_all_data_icd10cm(graph, resolver=resolver))
+                session.execute_write(_upsert_term_chunk, node_rows, edge_rows)
+                chunk_finished = time.perf_counter()
+                metrics.ONTOLOGY_TRIPLES.inc(len(graph))
+                metrics.ONTOLOGY_SECONDS.inc(chunk_finished - chunk_started)
+                chunk_started = chunk_finished
+
+                nodes_loaded += len(node_rows)
+                edges_loaded += len(edge_rows)
+                checkpoint = {
+                    **checkpoint,
+                    "offset": end_offset,
+                    "nodes": checkpoint["nodes"] + len(node_rows),
+                    "edges": checkpoint["edges"] + len(edge_rows),
+                }
+                _write_checkpoint(file_path, checkpoint)
+
+                elapsed = time.perf_counter() - started
+                logger.info(
+                    "Ontology stream %s: %.1f%% (%d nodes, %d edges, %.0f nodes/s)",
+                    file_path, 100 * end_offset / total_bytes if total_bytes else 100,
+                    checkpoint["nodes"], checkpoint["edges"], nodes_loaded / elapsed if elapsed else 0
+                )
+
+            unresolved_parents = session.execute_write(_remove_term_placeholders)
+    finally:
+        # Even a partially failed load has changed the graph
+        entries_changed()
+
+    # Finished cleanly, the next load starts from scratch
+    try:
+        os.remove(_checkpoint_path(file_path))
+    except FileNotFoundError:
+        pass
+
+    seconds = time.perf_counter() - started
+    stats = {
+        "nodes": checkpoint["nodes"],
+        "edges": checkpoint["edges"],
+        "unresolved_parents": unresolved_parents,
+        "resumed_from_offset": start_offset,
+        "seconds": round(seconds, 3),
+        "nodes_per_second": round(nodes_loaded / seconds, 1) if seconds else None,
+        "edges_per_second": round(edges_loaded / seconds, 1) if seconds else None,
+    }
+    logger.info("Ontology stream finished: %s", stats)
+    return stats
+
+def _type_label(type_of_entry: str):
+    """Backtick-quote an entry type for use as a node label."""
+    if not type_of_entry:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="`typeOfEntry` is required")
+    return "`" + type_of_entry.replace("`", "``") + "`"
+
+def _create_entry_query(type_label: str):
+    # Nothing is written unless the identifier is free and, when parents are
+    # given, at least one of them exists; the caller tells which from the counts.
+    return f"""
+    OPTIONAL MATCH (existing:AllNodes {{identifier: $identifier}})
+    WITH count(existing) AS existing
+    OPTIONAL MATCH (p:AllNodes)
+    WHERE p.identifier IN $parents
+    WITH existing, collect(DISTINCT p) AS parentNodes
+    CALL {{
+        WITH existing, parentNodes
+        WITH parentNodes
+        WHERE existing = 0 AND (size($parents) = 0 OR size(parentNodes) > 0)
+        CREATE (e:{type_label}:AllNodes $properties)
+        WITH e, parentNodes
+        CALL {{
+            WITH e, parentNodes
+            UNWIND parentNodes AS p
+            CREATE (e)-[:SUBCLASS_OF]->(p)
+        }}
+        RETURN collect(e) AS created
+    }}
+    RETURN existing, size(parentNodes) AS parentsFound, head(created) AS e
+    """
+
+def _update_entry_query(type_label: str):
+    # Parent links are only replaced when new parents are given and found.
+    # oldTypes leaves out AllNodes and the Term label ontology loads MERGE on,
+    # so a type change never removes them.
+    return f"""
+    MATCH (e:AllNodes {{identifier: $identifier}})
+    WITH e, [label IN labels(e) WHERE NOT label IN ["AllNodes", "Term"]] AS oldTypes
+    SET e:{type_label}, e += $properties
+    WITH e, oldTypes
+    OPTIONAL MATCH (p:AllNodes)
+    WHERE p.identifier IN $parents
+    WITH e, oldTypes, collect(DISTINCT p) AS parentNodes
+    CALL {{
+        WITH e, parentNodes
+        WITH e, parentNodes, [(e)-[r:SUBCLASS_OF]->() | r] AS oldLinks
+        WHERE size(parentNodes) > 0
+        FOREACH (r IN oldLinks | DELETE r)
+        WITH e, parentNodes
+        UNWIND parentNodes AS p
+        CREATE (e)-[:SUBCLASS_OF]->(p)
+    }}
+    RETURN e, oldTypes, size(parentNodes) AS parentsFound
+    """
+
+def _remove_type_query(type_label: str):
+    return f"MATCH (e:AllNodes {{identifier: $identifier}}) REMOVE e:{type_label}"
+
+_ENTRY_SAMPLE = {
+    "identifier": "MPO:0000002",
+    "parents": ["MPO:0000001"],
+    "properties": {"identifier": "MPO:0000002", "prefLabel": "entry"},
+}
+register("create_entry", _create_entry_query(_type_label("Species")), WRITE, _ENTRY_SAMPLE)
+register("update_entry", _update_entry_query(_type_label("Species")), WRITE, _ENTRY_SAMPLE)
+register("remove_entry_type", _remove_type_query(_type_label("Species")), WRITE, {"identifier": "MPO:0000002"})
+
+def _create_entry_tx(tx, type_label, identifier, parents, properties):
+    record = run_query(
+        tx,
+        _create_entry_query(type_label),
+        name="create_entry",
+        identifier=identifier,
+        parents=parents,
+        properties=properties
+    ).single()
+    if record["existing"]:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Identifier already exists")
+    if parents and not record["parentsFound"]:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"None of the specified parents were found in Species, Strain, or Serotype"
+        )
+    if record["e"] is None:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to create entry")
+    return record["e"]
+
+def _update_entry_tx(tx, type_label, type_of_entry, identifier, parents, properties):
+    record = run_query(
+        tx,
+        _update_entry_query(type_label),
+        name="update_entry",
+        identifier=identifier,
+        parents=parents,
+        properties=properties
+    ).single()
+    if not record:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Identifier not found")
+    if parents and not record["parentsFound"]:
+        # Raising rolls back the property and label changes as well
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"None of the specified parents were found in Species, Strain, or Serotype"
+        )
+
+    # Ensure we only work with the first type label if the node has multiple
+    current_label = record["oldTypes"][0] if record["oldTypes"] else None
+    if current_label and current_label != type_of_entry:
+        # Only a type change needs this second statement, in the same transaction
+        run_query(
+            tx,
+            _remove_type_query(_type_label(current_label)),
+            name="remove_entry_type",
+            identifier=identifier
+        ).consume()
+    return record["e"]
 
-    with get_neo4j_driver().session() as session:
-        for node_uri, data in nodes.items():
-            properties = {k: v if len(v) > 1 else v[0] for k, v in data["properties"].items() if k != "subClassOf"}
-
-            # Create or update the node
-            session.run(
-                """
-                MERGE (entity:Term {uri: $uri})
-                ON CREATE SET entity += $properties
-                """,
-                uri=node_uri,
-                properties=properties
-            )
-
-            if "subClassOf" in data["properties"]:
-                for superclass_uri in data["properties"]["subClassOf"]:
-                    relations_to_create.append((node_uri, superclass_uri))
-
-    # Now create the stored relationships
-    with get_neo4j_driver().session() as session:
-        for node_uri, superclass_uri in relations_to_create:
-            session.run(
-                """
-                MATCH (child {uri: $child_uri}), (parent {uri: $parent_uri})
-                MERGE (child)-[:SUBCLASS_OF]->(parent)
-                """,
-                child_uri=node_uri,
-                parent_uri=superclass_uri
-            )
-    
 def create_entry_helper(data: dict, parents: list[str], typeOfEntry: str):
-    """Create entry for Neo4j database and link to parent (Species, Strain, or Serotype) as SUBCLASS_OF"""
-    
-    with get_neo4j_driver().session() as session:
-        identifier = data['identifier']
-        if not identifier:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="`identifier` is required in data"
-            )
-
-        # Check if the identifier already exists
-        result = session.run(
-            "MATCH (e {identifier: $identifier}) RETURN e",
-            identifier=data["identifier"]
+    """Create entry for Neo4j database and link to parent (Species, Strain, or Serotype) as SUBCLASS_OF
+
+    The checks, the node and its parent links are written in one transaction
+    (one query), retried by the driver on transient errors.
+    """
+    identifier = data.get('identifier')
+    if not identifier:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="`identifier` is required in data"
         )
-        if result.single():
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Identifier already exists")
-
-        # Search for the parent nodes (can be Species, Strain, or Serotype)
-        if not parents:
-            parent_nodes = []
-        else:
-            parent_query = session.run(
-                """
-                MATCH (p) 
-                WHERE p.identifier IN $parents
-                RETURN p
-                """,
-                parents=parents
-            )
-            parent_nodes = parent_query.values("p")
-
-            # If all parent nodes don't exist, raise an error
-            if not parent_nodes:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"None of the specified parents were found in Species, Strain, or Serotype"
-                )
-        
-
-        # Create the new node entry
-        properties = ", ".join(f"{key}: ${key}" for key in data.keys())
-        result = session.run(
-            f"""
-            CREATE (e:{typeOfEntry} {{ {properties} }})
-            RETURN e
-            """,
-            **data
+    parents = parents or []
+
+    # Stored with the lookup properties so the entry is resolvable and searchable right away
+    properties = {**data, **normalized_label_properties(data.get("prefLabel"), data.get("altLabel"))}
+    with get_neo4j_driver().session() as session:
+        created_node = session.execute_write(
+            _create_entry_tx, _type_label(typeOfEntry), identifier, parents, properties
         )
-        created_entry = result.single()
-
-        if not created_entry:
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to create entry")
-        created_node = created_entry["e"]
-
-        # Process parent relationships
-        for parent in parents:
-            session.run(
-                """
-                MATCH (e), (p)
-                WHERE e.identifier = $identifier AND p.identifier = $parent
-                CREATE (e)-[:SUBCLASS_OF]->(p)
-                """,
-                identifier=identifier,
-                parent=parent
-            )
-
-        # Update stuff for searching
-        try:
-            session.run("DROP INDEX entityLabelIndex IF EXISTS;")
-            session.run(
-                """
-                MATCH (n)
-                WHERE NOT 'AllNodes' IN labels(n) AND NOT 'User' IN labels(n)
-                SET n:AllNodes
-                """
-            )
-            session.run(
-                """
-                CREATE FULLTEXT INDEX entityLabelIndex FOR (n:AllNodes)
-                ON EACH [n.prefLabel, n.altLabel, n.identifier];
-                """
-            )
-        except Exception as e:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Failed to run maintenance commands: {str(e)}"
-            )
-        
-        return {
-            "status": "success",
-            "code": 200,
-            "message": "Entry created successfully",
-            "data": {
-                "created_node": {
-                    "properties": created_node,  # Includes all dynamic properties of the node
-                },
-                "relationships": {
-                    "type": "SUBCLASS_OF",
-                    "parents": parents if parents else "No parents linked"
-                }
+
+    entries_changed({"identifier": identifier, "data": data, "parents": parents, "typeOfEntry": typeOfEntry})
+
+    return {
+        "status": "success",
+        "code": 200,
+        "message": "Entry created successfully",
+        "data": {
+            "created_node": {
+                "properties": created_node,  # Includes all dynamic properties of the node
+            },
+            "relationships": {
+                "type": "SUBCLASS_OF",
+                "parents": parents if parents else "No parents linked"
             }
         }
+    }
 
 def update_entry_helper(data: dict, parents: list[str], typeOfEntry: str):
-    """Update entry for Neo4j database, change node type if necessary, and link to parent (Species, Strain, or Serotype) as SUBCLASS_OF"""
-    
-    with get_neo4j_driver().session() as session:
-        identifier = data['identifier']
-        if not identifier:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="`identifier` is required in data"
-            )
-
-        # Check if the identifier exists
-        result = session.run(
-            """
-            MATCH (e {identifier: $identifier}) 
-            RETURN e AS e, labels(e) AS oldTypeOfEntry
-            """,
-            identifier=identifier
+    """Update entry for Neo4j database, change node type if necessary, and link to parent (Species, Strain, or Serotype) as SUBCLASS_OF
+
+    Properties, type label and parent links change together in one
+    transaction, retried by the driver on transient errors.
+    """
+    identifier = data.get('identifier')
+    if not identifier:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="`identifier` is required in data"
         )
-        entry = result.single()
-        if not entry:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Identifier not found")
-
-        old_labels = entry["oldTypeOfEntry"]
-
-        # Ensure we only work with the first label if the node has multiple
-        current_label = old_labels[0] if old_labels else None
-
-        
-        # If typeOfEntry has changed, update the node's label
-        if current_label != typeOfEntry:
-            query = f"""
-                MATCH (e {{identifier: $identifier}})
-                REMOVE e:`{current_label}`
-                SET e:`{typeOfEntry}`
-            """
-            session.run(query, identifier=identifier)
-
-        # Prepare the SET clause to update the node's properties
-        update_properties = ", ".join(f"e.{key} = ${key}" for key in data.keys())
-        
-        # Update the existing node with new properties
-        result = session.run(
-            f"""
-            MATCH (e {{identifier: $identifier}})
-            SET {update_properties}
-            RETURN e
-            """,
-            **data
+    parents = parents or []
+
+    # Lookup properties are refreshed only for the labels being sent
+    properties = dict(data)
+    norm_properties = normalized_label_properties(data.get("prefLabel"), data.get("altLabel"))
+    if "prefLabel" in data:
+        properties["normLabel"] = norm_properties["normLabel"]
+    if "altLabel" in data:
+        properties["normAltLabels"] = norm_properties["normAltLabels"]
+
+    with get_neo4j_driver().session() as session:
+        updated_node = session.execute_write(
+            _update_entry_tx, _type_label(typeOfEntry), typeOfEntry, identifier, parents, properties
         )
-        updated_entry = result.single()
-
-        if not updated_entry:
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to update entry")
-        updated_node = updated_entry["e"]
-
-        # Update parent relationships if provided
-        if parents:
-            # Remove old parent relationships first
-            session.run(
-                """
-                MATCH (e)-[r:SUBCLASS_OF]->(p)
-                WHERE e.identifier = $identifier
-                DELETE r
-                """,
-                identifier=identifier
-            )
-
-            # Process new parent relationships
-            parent_query = session.run(
-                """
-                MATCH (p) 
-                WHERE p.identifier IN $parents
-                RETURN p
-                """,
-                parents=parents
-            )
-            parent_nodes = parent_query.values("p")
-
-            # If any of the parent nodes don't exist, raise an error
-            if not parent_nodes:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"None of the specified parents were found in Species, Strain, or Serotype"
-                )
 
-            # Create new parent relationships
-            for parent in parents:
-                session.run(
-                    """
-                    MATCH (e), (p)
-                    WHERE e.identifier = $identifier AND p.identifier = $parent
-                    CREATE (e)-[:SUBCLASS_OF]->(p)
-                    """,
-                    identifier=identifier,
-                    parent=parent
-                )
+    entries_changed({
+        "identifier": identifier,
+        "data": data,
+        "parents": parents if parents else None,
+        "typeOfEntry": typeOfEntry
+    })
 
-        # Update stuff for searching
-        try:
-            session.run("DROP INDEX entityLabelIndex IF EXISTS;")
-            session.run(
-                """
-                MATCH (n)
-                WHERE NOT 'AllNodes' IN labels(n) AND NOT 'User' IN labels(n)
-                SET n:AllNodes
-                """
-            )
-            session.run(
-                """
-                CREATE FULLTEXT INDEX entityLabelIndex FOR (n:AllNodes)
-                ON EACH [n.prefLabel, n.altLabel, n.identifier];
-                """
-            )
-        except Exception as e:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Failed to run maintenance commands: {str(e)}"
-            )
-        
-        return {
-            "status": "success",
-            "code": 200,
-            "message": "Entry updated successfully",
-            "data": {
-                "updated_node": {
-                    "properties": updated_node,  # Includes all dynamic properties of the node
-                },
-                "relationships": {
-                    "type": "SUBCLASS_OF",
-                    "parents": parents if parents else "No parents linked"
-                }
+    return {
+        "status": "success",
+        "code": 200,
+        "message": "Entry updated successfully",
+        "data": {
+            "updated_node": {
+                "properties": updated_node,  # Includes all dynamic properties of the node
+            },
+            "relationships": {
+                "type": "SUBCLASS_OF",
+                "parents": parents if parents else "No parents linked"
             }
         }
+    }
 
 
 def query_icd10cm_neo4j(label):
     """
     Get the standardized notation of a label or alternate label within an ontology.
+
+    Served from the in-memory label index; call `label_index.ensure_loaded()` first.
     """
-    try:
-        with get_neo4j_driver().session() as session:
-            result = session.run(
-                """
-                MATCH (n)
-                WHERE toLower(n.prefLabel) = toLower($label) OR 
-                    ANY(altLabel IN n.altLabel WHERE toLower(altLabel) = toLower($label))
-                RETURN n.identifier AS notation
-                """,
-                label=label
-            )
-            record = result.single()
-            if record:
-                return record["notation"]
-            else:
-                return None
-    except Exception as e:
-        return {"status": "500", "error": str(e)}
-    
+    return label_index.lookup(label)
+
+# Labels per UNWIND query when resolving against the graph
+RESOLVE_BATCH_SIZE = int(os.getenv("RESOLVE_BATCH_SIZE", "1000"))
+
+RESOLVE_PREF_LABELS = register("resolve_pref_labels", """
+    UNWIND $labels AS label
+    MATCH (n:AllNodes {normLabel: label})
+    WHERE n.identifier IS NOT NULL
+    RETURN label, head(collect(n.identifier)) AS identifier
+""", params={"labels": ["abnormal phenotype"]})
+
+# altLabels are lists and cannot be index-served; one scan covers every miss
+RESOLVE_ALT_LABELS = register("resolve_alt_labels", """
+    MATCH (n:AllNodes)
+    WHERE n.identifier IS NOT NULL AND any(alt IN n.normAltLabels WHERE alt IN $labels)
+    UNWIND [alt IN n.normAltLabels WHERE alt IN $labels] AS label
+    RETURN label, head(collect(n.identifier)) AS identifier
+""", params={"labels": ["abnormal phenotype"]}, scans=True)
+
+def _resolve_in_graph(keys):
+    """Resolve normalized labels with batched UNWIND queries: prefLabels, then altLabels."""
+    resolved = {}
+    with get_neo4j_driver().session() as session:
+        for batch in _batches(keys, RESOLVE_BATCH_SIZE):
+            result = run_query(session, RESOLVE_PREF_LABELS, labels=batch)
+            resolved.update((record["label"], record["identifier"]) for record in result)
+
+        # Labels without a prefLabel match; one scan covers every miss
+        misses = [key for key in keys if key not in resolved]
+        for batch in _batches(misses, RESOLVE_BATCH_SIZE):
+            result = run_query(session, RESOLVE_ALT_LABELS, labels=batch)
+            resolved.update((record["label"], record["identifier"]) for record in result)
+    return resolved
+
+def resolve_labels(labels):
+    """Resolve many labels to identifiers at once.
+
+    Labels are normalized and de-duplicated first. Uses the in-memory label
+    index when it is loaded, otherwise a few batched graph queries. Returns
+    `{label: identifier or None}` for every distinct input label.
+    """
+    distinct = {label: normalize_label(label) for label in labels}
+    keys = list({key for key in distinct.values() if key})
+
+    if label_index.ready:
+        resolved = {key: label_index.lookup(key) for key in keys}
+    else:
+        resolved = _resolve_in_graph(keys)
+    return {label: resolved.get(key) for label, key in distinct.items()}
+
 def parse_ttl(file_path):
     g = rdflib.Graph()
     g.parse(file_path, format=rdflib.util.guess_format(file_path))
     return g
 
 # Extract all data from the RDF graph
-def extract_all_data_icd10cm(graph):
+def extract_all_data_icd10cm(graph, ontology: str = DEFAULT_ONTOLOGY, resolver: PredicateResolver = None):
+    """Group the triples of `graph` by subject, applying the ontology's property rules.
+
+    Pass a shared `resolver` to keep its predicate cache across several graphs.
+    """
     nodes = defaultdict(lambda: {"uri": None, "properties": defaultdict(list)})
-    prefixes = {
-        "skos": "http://www.w3.org/2004/02/skos/core#",
-        "owl": "http://www.w3.org/2002/07/owl#",
-        "rdfs": "http://www.w3.org/2000/01/rdf-schema#",
-        "xsd": "http://www.w3.org/2001/XMLSchema#",
-        "umls": "http://bioportal.bioontology.org/ontologies/umls/",
-        "dc": "http://purl.org/dc/elements/1.1/",
-        "dcterms": "http://purl.org/dc/terms/",
-        "rdf": "http://www.w3.org/1999/02/22-rdf-syntax-ns#",
-        "rdfs": "http://www.w3.org/2000/01/rdf-schema#",
-        "sio": "http://semanticscience.org/ontology/sio.owl#"
-    }
+    resolve = (resolver or PredicateResolver(ontology)).resolve
     for s, p, o in graph:
         s_str = str(s)
-        
+        node = nodes[s_str]
+
         # Ensure that each subject is added once
-        if nodes[s_str]["uri"] is None:
-            nodes[s_str]["uri"] = s_str
-        for prefix_key, prefix_uri in prefixes.items():
-            if str(p).startswith(prefix_uri):
-                predicate = str(p).replace(prefix_uri, "")
-                break
-        else:
-            predicate = str(p)
-        
-        if predicate == "notation":
-            nodes[s_str]["properties"]['identifier'].append("MPO:"+str(o))
-        elif predicate == "identifier":
-            nodes[s_str]["properties"][predicate].append(str(o).replace('_', ':', 1))
-        else:
-            nodes[s_str]["properties"][predicate].append(str(o))
-    return nodes
\ No newline at end of file
+        if node["uri"] is None:
+            node["uri"] = s_str
+
+        predicate, transform = resolve(p)
+        value = str(o)
+        node["properties"][predicate].append(transform(value) if transform else value)
+    return nodes
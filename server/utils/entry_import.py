@@ -0,0 +1,257 @@
+"""Bulk import of typed entries (Species, Strain, Serotype, Protein).
+
+Rows come from a JSON Lines or CSV stream and are validated against the
+request models. Valid rows are written in batches, each batch in one
+transaction: an existence check, one `UNWIND ... CREATE` per entry type and
+one `UNWIND` for all parent links. Every row gets a line in the report.
+
+JSON Lines rows have the same shape as a `/create` body:
+
+    {"typeOfEntry": "Strain", "data": {"identifier": ..., ...}, "parents": [...]}
+
+CSV files have `typeOfEntry` and `parents` columns, every other column is a
+data field; list fields (`parents`, `altLabel`, `refs`) are `|` separated.
+"""
+import csv
+import io
+import logging
+import os
+import time
+
+import orjson
+from pydantic import ValidationError
+
+from database import get_neo4j_driver
+from models.entry_model import DataInputProtein, DataInputSpecies
+from utils.entry_events import entries_changed
+from utils.label_index import normalized_label_properties
+from utils.queries import WRITE, register, run_query
+
+logger = logging.getLogger(__name__)
+
+# Rows per write transaction
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+
+# Request model each entry type is validated against
+ENTRY_MODELS = {
+    "Species": DataInputSpecies,
+    "Strain": DataInputSpecies,
+    "Serotype": DataInputSpecies,
+    "Protein": DataInputProtein,
+}
+
+IMPORT_FORMATS = {".jsonl": "jsonl", ".ndjson": "jsonl", ".csv": "csv"}
+
+# CSV cells holding lists
+LIST_SEPARATOR = "|"
+LIST_FIELDS = ("parents", "altLabel", "refs")
+
+def import_format(filename: str):
+    """Import format for a file name. Raises ValueError for unsupported extensions."""
+    extension = os.path.splitext(filename or "")[1].lower()
+    if extension not in IMPORT_FORMATS:
+        raise ValueError(f"Unsupported file type {extension!r}; expected one of {', '.join(IMPORT_FORMATS)}")
+    return IMPORT_FORMATS[extension]
+
+def _csv_record(row):
+    fields = {}
+    for key, value in row.items():
+        if key is None or value is None or value.strip() == "":
+            continue
+        value = value.strip()
+        fields[key] = [item.strip() for item in value.split(LIST_SEPARATOR) if item.strip()] \
+            if key in LIST_FIELDS else value
+    return {
+        "typeOfEntry": fields.pop("typeOfEntry", None),
+        "parents": fields.pop("parents", []),
+        "data": fields,
+    }
+
+def iter_import_records(source, fmt: str):
+    """Yield `(row_number, record)` from a binary stream; `record` is a ValueError for unreadable rows."""
+    text = io.TextIOWrapper(source, encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        for row_number, row in enumerate(csv.DictReader(text), start=1):
+            yield row_number, _csv_record(row)
+        return
+    row_number = 0
+    for line in text:
+        if not line.strip():
+            continue
+        row_number += 1
+        try:
+            record = orjson.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError("expected a JSON object")
+            yield row_number, record
+        except (orjson.JSONDecodeError, ValueError) as e:
+            yield row_number, ValueError(f"Invalid JSON: {e}")
+
+class _ImportRow:
+    __slots__ = ("row", "type_of_entry", "identifier", "properties", "parents")
+
+    def __init__(self, row, type_of_entry, data, parents):
+        self.row = row
+        self.type_of_entry = type_of_entry
+        self.identifier = data["identifier"]
+        self.parents = list(dict.fromkeys(parents))
+        self.properties = {**data, **normalized_label_properties(data.get("prefLabel"), data.get("altLabel"))}
+
+def validate_record(row_number, record):
+    """Turn a parsed record into an `_ImportRow`. Raises ValueError with a readable message."""
+    if isinstance(record, Exception):
+        raise record
+    type_of_entry = record.get("typeOfEntry")
+    model = ENTRY_MODELS.get(type_of_entry)
+    if model is None:
+        raise ValueError(f"Unknown typeOfEntry {type_of_entry!r}; expected one of {', '.join(ENTRY_MODELS)}")
+    parents = record.get("parents") or []
+    if isinstance(parents, str):
+        parents = [parents]
+    if not isinstance(parents, list) or not all(isinstance(parent, str) for parent in parents):
+        raise ValueError("parents must be a list of identifiers")
+    try:
+        data = model.model_validate(record.get("data") or {}).model_dump(exclude_none=True)
+    except ValidationError as e:
+        raise ValueError("; ".join(
+            f"{'.'.join(map(str, error['loc'])) or 'data'}: {error['msg']}" for error in e.errors()
+        ))
+    return _ImportRow(row_number, type_of_entry, data, parents)
+
+EXISTING_IDENTIFIERS = register("existing_identifiers", """
+    UNWIND $identifiers AS identifier
+    MATCH (n:AllNodes {identifier: identifier})
+    RETURN n.identifier AS identifier
+""", params={"identifiers": ["MPO:0000001"]})
+
+def _create_entries_query(type_label: str):
+    return f"""
+    UNWIND $rows AS row
+    CREATE (e:{type_label}:AllNodes)
+    SET e = row
+    """
+
+register("create_entries", _create_entries_query("`Species`"), WRITE, {"rows": [{"identifier": "MPO:0000002"}]})
+
+LINK_PARENTS = register("link_parents", """
+    UNWIND $links AS link
+    MATCH (child:AllNodes {identifier: link.child})
+    MATCH (parent:AllNodes {identifier: link.parent})
+    CREATE (child)-[:SUBCLASS_OF]->(parent)
+""", WRITE, {"links": [{"child": "MPO:0000002", "parent": "MPO:0000001"}]})
+
+def _import_batch_tx(tx, rows):
+    """Write one batch.
+
+    Returns `({row_number: error}, {row_number: [missing parents]})` for the
+    rows that were skipped and the written rows linked to only some parents.
+    """
+    identifiers = {row.identifier for row in rows} | {parent for row in rows for parent in row.parents}
+    existing = {
+        record["identifier"]
+        for record in run_query(tx, EXISTING_IDENTIFIERS, identifiers=list(identifiers))
+    }
+
+    errors = {}
+    accepted = {}
+    for row in rows:
+        if row.identifier in existing:
+            errors[row.row] = "Identifier already exists"
+        elif row.identifier in accepted:
+            errors[row.row] = f"Duplicate identifier, first seen in row {accepted[row.identifier].row}"
+        else:
+            accepted[row.identifier] = row
+
+    # Like /create, an entry needs at least one of its parents; dropping a row
+    # can strand rows below it in the same batch, so repeat until stable
+    changed = True
+    while changed:
+        changed = False
+        for identifier, row in list(accepted.items()):
+            if row.parents and not any(parent in existing or parent in accepted for parent in row.parents):
+                errors[row.row] = "None of the specified parents were found"
+                del accepted[identifier]
+                changed = True
+
+    by_type = {}
+    for row in accepted.values():
+        by_type.setdefault(row.type_of_entry, []).append(row.properties)
+    for type_of_entry, properties in by_type.items():
+        run_query(tx, _create_entries_query(f"`{type_of_entry}`"), name="create_entries", rows=properties).consume()
+
+    links = []
+    missing = {}
+    for row in accepted.values():
+        for parent in row.parents:
+            if parent in existing or parent in accepted:
+                links.append({"child": row.identifier, "parent": parent})
+            else:
+                missing.setdefault(row.row, []).append(parent)
+    if links:
+        run_query(tx, LINK_PARENTS, links=links).consume()
+    return errors, missing
+
+def import_entries(source, fmt: str, batch_size: int = IMPORT_BATCH_SIZE):
+    """Validate and write every row of `source`; returns counts and a per-row report.
+
+    Each batch commits on its own, so rows from earlier batches stay imported
+    if a later batch fails; the report says which.
+    """
+    report = []
+    created = failed = 0
+    started = time.perf_counter()
+
+    def write(batch):
+        nonlocal created, failed
+        try:
+            with get_neo4j_driver().session() as session:
+                errors, missing = session.execute_write(_import_batch_tx, batch)
+        except Exception as e:
+            logger.exception("Bulk import batch failed")
+            errors, missing = {row.row: f"Batch failed: {e}" for row in batch}, {}
+        for row in batch:
+            line = {"row": row.row, "identifier": row.identifier}
+            if row.row in errors:
+                line.update(status="error", error=errors[row.row])
+                failed += 1
+            else:
+                line["status"] = "created"
+                if row.row in missing:
+                    line["missing_parents"] = missing[row.row]
+                created += 1
+            report.append(line)
+
+    batch = []
+    try:
+        for row_number, record in iter_import_records(source, fmt):
+            try:
+                batch.append(validate_record(row_number, record))
+            except ValueError as e:
+                report.append({"row": row_number, "identifier": _identifier_of(record), "status": "error", "error": str(e)})
+                failed += 1
+                continue
+            if len(batch) >= batch_size:
+                write(batch)
+                batch = []
+        if batch:
+            write(batch)
+    finally:
+        if created:
+            # One invalidation for the whole import instead of one per entry
+            entries_changed()
+
+    report.sort(key=lambda line: line["row"])
+    seconds = time.perf_counter() - started
+    stats = {
+        "created": created,
+        "failed": failed,
+        "seconds": round(seconds, 3),
+        "rows_per_second": round((created + failed) / seconds, 1) if seconds else None,
+    }
+    logger.info("Bulk import finished: %s", stats)
+    return {**stats, "rows": report}
+
+def _identifier_of(record):
+    if isinstance(record, dict) and isinstance(record.get("data"), dict):
+        return record["data"].get("identifier")
+    return None
@@ -0,0 +1,95 @@
+"""Versioned snapshot of all entries for `GET /api/entry/all`.
+
+The landing page search bar downloads every entry name and code. Rather than
+scanning the graph on every visit, the list is built once per write
+generation (see utils.entry_events) and kept as pre-serialized, pre-compressed
+bytes with an ETag.
+"""
+import asyncio
+import base64
+import gzip
+import hashlib
+from bisect import bisect_right
+
+import orjson
+from fastapi.concurrency import run_in_threadpool
+
+from utils import entry_events
+from utils.queries import register, run_query_async
+
+try:
+    import brotli
+except ImportError:  # optional, gzip is always available
+    brotli = None
+
+class EntrySnapshot:
+    def __init__(self, version: int, entries: list):
+        self.version = version
+        # Sorted so cursors stay meaningful across rebuilds
+        self.entries = sorted(entries, key=_sort_key)
+        self.keys = [_sort_key(entry) for entry in self.entries]
+
+        self.body = orjson.dumps({"status": "200", "entries": self.entries})
+        self.encoded = {"gzip": gzip.compress(self.body, compresslevel=9)}
+        if brotli is not None:
+            self.encoded["br"] = brotli.compress(self.body)
+        # Strong ETags name exact bytes, so each encoding gets its own
+        digest = hashlib.blake2b(self.body, digest_size=16).hexdigest()
+        self.etags = {None: '"%s"' % digest, **{encoding: '"%s-%s"' % (digest, encoding) for encoding in self.encoded}}
+
+    def negotiate(self, accept_encoding: str):
+        """Pick the smallest representation the client accepts: `(encoding or None, bytes)`."""
+        accepted = {part.split(";")[0].strip().lower() for part in (accept_encoding or "").split(",")}
+        for encoding in ("br", "gzip"):
+            if encoding in accepted and encoding in self.encoded:
+                return encoding, self.encoded[encoding]
+        return None, self.body
+
+    def page(self, cursor: str = None, limit: int = 1000):
+        """Return `(entries, next_cursor)` for the page after `cursor`."""
+        start = bisect_right(self.keys, decode_cursor(cursor)) if cursor else 0
+        entries = self.entries[start:start + limit]
+        has_more = start + limit < len(self.entries)
+        return entries, encode_cursor(self.keys[start + limit - 1]) if has_more else None
+
+def _sort_key(entry):
+    return (entry["code"] or "", entry["name"] or "")
+
+def encode_cursor(key) -> str:
+    return base64.urlsafe_b64encode(orjson.dumps(key)).decode("ascii")
+
+def decode_cursor(cursor: str):
+    """Decode a cursor from `encode_cursor`. Raises ValueError if malformed."""
+    try:
+        code, name = orjson.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return (str(code), str(name))
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+_snapshot = None
+_rebuild_lock = asyncio.Lock()
+
+ALL_ENTRY_NAMES = register("all_entry_names", """
+    MATCH (e:AllNodes)
+    RETURN e.prefLabel AS name, e.notation AS term_code
+""", scans=True)
+
+async def _load_entries(session):
+    result = await run_query_async(session, ALL_ENTRY_NAMES)
+    return [{"name": record["name"], "code": record["term_code"]} async for record in result]
+
+async def get_entry_snapshot(session) -> EntrySnapshot:
+    """Return the snapshot for the current write generation, rebuilding it if stale."""
+    global _snapshot
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == entry_events.generation():
+        return snapshot
+
+    # One rebuild at a time; concurrent callers wait and reuse its result
+    async with _rebuild_lock:
+        version = entry_events.generation()
+        if _snapshot is None or _snapshot.version != version:
+            entries = await _load_entries(session)
+            # Sorting, serializing and compressing are CPU bound
+            _snapshot = await run_in_threadpool(EntrySnapshot, version, entries)
+        return _snapshot
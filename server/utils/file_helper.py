@@ -1,18 +1,69 @@
+import csv
+import io
+import os
 import re
+import time
+from itertools import islice
 from fastapi import HTTPException
 
 from models.entry_model import DOTermData
 from models.subset import subset_definitions_instance
 
-from  utils.entry_helper import query_icd10cm_neo4j
-def process_row(row):
+from utils import metrics
+from utils.entry_helper import resolve_labels
+
+def process_row(row, notations):
     """
-    Process a single row by querying notation for each cell.
+    Process a single row by replacing each cell with its standardized notation.
+
+    `notations` maps cell values to notations, see `resolve_labels`.
     """
     for i in range(len(row)):
-        label = row[i] 
-        notation = query_icd10cm_neo4j(label)
+        notation = notations.get(row[i])
         
         if notation:
             row[i] = notation
-    return row
\ No newline at end of file
+    return row
+
+def standardize_rows(rows):
+    """Standardize a batch of rows, resolving each distinct cell value once."""
+    notations = resolve_labels({cell for row in rows for cell in row})
+    return [process_row(row, notations) for row in rows]
+
+# Rows standardized and sent to the client at a time
+CSV_CHUNK_ROWS = int(os.getenv("CSV_CHUNK_ROWS", "2000"))
+
+def iter_standardized_csv(source, chunk_rows: int = CSV_CHUNK_ROWS):
+    """
+    Stream a binary CSV file object back as standardized CSV text chunks.
+
+    Rows are read, resolved and written `chunk_rows` at a time, so memory
+    stays flat however large the file is. The header is sent as is. Closes
+    `source` when done.
+    """
+    text = io.TextIOWrapper(source, encoding="utf-8", newline="")
+    try:
+        reader = csv.reader(text)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+
+        header = next(reader, None)
+        if header is None:
+            return
+        # Send the header right away so the download starts immediately
+        writer.writerow(header)
+        yield buffer.getvalue()
+
+        while True:
+            rows = list(islice(reader, chunk_rows))
+            if not rows:
+                break
+            buffer.seek(0)
+            buffer.truncate()
+            started = time.perf_counter()
+            writer.writerows(standardize_rows(rows))
+            metrics.CSV_SECONDS.inc(time.perf_counter() - started)
+            metrics.CSV_CELLS.inc(sum(len(row) for row in rows))
+            yield buffer.getvalue()
+    finally:
+        text.close()
@@ -0,0 +1,323 @@
+"""In-process index of the SUBCLASS_OF hierarchy.
+
+Nodes are interned to integer positions and the hierarchy is kept as
+array-backed parent/child lists plus, per node, its distance to the nearest
+root and the parent on that shortest path. Ancestor queries then walk one
+parent per level (O(depth)) instead of expanding every path in Cypher.
+
+With HIERARCHY_CACHE enabled the index also keeps each node's label, type
+and properties, and serves the PrimeVue tree endpoints (roots of a database,
+children of a node) from memory. A `LazyIndex` (see utils.entry_events).
+"""
+import logging
+import os
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+
+from database import get_neo4j_driver
+from utils import entry_events
+from utils.entry_events import LazyIndex, identifier_values
+from utils.queries import register, run_query
+
+logger = logging.getLogger(__name__)
+
+NO_NODE = -1
+
+# Serve tree browsing from memory (holds every node's properties)
+HIERARCHY_CACHE = os.getenv("HIERARCHY_CACHE", "false").lower() in ("1", "true", "yes")
+
+def node_type(labels):
+    """Type label shown in the tree, skipping the AllNodes search label."""
+    labels = list(labels or [])
+    if not labels:
+        return None
+    return labels[1] if labels[0] == "AllNodes" and len(labels) > 1 else labels[0]
+
+HIERARCHY_NODES = register("hierarchy_nodes", """
+    MATCH (n:AllNodes)
+    WHERE n.identifier IS NOT NULL
+    RETURN n.identifier AS identifier, n.notation AS notation, n.prefLabel AS prefLabel,
+        labels(n) AS labels, CASE WHEN $withData THEN properties(n) END AS data
+""", params={"withData": False}, scans=True)
+
+HIERARCHY_EDGES = register("hierarchy_edges", """
+    MATCH (c:AllNodes)-[:SUBCLASS_OF]->(p:AllNodes)
+    WHERE c.identifier IS NOT NULL AND p.identifier IS NOT NULL
+    RETURN c.identifier AS child, p.identifier AS parent
+""", scans=True)
+
+class HierarchyIndex(LazyIndex):
+    def __init__(self, with_data: bool = False):
+        super().__init__()
+        self.with_data = with_data
+        self._reset()
+
+    def _reset(self):
+        self._ids = []          # position -> identifier
+        self._codes = []        # position -> COALESCE(notation, identifier)
+        self._positions = {}    # identifier or notation -> position
+        self._parents = []      # position -> list of parent positions
+        self._children = []     # position -> list of child positions
+        self._depth = array("i")  # position -> distance to nearest root, -1 if unreachable
+        self._via = array("i")    # position -> parent on that shortest path, NO_NODE for roots
+        self._pref_labels = []  # position -> prefLabel
+        self._types = []        # position -> node type label
+        self._data = []         # position -> properties dict (with_data only)
+        self._root_keys = None  # sorted (identifier or notation, position) of roots, built lazily
+
+    def __len__(self):
+        return len(self._ids)
+
+    # Building
+
+    def _add_node(self, identifier, notation=None):
+        """Position of `identifier`, added if new; `notation` may be a list of codes."""
+        notations = identifier_values(notation)
+        notation = notations[0] if notations else None
+        position = self._positions.get(identifier)
+        if position is None:
+            position = len(self._ids)
+            self._ids.append(identifier)
+            self._codes.append(notation or identifier)
+            self._positions[identifier] = position
+            self._parents.append([])
+            self._children.append([])
+            self._depth.append(0)
+            self._via.append(NO_NODE)
+            self._pref_labels.append(None)
+            self._types.append(None)
+            self._data.append(None)
+        if notation:
+            self._codes[position] = notation
+        for code in notations:
+            self._positions.setdefault(code, position)
+        return position
+
+    def _compute_depths(self):
+        """Multi-source BFS from the roots; nodes only reachable through a cycle get -1."""
+        depth, via = self._depth, self._via
+        queue = deque()
+        for position, parents in enumerate(self._parents):
+            if parents:
+                depth[position], via[position] = -1, NO_NODE
+            else:
+                depth[position], via[position] = 0, NO_NODE
+                queue.append(position)
+        while queue:
+            position = queue.popleft()
+            for child in self._children[position]:
+                if depth[child] == -1:
+                    depth[child] = depth[position] + 1
+                    via[child] = position
+                    queue.append(child)
+
+    def _set_details(self, position, pref_label=None, labels=None, data=None):
+        if pref_label is not None:
+            self._pref_labels[position] = pref_label
+        if labels is not None:
+            self._types[position] = node_type(labels)
+        if data is not None and self.with_data:
+            self._data[position] = {**(self._data[position] or {}), **data}
+
+    def build(self, nodes, edges):
+        """Replace the index.
+
+        `nodes` are `(identifier, notation, prefLabel, labels, properties)`
+        tuples (only the first two are required), `edges` are `(child, parent)`.
+        """
+        with self._lock:
+            self._reset()
+            for identifier, notation, *details in nodes:
+                # Loaded terms may hold several identifiers: the first names
+                # the node, the others find it too
+                identifiers = identifier_values(identifier)
+                if not identifiers:
+                    continue
+                position = self._add_node(identifiers[0], notation)
+                for alias in identifiers[1:]:
+                    self._positions.setdefault(alias, position)
+                self._set_details(position, *details)
+            for child, parent in edges:
+                children, parents = identifier_values(child), identifier_values(parent)
+                if not children or not parents:
+                    continue
+                child_position = self._add_node(children[0])
+                parent_position = self._add_node(parents[0])
+                self._parents[child_position].append(parent_position)
+                self._children[parent_position].append(child_position)
+            self._compute_depths()
+
+    def load(self):
+        """Rebuild the index from the graph."""
+        with get_neo4j_driver().session() as session:
+            nodes = [
+                (record["identifier"], record["notation"], record["prefLabel"], record["labels"], record["data"])
+                for record in run_query(session, HIERARCHY_NODES, withData=self.with_data)
+            ]
+            edges = [(record["child"], record["parent"]) for record in run_query(session, HIERARCHY_EDGES)]
+        self.build(nodes, edges)
+        logger.info("Hierarchy index loaded with %d nodes and %d edges", len(nodes), len(edges))
+
+    # Incremental maintenance
+
+    def _refresh_depths_from(self, position):
+        """Recompute depth/via for `position` and, where they change, its descendants."""
+        depth, via = self._depth, self._via
+        budget = 2 * len(self._ids) + 1
+        queue = deque([position])
+        while queue:
+            budget -= 1
+            if budget < 0:
+                # Only a cycle keeps this going; fall back to a full pass
+                self._compute_depths()
+                return
+            current = queue.popleft()
+            best_depth, best_parent = (0, NO_NODE) if not self._parents[current] else (-1, NO_NODE)
+            for parent in self._parents[current]:
+                if depth[parent] >= 0 and (best_depth < 0 or depth[parent] + 1 < best_depth):
+                    best_depth, best_parent = depth[parent] + 1, parent
+            if (best_depth, best_parent) != (depth[current], via[current]) or current == position:
+                depth[current], via[current] = best_depth, best_parent
+                queue.extend(self._children[current])
+
+    def set_parents(self, identifier, parents, notation=None):
+        """Add `identifier` if new and replace its parent links with `parents`."""
+        with self._lock:
+            position = self._add_node(identifier, notation)
+            for parent in self._parents[position]:
+                self._children[parent].remove(position)
+            new_parents = []
+            for parent in dict.fromkeys(parents):
+                parent_position = self._positions.get(parent)
+                if parent_position is not None and parent_position != position:
+                    new_parents.append(parent_position)
+                    self._children[parent_position].append(position)
+            self._parents[position] = new_parents
+            self._refresh_depths_from(position)
+            self._root_keys = None
+
+    def patch(self, identifier, change):
+        data = change.get("data") or {}
+        notation = data.get("notation")
+        type_of_entry = change.get("typeOfEntry")
+        if change.get("parents") is not None:
+            self.set_parents(identifier, change["parents"], notation)
+        position = self._add_node(identifier, notation)
+        self._set_details(position, data.get("prefLabel"), [type_of_entry] if type_of_entry else None, data)
+        self._root_keys = None
+
+    # Queries
+
+    def position(self, key):
+        """Position of a node by identifier or notation, or None."""
+        return self._positions.get(key)
+
+    def depth(self, key):
+        """Distance from the node to its nearest root (0 for roots), or None if unknown."""
+        position = self._positions.get(key)
+        if position is None or self._depth[position] < 0:
+            return None
+        return self._depth[position]
+
+    def ancestors(self, key):
+        """Codes on the shortest path from a root down to the node, excluding the node itself.
+
+        Returns None for unknown nodes and [] for roots.
+        """
+        position = self._positions.get(key)
+        if position is None:
+            return None
+        path = []
+        current = self._via[position]
+        while current != NO_NODE:
+            path.append(self._codes[current])
+            current = self._via[current]
+        path.reverse()
+        return path
+
+    def root_paths(self, key, limit=100):
+        """Up to `limit` distinct root-to-node paths (as codes, node excluded), shortest first."""
+        position = self._positions.get(key)
+        if position is None:
+            return None
+        paths = []
+        # Depth-first over parents, nearest-root parents first
+        stack = [(position, ())]
+        while stack and len(paths) < limit:
+            current, below = stack.pop()
+            parents = self._parents[current]
+            if not parents:
+                paths.append([self._codes[p] for p in reversed(below)])
+                continue
+            for parent in sorted(parents, key=lambda p: self._depth[p] if self._depth[p] >= 0 else len(self._ids), reverse=True):
+                if parent not in below and parent != position:
+                    stack.append((parent, below + (parent,)))
+        paths.sort(key=len)
+        return paths
+
+    # Tree browsing (PrimeVue TreeNode shaped entries)
+
+    def _tree_entry(self, position, key):
+        return {
+            "key": key,
+            "label": self._pref_labels[position],
+            "data": self._data[position],
+            "leaf": not self._children[position],
+            "loading": True,
+            "nodeType": self._types[position],
+        }
+
+    def _root_positions(self, database):
+        """Positions of the roots whose identifier or notation starts with `<database>:`, in code order."""
+        with self._lock:
+            if self._root_keys is None:
+                keys = []
+                for position, parents in enumerate(self._parents):
+                    if not parents:
+                        keys.append((self._ids[position], position))
+                        if self._codes[position] != self._ids[position]:
+                            keys.append((self._codes[position], position))
+                keys.sort()
+                self._root_keys = keys
+            root_keys = self._root_keys
+
+        prefix = database + ":"
+        positions = set()
+        for key, position in root_keys[bisect_left(root_keys, (prefix,)):]:
+            if not key.startswith(prefix):
+                break
+            positions.add(position)
+        return sorted(positions, key=self._codes.__getitem__)
+
+    def root_entries(self, database, after=None, limit=None):
+        """Roots of `database` in code order, optionally only the `limit` after code `after`."""
+        positions = self._root_positions(database)
+        if after is not None:
+            codes = [self._codes[position] for position in positions]
+            positions = positions[bisect_right(codes, after):]
+        if limit is not None:
+            positions = positions[:limit]
+        return [self._tree_entry(position, self._codes[position]) for position in positions]
+
+    def root_count(self, database):
+        """Number of roots `root_entries(database)` returns unpaginated."""
+        return len(self._root_positions(database))
+
+    def children_entries(self, key):
+        """Children of the node with identifier or notation `key`, or [] if unknown."""
+        position = self._positions.get(key)
+        if position is None:
+            return []
+        entries = []
+        for child in self._children[position]:
+            entry = self._tree_entry(child, self._ids[child])
+            entry["parents"] = [
+                {"name": self._pref_labels[parent], "code": self._ids[parent]}
+                for parent in self._parents[child]
+            ]
+            entries.append(entry)
+        return entries
+
+hierarchy_index = HierarchyIndex(with_data=HIERARCHY_CACHE)
+entry_events.add_listener(hierarchy_index.apply_change)
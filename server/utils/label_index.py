@@ -0,0 +1,136 @@
+"""In-memory label → identifier dictionary for CSV standardization.
+
+Maps every normalized prefLabel and altLabel in the graph to the identifier
+of its entry, so standardizing a cell is a dict lookup instead of a graph
+query. A `LazyIndex` (see utils.entry_events).
+"""
+import logging
+import sys
+
+from database import get_neo4j_driver
+from utils import entry_events
+from utils.entry_events import LazyIndex, as_list, identifier_values
+from utils.queries import register, run_query
+
+logger = logging.getLogger(__name__)
+
+def normalize_label(label):
+    """Normalization shared by the index and its lookups (trimmed, lower-cased)."""
+    if not isinstance(label, str):
+        return None
+    return label.strip().lower() or None
+
+def normalized_label_properties(pref_label, alt_label):
+    """Indexed lookup properties stored on each entry: `normLabel` and `normAltLabels`."""
+    if isinstance(pref_label, list):
+        pref_label = pref_label[0] if pref_label else None
+    return {
+        "normLabel": normalize_label(pref_label),
+        "normAltLabels": [key for key in map(normalize_label, as_list(alt_label)) if key],
+    }
+
+ALL_ENTRY_LABELS = register("all_entry_labels", """
+    MATCH (n:AllNodes)
+    WHERE n.identifier IS NOT NULL
+    RETURN n.identifier AS identifier, n.prefLabel AS prefLabel, n.altLabel AS altLabel
+""", scans=True)
+
+class LabelIndex(LazyIndex):
+    def __init__(self):
+        super().__init__()
+        self._lookup = {}
+        # identifier -> (normalized prefLabel, normalized altLabels), so updates can retract them
+        self._owned = {}
+        # normalized label -> identifiers, for the labels more than one entry carries
+        self._shared = {}
+
+    def __len__(self):
+        return len(self._lookup)
+
+    def lookup(self, label):
+        """Identifier for `label` (pref or alt, case-insensitive), or None."""
+        return self._lookup.get(normalize_label(label))
+
+    def build(self, rows):
+        """Replace the index with `(identifier, prefLabel, altLabel)` rows."""
+        lookup = {}
+        owned = {}
+        entries = []
+        for identifier, pref_label, alt_label in rows:
+            identifiers = [sys.intern(value) for value in identifier_values(identifier)]
+            if not identifiers:
+                continue
+            pref_labels = as_list(pref_label)
+            keys = (
+                normalize_label(pref_labels[0] if pref_labels else None),
+                tuple(filter(None, map(normalize_label, as_list(alt_label))))
+            )
+            # A term with several identifiers is owned under each of them (a
+            # write may name any) and its labels resolve to the first
+            for value in identifiers:
+                owned[value] = keys
+            entries.append((identifiers[0], keys))
+        # Built aside and swapped in whole, so lookups never see it half built.
+        # Alt labels first so any prefLabel wins over a colliding altLabel
+        for identifier, (_, alt_keys) in entries:
+            for key in alt_keys:
+                lookup.setdefault(key, identifier)
+        for identifier, (pref_key, _) in entries:
+            if pref_key:
+                lookup[pref_key] = identifier
+        first_owners = {}
+        shared = {}
+        for identifier, (pref_key, alt_keys) in owned.items():
+            for key in {pref_key, *alt_keys} - {None}:
+                owner = first_owners.setdefault(key, identifier)
+                if owner != identifier:
+                    shared.setdefault(key, {owner}).add(identifier)
+        with self._lock:
+            self._lookup, self._owned, self._shared = lookup, owned, shared
+
+    def load(self):
+        """Rebuild the index from the graph."""
+        with get_neo4j_driver().session() as session:
+            result = run_query(session, ALL_ENTRY_LABELS)
+            self.build((record["identifier"], record["prefLabel"], record["altLabel"]) for record in result)
+        logger.info("Label index loaded with %d labels", len(self._lookup))
+
+    def _next_owner(self, key, owners):
+        """Which of the remaining `owners` of a label it resolves to; a prefLabel wins, as in `build`."""
+        return min((owner for owner in owners if self._owned[owner][0] == key), default=min(owners))
+
+    def patch(self, identifier, change):
+        data = change.get("data") or {}
+        lookup = self._lookup
+        old_pref, old_alts = self._owned.pop(identifier, (None, ()))
+        for key in {old_pref, *old_alts} - {None}:
+            owners = self._shared.get(key)
+            if owners is not None:
+                owners.discard(identifier)
+                if len(owners) < 2:
+                    del self._shared[key]
+            if lookup.get(key) == identifier:
+                # Another entry may still carry the label
+                if owners:
+                    lookup[key] = self._next_owner(key, owners)
+                else:
+                    del lookup[key]
+
+        # Updates only overwrite the properties they send
+        pref_labels = as_list(data.get("prefLabel"))
+        pref_key = normalize_label(pref_labels[0] if pref_labels else None) if "prefLabel" in data else old_pref
+        alt_keys = tuple(filter(None, map(normalize_label, as_list(data["altLabel"])))) \
+            if "altLabel" in data else old_alts
+        identifier = sys.intern(identifier)
+        for key in {pref_key, *alt_keys} - {None}:
+            owner = lookup.get(key)
+            if owner is not None and owner != identifier:
+                self._shared.setdefault(key, {owner}).add(identifier)
+        for key in alt_keys:
+            lookup.setdefault(key, identifier)
+        if pref_key:
+            lookup[pref_key] = identifier
+        self._owned[identifier] = (pref_key, alt_keys)
+
+label_index = LabelIndex()
+entry_events.add_listener(label_index.apply_change)
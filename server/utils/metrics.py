@@ -0,0 +1,286 @@
+"""In-process metrics, exposed in the Prometheus text format on `/metrics`.
+
+Counters, gauges and histograms are plain Python objects updated under a
+per-series lock, so recording one observation costs well under a
+microsecond and they can stay on in production. Metrics only ever updated
+from the event loop thread are created with `threadsafe=False` and skip the
+lock. Series with labels are
+created on first use by `labels(...)`; keep label values low-cardinality
+(route templates and query names, never raw paths or user input).
+
+Rates such as CSV cells or ontology triples per second come from
+`rate()` over the `_total` counters on the Prometheus side.
+"""
+import inspect
+import os
+import threading
+import time
+from bisect import bisect_left
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Seconds; the last bucket is +Inf
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _label_text(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class _CounterSeries:
+    __slots__ = ("_value", "_lock")
+
+    def __init__(self, lock):
+        self._value = 0.0
+        self._lock = lock
+
+    def inc(self, amount: float = 1):
+        if self._lock is None:
+            self._value += amount
+            return
+        with self._lock:
+            self._value += amount
+
+    def samples(self, name, names, values):
+        yield f"{name}{_label_text(names, values)} {_format_value(self._value)}"
+
+class _GaugeSeries(_CounterSeries):
+    __slots__ = ()
+
+    def dec(self, amount: float = 1):
+        self.inc(-amount)
+
+    def set(self, value: float):
+        self._value = value
+
+class _HistogramSeries:
+    __slots__ = ("_bounds", "_counts", "_sum", "_lock")
+
+    def __init__(self, bounds, lock):
+        self._bounds = bounds
+        self._counts = [0] * (len(bounds) + 1)
+        self._sum = 0.0
+        self._lock = lock
+
+    def observe(self, value: float):
+        index = bisect_left(self._bounds, value)
+        if self._lock is None:
+            self._counts[index] += 1
+            self._sum += value
+            return
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def samples(self, name, names, values):
+        # Without a lock the copy can be one observation out of step; fine for scraping
+        counts, total = list(self._counts), self._sum
+        cumulative = 0
+        for bound, count in zip(self._bounds + (float("inf"),), counts):
+            cumulative += count
+            le = f'le="{_format_value(float(bound))}"'
+            yield f"{name}_bucket{_label_text(names, values, le)} {cumulative}"
+        label_text = _label_text(names, values)
+        yield f"{name}_sum{label_text} {_format_value(total)}"
+        yield f"{name}_count{label_text} {cumulative}"
+
+class _Metric:
+    """A named metric family; the unlabelled series is the metric itself."""
+
+    kind = None
+
+    def __init__(self, name: str, documentation: str, labelnames=(), threadsafe: bool = True):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.threadsafe = threadsafe
+        self._series = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self._series[()] = self._new_series()
+
+    def _new_series(self):
+        raise NotImplementedError
+
+    def _series_lock(self):
+        return threading.Lock() if self.threadsafe else None
+
+    def labels(self, *values):
+        """The series for these label values, created on first use."""
+        series = self._series.get(values)
+        if series is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}, got {values}")
+            with self._lock:
+                series = self._series.setdefault(values, self._new_series())
+        return series
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for values, series in sorted(self._series.copy().items()):
+            yield from series.samples(self.name, self.labelnames, values)
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_series(self):
+        return _CounterSeries(self._series_lock())
+
+    def inc(self, amount: float = 1):
+        self._default.inc(amount)
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_series(self):
+        return _GaugeSeries(self._series_lock())
+
+    def inc(self, amount: float = 1):
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1):
+        self._default.dec(amount)
+
+    def set(self, value: float):
+        self._default.set(value)
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS, threadsafe: bool = True):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, threadsafe)
+
+    def _new_series(self):
+        return _HistogramSeries(self.buckets, self._series_lock())
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+REGISTRY = {}
+
+def register(metric):
+    if metric.name in REGISTRY:
+        raise ValueError(f"Metric {metric.name!r} is already registered")
+    REGISTRY[metric.name] = metric
+    return metric
+
+def render():
+    """Every registered metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY.values():
+        lines.extend(metric.render())
+    lines.append("")
+    return "\n".join(lines)
+
+# Only MetricsMiddleware updates these, always on the event loop thread
+HTTP_REQUEST_SECONDS = register(Histogram(
+    "http_request_duration_seconds", "Time to serve a request, by route template.", ("method", "route", "status"),
+    threadsafe=False
+))
+HTTP_REQUESTS_IN_FLIGHT = register(Gauge(
+    "http_requests_in_flight", "Requests being served right now, by method.", ("method",), threadsafe=False
+))
+NEO4J_ACQUIRE_SECONDS = register(Histogram(
+    "neo4j_connection_acquire_seconds", "Time to borrow a Bolt connection from a driver pool.", ("driver",)
+))
+QUERY_SECONDS = register(Histogram(
+    "neo4j_query_duration_seconds", "Time from running a named query until its result is consumed.", ("query",)
+))
+QUERY_ROWS = register(Histogram(
+    "neo4j_query_rows", "Records returned by a named query.", ("query",), buckets=ROW_BUCKETS
+))
+QUERY_ERRORS = register(Counter(
+    "neo4j_query_errors_total", "Named queries that raised.", ("query",)
+))
+CSV_CELLS = register(Counter(
+    "csv_cells_processed_total", "CSV cells standardized by /uploadfile/."
+))
+CSV_SECONDS = register(Counter(
+    "csv_processing_seconds_total", "Time spent standardizing CSV chunks."
+))
+ONTOLOGY_TRIPLES = register(Counter(
+    "ontology_triples_ingested_total", "Ontology triples written to the graph."
+))
+ONTOLOGY_SECONDS = register(Counter(
+    "ontology_ingest_seconds_total", "Time spent parsing and writing ontologies."
+))
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency and in-flight requests per route.
+
+    Requests are labelled by route template (e.g. `/api/entry/{identifier}`),
+    read from the scope after routing; unmatched paths share `unmatched`.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        in_flight = HTTP_REQUESTS_IN_FLIGHT.labels(method)
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            in_flight.dec()
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUEST_SECONDS.labels(method, route_path, status_code).observe(elapsed)
+
+def time_connection_acquisition(driver, name: str):
+    """Record how long `driver` waits for pooled connections.
+
+    The driver has no public hook for this, so its pool's `acquire` is
+    wrapped; if the internals change the driver is left untouched.
+    """
+    pool = getattr(driver, "_pool", None)
+    acquire = getattr(pool, "acquire", None)
+    if not METRICS_ENABLED or acquire is None:
+        return driver
+    series = NEO4J_ACQUIRE_SECONDS.labels(name)
+
+    if inspect.iscoroutinefunction(acquire):
+        async def timed_acquire(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await acquire(*args, **kwargs)
+            finally:
+                series.observe(time.perf_counter() - started)
+    else:
+        def timed_acquire(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return acquire(*args, **kwargs)
+            finally:
+                series.observe(time.perf_counter() - started)
+
+    pool.acquire = timed_acquire
+    return driver
@@ -0,0 +1,70 @@
+import os
+
+# Namespaces stripped from predicate URIs, checked in order
+PREFIXES = {
+    "skos": "http://www.w3.org/2004/02/skos/core#",
+    "owl": "http://www.w3.org/2002/07/owl#",
+    "rdfs": "http://www.w3.org/2000/01/rdf-schema#",
+    "xsd": "http://www.w3.org/2001/XMLSchema#",
+    "umls": "http://bioportal.bioontology.org/ontologies/umls/",
+    "dc": "http://purl.org/dc/elements/1.1/",
+    "dcterms": "http://purl.org/dc/terms/",
+    "rdf": "http://www.w3.org/1999/02/22-rdf-syntax-ns#",
+    "sio": "http://semanticscience.org/ontology/sio.owl#"
+}
+
+# Per-ontology property rewriting, keyed by local predicate name.
+#   property: store the value under this property instead
+#   prefix:   prepend to the value
+#   replace:  (old, new) replaced once in the value
+ONTOLOGY_RULES = {
+    "mpo": {
+        "notation": {"property": "identifier", "prefix": "MPO:"},
+        "identifier": {"replace": ("_", ":")},
+    },
+    "icd10cm": {
+        "notation": {"property": "identifier", "prefix": "ICD10CM:"},
+        "identifier": {"replace": ("_", ":")},
+    },
+}
+
+DEFAULT_ONTOLOGY = os.getenv("DEFAULT_ONTOLOGY", "mpo")
+
+def _compile_rule(rule):
+    prefix = rule.get("prefix", "")
+    old, new = rule.get("replace", (None, None))
+    if old is not None and prefix:
+        return lambda value: prefix + value.replace(old, new, 1)
+    if old is not None:
+        return lambda value: value.replace(old, new, 1)
+    if prefix:
+        return lambda value: prefix + value
+    return None
+
+class PredicateResolver:
+    """Map predicate URIs to `(property name, value transform)` for one ontology.
+
+    Each distinct predicate is resolved once and cached by its URIRef, so the
+    per-triple cost is a single dict lookup.
+    """
+
+    def __init__(self, ontology: str = DEFAULT_ONTOLOGY):
+        if ontology not in ONTOLOGY_RULES:
+            raise ValueError(f"Unknown ontology '{ontology}', expected one of {', '.join(ONTOLOGY_RULES)}")
+        self.rules = {
+            predicate: (rule.get("property", predicate), _compile_rule(rule))
+            for predicate, rule in ONTOLOGY_RULES[ontology].items()
+        }
+        self._cache = {}
+
+    def resolve(self, predicate):
+        resolved = self._cache.get(predicate)
+        if resolved is None:
+            name = str(predicate)
+            for prefix_uri in PREFIXES.values():
+                if name.startswith(prefix_uri):
+                    name = name[len(prefix_uri):]
+                    break
+            resolved = self.rules.get(name, (name, None))
+            self._cache[predicate] = resolved
+        return resolved
@@ -0,0 +1,229 @@
+"""Registry of the Cypher queries the server runs.
+
+Modules declare their queries with `register`, which returns the query text
+so it can be used as a module-level constant. The registry lets
+`python -m utils.schema --check-plans` EXPLAIN every query against a live
+database and reject plans that fall back to scanning the graph.
+
+Every query runs through `run_query`/`run_query_async`, which time it under
+its registered name and count the rows read (see utils.metrics), then hand
+the result summary to utils.query_log for server timings, update counters
+and the slow-query log.
+"""
+import time
+from typing import NamedTuple
+
+from utils import metrics, query_log
+
+READ = "read"
+WRITE = "write"
+
+class RegisteredQuery(NamedTuple):
+    name: str
+    text: str
+    kind: str
+    # Sample parameters, so the query can be planned with realistic types
+    params: dict
+    # Label scans this query does on purpose (bulk loads), allowed by plan checks
+    scans: bool
+
+QUERIES = {}
+_NAMES_BY_TEXT = {}
+
+# Metric label for query text that was never registered
+UNREGISTERED = "unregistered"
+
+def register(name: str, text: str, kind: str = READ, params: dict = None, scans: bool = False) -> str:
+    """Record a query under `name` and return its text."""
+    if kind not in (READ, WRITE):
+        raise ValueError(f"Unknown query kind {kind!r}")
+    existing = QUERIES.get(name)
+    if existing is not None and existing.text != text:
+        raise ValueError(f"Query {name!r} is already registered with a different text")
+    QUERIES[name] = RegisteredQuery(name, text, kind, params or {}, scans)
+    _NAMES_BY_TEXT[text] = name
+    return text
+
+def query_name(text: str) -> str:
+    """The registered name of `text`, or UNREGISTERED."""
+    return _NAMES_BY_TEXT.get(text, UNREGISTERED)
+
+def plan_mode(name: str) -> str:
+    """How the slow-query log may capture the plan of query `name`.
+
+    PROFILE re-runs the query, so only registered reads get it, and not the
+    ones that scan on purpose (bulk loads), whose plan is known. Writes and
+    unregistered queries are only EXPLAINed.
+    """
+    query = QUERIES.get(name)
+    if query is not None and query.kind == READ and not query.scans:
+        return query_log.PROFILE
+    return query_log.EXPLAIN
+
+class _QueryRun(NamedTuple):
+    name: str
+    text: str
+    parameters: dict
+    started: float
+
+    def failed(self):
+        metrics.QUERY_ERRORS.labels(self.name).inc()
+
+    def finished(self, rows, summary):
+        seconds = time.perf_counter() - self.started
+        metrics.QUERY_SECONDS.labels(self.name).observe(seconds)
+        metrics.QUERY_ROWS.labels(self.name).observe(rows)
+        query_log.record(self.name, self.text, self.parameters, plan_mode(self.name), seconds, summary)
+
+def _start(query, parameters, name, kwargs):
+    if kwargs:
+        parameters = {**(parameters or {}), **kwargs}
+    return _QueryRun(name or query_name(query), query, parameters or {}, time.perf_counter())
+
+class TimedResult:
+    """A driver `Result` that records its query once it has been read to the end.
+
+    Iterating to exhaustion, `single()`, `data()` or `consume()` finish it;
+    anything else is passed through to the wrapped result.
+    """
+
+    def __init__(self, result, run):
+        self._result = result
+        self._run = run
+        self._rows = 0
+        self._done = False
+
+    def _fail(self):
+        if not self._done:
+            self._done = True
+            self._run.failed()
+
+    def _finish(self, summary):
+        if not self._done:
+            self._done = True
+            self._run.finished(self._rows, summary)
+
+    def _summary(self):
+        # Free once the records are read: the summary came with the last one
+        try:
+            return self._result.consume()
+        except Exception:
+            return None
+
+    def __iter__(self):
+        try:
+            for record in self._result:
+                self._rows += 1
+                yield record
+        except Exception:
+            self._fail()
+            raise
+        self._finish(self._summary())
+
+    def single(self, strict: bool = False):
+        try:
+            record = self._result.single(strict)
+        except Exception:
+            self._fail()
+            raise
+        self._rows += record is not None
+        self._finish(self._summary())
+        return record
+
+    def data(self, *keys):
+        try:
+            data = self._result.data(*keys)
+        except Exception:
+            self._fail()
+            raise
+        self._rows += len(data)
+        self._finish(self._summary())
+        return data
+
+    def consume(self):
+        try:
+            summary = self._result.consume()
+        except Exception:
+            self._fail()
+            raise
+        self._finish(summary)
+        return summary
+
+    def __getattr__(self, attribute):
+        return getattr(self._result, attribute)
+
+class AsyncTimedResult(TimedResult):
+    """`TimedResult` for the async driver's `AsyncResult`."""
+
+    def __iter__(self):
+        raise TypeError("AsyncTimedResult must be iterated with `async for`")
+
+    async def _summary(self):
+        try:
+            return await self._result.consume()
+        except Exception:
+            return None
+
+    async def __aiter__(self):
+        try:
+            async for record in self._result:
+                self._rows += 1
+                yield record
+        except Exception:
+            self._fail()
+            raise
+        self._finish(await self._summary())
+
+    async def single(self, strict: bool = False):
+        try:
+            record = await self._result.single(strict)
+        except Exception:
+            self._fail()
+            raise
+        self._rows += record is not None
+        self._finish(await self._summary())
+        return record
+
+    async def data(self, *keys):
+        try:
+            data = await self._result.data(*keys)
+        except Exception:
+            self._fail()
+            raise
+        self._rows += len(data)
+        self._finish(await self._summary())
+        return data
+
+    async def consume(self):
+        try:
+            summary = await self._result.consume()
+        except Exception:
+            self._fail()
+            raise
+        self._finish(summary)
+        return summary
+
+def run_query(runner, query: str, parameters: dict = None, name: str = None, **kwargs):
+    """Run `query` on a session or transaction and time it.
+
+    `name` labels the metrics; it defaults to the name `query` was registered
+    under, so only queries built at runtime need to pass it. Cypher
+    parameters go in `parameters` or as keyword arguments (`name` is taken).
+    """
+    run = _start(query, parameters, name, kwargs)
+    try:
+        result = runner.run(query, run.parameters)
+    except Exception:
+        run.failed()
+        raise
+    return TimedResult(result, run)
+
+async def run_query_async(runner, query: str, parameters: dict = None, name: str = None, **kwargs):
+    """`run_query` for async sessions and transactions."""
+    run = _start(query, parameters, name, kwargs)
+    try:
+        result = await runner.run(query, run.parameters)
+    except Exception:
+        run.failed()
+        raise
+    return AsyncTimedResult(result, run)
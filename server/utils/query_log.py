@@ -0,0 +1,172 @@
+"""Slow-query log with server-side plan capture.
+
+Every query run through utils.queries hands its result summary here once it
+has been read. Server-side timings and update counters feed the metrics. A
+query slower than SLOW_QUERY_MS is logged with them. Its plan is then
+captured in the background on a session of its own: read queries are re-run
+with PROFILE, so the log shows rows and db hits per operator; writes are
+only EXPLAINed, so they are never applied twice (see `plan_mode` in
+utils.queries). Plans that scan the whole
+graph, scan a label or build a cartesian product are flagged.
+
+Each query name is profiled at most once per SLOW_QUERY_PROFILE_INTERVAL,
+so a slow endpoint under load does not double its own load.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# Wall-clock milliseconds from running a query to reading its last record
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "500"))
+SLOW_QUERY_PROFILE = os.getenv("SLOW_QUERY_PROFILE", "true").lower() in ("1", "true", "yes")
+SLOW_QUERY_PROFILE_INTERVAL = float(os.getenv("SLOW_QUERY_PROFILE_INTERVAL", "300"))
+
+UPDATE_COUNTERS = (
+    "nodes_created", "nodes_deleted", "relationships_created", "relationships_deleted",
+    "properties_set", "labels_added", "labels_removed", "indexes_added", "indexes_removed",
+    "constraints_added", "constraints_removed", "system_updates",
+)
+
+PROFILE = "PROFILE"
+EXPLAIN = "EXPLAIN"
+
+# Flagged in captured plans along with utils.schema's scan operators
+CARTESIAN_PRODUCTS = {"CartesianProduct"}
+
+QUERY_SERVER_SECONDS = metrics.register(metrics.Histogram(
+    "neo4j_query_server_seconds",
+    "Server-side time per named query: `available` until the first record, `consumed` until the last.",
+    ("query", "phase")
+))
+QUERY_UPDATES = metrics.register(metrics.Counter(
+    "neo4j_query_updates_total", "Graph changes made by named queries, by kind of update.", ("query", "update")
+))
+SLOW_QUERIES = metrics.register(metrics.Counter(
+    "neo4j_slow_queries_total", "Named queries slower than SLOW_QUERY_MS.", ("query",)
+))
+
+_profile_executor = None
+_last_profiled = {}
+_lock = threading.Lock()
+
+def _get_profile_executor():
+    # One thread: plans are captured one at a time, off the request path
+    global _profile_executor
+    if _profile_executor is None:
+        with _lock:
+            if _profile_executor is None:
+                _profile_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="query-profiler")
+    return _profile_executor
+
+def shutdown_profile_executor():
+    global _profile_executor
+    if _profile_executor is not None:
+        _profile_executor.shutdown(wait=False, cancel_futures=True)
+        _profile_executor = None
+
+def update_counts(summary):
+    """`{counter: value}` for the non-zero update counters of a result summary."""
+    counters = summary.counters
+    return {name: value for name in UPDATE_COUNTERS if (value := getattr(counters, name))}
+
+def record(name: str, query: str, parameters: dict, mode: str, seconds: float, summary):
+    """Take the summary of a finished query; log it and capture its plan if it was slow.
+
+    `mode` is PROFILE or EXPLAIN. `summary` may be None when the driver
+    could not provide one.
+    """
+    updates = {}
+    if summary is not None:
+        if summary.result_available_after is not None:
+            QUERY_SERVER_SECONDS.labels(name, "available").observe(summary.result_available_after / 1000)
+        if summary.result_consumed_after is not None:
+            QUERY_SERVER_SECONDS.labels(name, "consumed").observe(summary.result_consumed_after / 1000)
+        if summary.counters.contains_updates:
+            updates = update_counts(summary)
+            for update, value in updates.items():
+                QUERY_UPDATES.labels(name, update).inc(value)
+
+    if seconds * 1000 < SLOW_QUERY_MS:
+        return
+    SLOW_QUERIES.labels(name).inc()
+    logger.warning(
+        "Slow query %s: %.0f ms (server: available after %s ms, consumed after %s ms) updates=%s",
+        name, seconds * 1000,
+        getattr(summary, "result_available_after", None), getattr(summary, "result_consumed_after", None),
+        updates or None,
+    )
+    if SLOW_QUERY_PROFILE and _claim_profile(name):
+        _get_profile_executor().submit(capture_plan, name, query, parameters, mode)
+
+def _claim_profile(name):
+    """True if `name` has not been profiled within SLOW_QUERY_PROFILE_INTERVAL; claims the slot."""
+    now = time.monotonic()
+    with _lock:
+        last = _last_profiled.get(name)
+        if last is not None and now - last < SLOW_QUERY_PROFILE_INTERVAL:
+            return False
+        _last_profiled[name] = now
+        return True
+
+def plan_operators(plan):
+    """`(depth, operator, details, rows, db hits)` for each operator of a plan tree, root first.
+
+    Rows and db hits are None for EXPLAIN plans.
+    """
+    stack = [(0, plan)]
+    while stack:
+        depth, node = stack.pop()
+        arguments = node.get("args") or node.get("arguments") or {}
+        yield (
+            depth,
+            node["operatorType"].split("@")[0],
+            arguments.get("Details", ""),
+            node.get("rows"),
+            node.get("dbHits"),
+        )
+        stack.extend((depth + 1, child) for child in reversed(node.get("children", [])))
+
+def format_plan(plan):
+    """A plan tree as an indented operator table."""
+    lines = [f"{'operator':<48} {'rows':>10} {'db hits':>12}  details"]
+    for depth, operator, details, rows, db_hits in plan_operators(plan):
+        label = "  " * depth + operator
+        rows = "" if rows is None else rows
+        db_hits = "" if db_hits is None else db_hits
+        lines.append(f"{label:<48} {rows:>10} {db_hits:>12}  {details}")
+    return "\n".join(lines)
+
+def capture_plan(name: str, query: str, parameters: dict, mode: str):
+    """Run a query again under `mode` (PROFILE or EXPLAIN) and log its plan."""
+    from database import get_neo4j_driver
+    from utils.schema import FULL_SCANS, LABEL_SCANS
+
+    profile = mode == PROFILE
+    try:
+        with get_neo4j_driver().session() as session:
+            summary = session.run(f"{mode} {query}", parameters).consume()
+    except Exception as e:
+        # e.g. schema commands, which have no plan
+        logger.warning("Could not capture the plan of slow query %s: %s", name, e)
+        return None
+    plan = summary.profile if profile else summary.plan
+    if not plan:
+        return None
+
+    operators = list(plan_operators(plan))
+    flagged = sorted({operator for _, operator, *_ in operators if operator in FULL_SCANS | LABEL_SCANS | CARTESIAN_PRODUCTS})
+    total_db_hits = sum(db_hits or 0 for *_, db_hits in operators)
+    logger.warning(
+        "%s of slow query %s: %s db hits%s\n%s",
+        mode, name,
+        total_db_hits if profile else "no",
+        f", flagged: {', '.join(flagged)}" if flagged else "",
+        format_plan(plan),
+    )
+    return plan
@@ -0,0 +1,135 @@
+import hashlib
+import os
+import re
+
+import rdflib
+
+# File extensions the streaming reader understands, mapped to rdflib format names
+STREAM_FORMATS = {
+    ".nt": "nt",
+    ".ttl": "turtle",
+}
+
+def stream_format(file_path):
+    """Return the rdflib format for a streamable file, or None."""
+    return STREAM_FORMATS.get(os.path.splitext(file_path)[1].lower())
+
+# Strings, IRIs and comments (group 1, kept as they are) or a blank node label (group 2)
+_BLANK_NODE_LABEL = re.compile(
+    r'("""[\s\S]*?"""|' r"'''[\s\S]*?'''|" r'"(?:[^"\\\n]|\\.)*"|' r"'(?:[^'\\\n]|\\.)*'|<[^>\s]*>|#[^\n]*)"
+    r"|_:(\w(?:[\w.-]*[\w-])?)"
+)
+
+def blank_node_base(file_path):
+    """IRI prefix standing in for the blank node labels of one file."""
+    digest = hashlib.sha1(os.path.abspath(file_path).encode("utf-8")).hexdigest()[:16]
+    return f"urn:bnode:{digest}:"
+
+def skolemize_blank_nodes(text, base):
+    """Replace `_:label` blank nodes with `<base + label>` IRIs.
+
+    A label names the same node throughout a file, but every parse mints new
+    blank nodes, so a node described across chunks (or across a resume)
+    would otherwise be split into several terms.
+    """
+    if "_:" not in text:
+        return text
+    return _BLANK_NODE_LABEL.sub(lambda match: match.group(1) or f"<{base}{match.group(2)}>", text)
+
+def _is_directive(line):
+    words = line.split(None, 1)
+    return bool(words) and words[0].upper() in (b"@PREFIX", b"@BASE", b"PREFIX", b"BASE")
+
+def _ntriples_subject(line):
+    return line.split(None, 1)[0] if line.strip() else None
+
+def iter_statement_chunks(file_path, fmt, start_offset=0, chunk_statements=5000):
+    """Read an N-Triples or Turtle file as parseable text chunks.
+
+    Yields `(end_offset, text)` where `end_offset` is the byte offset right
+    after the chunk, so a load can later resume from it. Chunks only end
+    between subjects: consecutive N-Triples lines sharing a subject, or a
+    whole Turtle statement, always land in the same chunk. Turtle `@prefix`
+    and `@base` directives, wherever they appear between statements, are
+    replayed at the top of every later chunk.
+    """
+    header = []
+    with open(file_path, "rb") as f:
+        # Turtle directives before the resume point still apply to what
+        # follows; N-Triples has none, so a resume seeks straight there
+        while fmt == "turtle" and f.tell() < start_offset:
+            line = f.readline()
+            if not line:
+                break
+            if _is_directive(line):
+                header.append(line)
+        f.seek(start_offset)
+
+        lines = []
+        # Directives in effect where the current chunk starts
+        chunk_header = list(header)
+        statements = 0
+        in_long_string = False
+        in_statement = False
+        last_subject = None
+
+        while True:
+            line = f.readline()
+            if not line:
+                break
+
+            if fmt == "nt":
+                subject = _ntriples_subject(line)
+                if subject is None or line.lstrip().startswith(b"#"):
+                    continue
+                if subject != last_subject:
+                    # Only cut on a subject change so records are never split
+                    if statements >= chunk_statements:
+                        yield f.tell() - len(line), b"".join(lines).decode("utf-8")
+                        lines = []
+                        statements = 0
+                    statements += 1
+                    last_subject = subject
+                lines.append(line)
+                continue
+
+            # Turtle
+            if not in_statement and _is_directive(line):
+                # Stays in place for this chunk and is replayed ahead of the later ones
+                header.append(line)
+                lines.append(line)
+                continue
+            lines.append(line)
+            if line.count(b'"""') % 2 or line.count(b"'''") % 2:
+                in_long_string = not in_long_string
+            stripped = line.strip()
+            if in_long_string or (stripped and not stripped.startswith(b"#")):
+                in_statement = True
+            if not in_long_string and stripped.endswith(b".") and not stripped.startswith(b"#"):
+                in_statement = False
+                statements += 1
+                if statements >= chunk_statements:
+                    yield f.tell(), b"".join(chunk_header + lines).decode("utf-8")
+                    lines = []
+                    chunk_header = list(header)
+                    statements = 0
+
+        if lines:
+            yield f.tell(), b"".join(chunk_header + lines).decode("utf-8")
+
+def iter_chunk_graphs(file_path, start_offset=0, chunk_statements=5000):
+    """Parse a streamable RDF file chunk by chunk.
+
+    Yields `(end_offset, graph)` pairs; each graph only holds the triples of
+    one chunk, so peak memory is bounded by `chunk_statements`. Blank node
+    labels become IRIs (see `skolemize_blank_nodes`), so each keeps naming
+    one node across chunks.
+    """
+    fmt = stream_format(file_path)
+    if fmt is None:
+        raise ValueError(f"Streaming ingestion supports {', '.join(STREAM_FORMATS)} files, got {file_path}")
+    base = blank_node_base(file_path)
+    for end_offset, text in iter_statement_chunks(file_path, fmt, start_offset, chunk_statements):
+        graph = rdflib.Graph()
+        graph.parse(data=skolemize_blank_nodes(text, base), format=fmt)
+        yield end_offset, graph
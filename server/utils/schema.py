@@ -0,0 +1,172 @@
+"""Graph schema bootstrap and query plan checks.
+
+Entries are labelled `AllNodes` and looked up by `identifier` (unique),
+`notation` and the normalized `normLabel`; ontology terms are merged on their
+unique `Term.uri`. Searches go through the `entityLabelIndex` fulltext index.
+Users are unique on `username`, which also has a text index for substring
+search.
+Every constraint and index in `SCHEMA` is created if missing, once at startup
+or by running
+
+    python -m utils.schema
+
+`python -m utils.schema --check-plans` EXPLAINs every registered query (see
+utils.queries) and exits non-zero if a plan scans the whole graph, or scans a
+label where it should seek an index.
+"""
+import argparse
+import importlib
+import logging
+import sys
+
+from neo4j.exceptions import Neo4jError
+
+from database import get_neo4j_driver
+from utils.queries import QUERIES, run_query
+
+logger = logging.getLogger(__name__)
+
+SEARCH_INDEX = "entityLabelIndex"
+
+# (name, statement) pairs, applied in order; each one is idempotent
+SCHEMA = (
+    ("term_uri", "CREATE CONSTRAINT term_uri IF NOT EXISTS FOR (t:Term) REQUIRE t.uri IS UNIQUE"),
+    (
+        "all_nodes_identifier_unique",
+        "CREATE CONSTRAINT all_nodes_identifier_unique IF NOT EXISTS FOR (n:AllNodes) REQUIRE n.identifier IS UNIQUE"
+    ),
+    ("user_username_unique", "CREATE CONSTRAINT user_username_unique IF NOT EXISTS FOR (u:User) REQUIRE u.username IS UNIQUE"),
+    ("user_username_text", "CREATE TEXT INDEX user_username_text IF NOT EXISTS FOR (u:User) ON (u.username)"),
+    ("all_nodes_notation", "CREATE INDEX all_nodes_notation IF NOT EXISTS FOR (n:AllNodes) ON (n.notation)"),
+    ("all_nodes_norm_label", "CREATE INDEX all_nodes_norm_label IF NOT EXISTS FOR (n:AllNodes) ON (n.normLabel)"),
+    (
+        SEARCH_INDEX,
+        f"""
+        CREATE FULLTEXT INDEX {SEARCH_INDEX} IF NOT EXISTS FOR (n:AllNodes)
+        ON EACH [n.prefLabel, n.altLabel, n.identifier]
+        """
+    ),
+)
+
+# Modules whose queries are registered on import
+QUERY_MODULES = (
+    "utils.entry_helper",
+    "utils.tree_helper",
+    "utils.entry_snapshot",
+    "utils.label_index",
+    "utils.hierarchy",
+    "utils.search",
+    "utils.typeahead",
+    "controllers.entry_controller",
+    "controllers.user_controller",
+)
+
+# Plan operators that read every node or relationship in the database
+FULL_SCANS = {"AllNodesScan", "AllRelationshipsScan", "UndirectedAllRelationshipsScan", "DirectedAllRelationshipsScan"}
+
+# Operators that read every node with a label or every relationship of a type
+LABEL_SCANS = {
+    "NodeByLabelScan", "UnionNodeByLabelsScan", "IntersectionNodeByLabelsScan",
+    "DirectedRelationshipTypeScan", "UndirectedRelationshipTypeScan",
+}
+
+def label_unlabelled_nodes(session):
+    """Give `AllNodes` to every non-User node missing it (nodes written before this was automatic).
+
+    Parent placeholders of an unfinished streamed load (a Term with only its
+    uri) are left to the load, which labels or removes them.
+    """
+    result = run_query(
+        session,
+        """
+        MATCH (n)
+        WHERE NOT n:AllNodes AND NOT n:User AND NOT (n:Term AND keys(n) = ["uri"])
+        CALL { WITH n SET n:AllNodes } IN TRANSACTIONS OF 10000 ROWS
+        """,
+        name="label_unlabelled_nodes"
+    )
+    return result.consume().counters.labels_added
+
+def ensure_schema(session):
+    """Create every constraint and index in `SCHEMA` that does not exist yet.
+
+    A statement that fails (e.g. a uniqueness constraint over duplicate
+    data) is logged and skipped so the rest still get applied. Returns the
+    names of the failed ones.
+    """
+    failed = []
+    for name, statement in SCHEMA:
+        try:
+            run_query(session, statement, name=f"schema_{name}").consume()
+        except Neo4jError as e:
+            logger.error("Could not create %s: %s", name, e.message)
+            failed.append(name)
+    return failed
+
+def backfill_normalized_labels(session):
+    """Set `normLabel`/`normAltLabels` on entries written before they were maintained."""
+    result = run_query(
+        session,
+        """
+        MATCH (n:AllNodes)
+        WHERE n.normLabel IS NULL AND n.prefLabel IS NOT NULL
+        CALL {
+            WITH n
+            WITH n,
+                CASE WHEN n.prefLabel IS :: LIST<ANY> THEN head(n.prefLabel) ELSE n.prefLabel END AS pref,
+                CASE WHEN n.altLabel IS NULL THEN []
+                     WHEN n.altLabel IS :: LIST<ANY> THEN n.altLabel
+                     ELSE [n.altLabel] END AS alts
+            SET n.normLabel = toLower(trim(toString(pref))),
+                n.normAltLabels = [alt IN alts | toLower(trim(toString(alt)))]
+        } IN TRANSACTIONS OF 10000 ROWS
+        """,
+        name="backfill_normalized_labels"
+    )
+    return result.consume().counters.properties_set
+
+def migrate():
+    """Bring the schema up to date. Safe to run repeatedly."""
+    with get_neo4j_driver().session() as session:
+        labelled = label_unlabelled_nodes(session)
+        failed = ensure_schema(session)
+        backfill_normalized_labels(session)
+    logger.info("Schema ready (%d nodes labelled AllNodes, %d statements failed)", labelled, len(failed))
+    return labelled
+
+def _operators(plan):
+    """Operator names in a plan tree as returned by the driver, without version suffixes."""
+    stack = [plan]
+    while stack:
+        node = stack.pop()
+        yield node["operatorType"].split("@")[0]
+        stack.extend(node.get("children", []))
+
+def plan_problems(query, plan):
+    """Scanning operators in `plan` that `query` is not allowed to use."""
+    forbidden = FULL_SCANS if query.scans else FULL_SCANS | LABEL_SCANS
+    return sorted({operator for operator in _operators(plan) if operator in forbidden})
+
+def check_plans():
+    """EXPLAIN every registered query; returns `{name: [scanning operators]}` for the failures."""
+    for module in QUERY_MODULES:
+        importlib.import_module(module)
+    failures = {}
+    with get_neo4j_driver().session() as session:
+        for name, query in sorted(QUERIES.items()):
+            # Not through run_query: EXPLAIN is itself the plan capture
+            plan = session.run("EXPLAIN " + query.text, query.params).consume().plan
+            problems = plan_problems(query, plan)
+            if problems:
+                failures[name] = problems
+            logger.info("%-32s %-5s %s", name, query.kind, ", ".join(problems) or "ok")
+    return failures
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--check-plans", action="store_true", help="EXPLAIN registered queries instead of migrating")
+    args = parser.parse_args()
+    if args.check_plans:
+        sys.exit(1 if check_plans() else 0)
+    migrate()
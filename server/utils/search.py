@@ -0,0 +1,143 @@
+"""Entry search for the landing page typeahead.
+
+SEARCH_BACKEND picks the engine: `fulltext` (default) queries the
+`entityLabelIndex` fulltext index, `local` answers from the in-process
+index in utils.typeahead.
+
+Fulltext results are kept in an LRU cache with a TTL, keyed by the
+normalized query and tagged with the write generation (see
+utils.entry_events), so a create or update makes every cached result stale
+at once. The cache holds the top candidates without exclusions;
+`selectedNodes` is filtered out afterwards, so every exclusion set shares
+the same entry.
+"""
+import os
+import time
+from collections import OrderedDict
+
+from fastapi.concurrency import run_in_threadpool
+
+from utils import entry_events
+from utils.queries import register, run_query_async
+from utils.typeahead import typeahead_index
+
+SEARCH_BACKENDS = ("fulltext", "local")
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "fulltext").lower()
+if SEARCH_BACKEND not in SEARCH_BACKENDS:
+    raise ValueError(f"SEARCH_BACKEND must be one of {', '.join(SEARCH_BACKENDS)}, not {SEARCH_BACKEND!r}")
+
+# Results returned per search
+SEARCH_RESULTS = 10
+
+# Candidates cached per query, so exclusions can be applied after the lookup
+SEARCH_CANDIDATES = int(os.getenv("SEARCH_CANDIDATES", "50"))
+
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "2048"))
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "300"))
+
+SEARCH_ENTRIES = register("search_entries", """
+    CALL db.index.fulltext.queryNodes('entityLabelIndex', $query)
+    YIELD node, score
+    WHERE
+        (node.notation IS NOT NULL OR node.identifier IS NOT NULL) AND
+        NOT COALESCE(node.notation, node.identifier) IN $excludeNodes
+    RETURN node.prefLabel AS name,
+           COALESCE(node.notation, node.identifier) AS term_code,
+           score
+    ORDER BY score DESC
+    LIMIT $limit
+""", params={"query": "abnormal", "excludeNodes": [], "limit": SEARCH_RESULTS})
+
+def _cache_key(query: str):
+    """Cache key for a query: repeated whitespace means nothing to Lucene.
+
+    Case is kept, since the AND/OR/NOT/TO operators only work in upper case.
+    """
+    return " ".join(query.split())
+
+class SearchCache:
+    """LRU cache of search candidates with a TTL and write-generation check.
+
+    Only used from the event loop, so it needs no locking.
+    """
+
+    def __init__(self, max_entries: int = SEARCH_CACHE_SIZE, ttl: float = SEARCH_CACHE_TTL, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (expires, generation, candidates)
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Cached candidates for `key`, or None if missing, expired or older than the last write."""
+        cached = self._entries.get(key)
+        if cached is not None:
+            expires, generation, candidates = cached
+            if expires > self._clock() and generation == entry_events.generation():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return candidates
+            del self._entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key, candidates, generation):
+        """Store candidates fetched while `generation` was current."""
+        if generation != entry_events.generation():
+            # A write landed while the query ran; the result may already be stale
+            return
+        self._entries[key] = (self._clock() + self.ttl, generation, candidates)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "generation": entry_events.generation(),
+        }
+
+search_cache = SearchCache()
+
+async def _run_search(session, query: str, exclude, limit: int):
+    result = await run_query_async(session, SEARCH_ENTRIES, {"query": query, "excludeNodes": list(exclude), "limit": limit})
+    return [
+        {"name": record["name"], "code": record["term_code"], "score": record["score"]}
+        async for record in result
+    ]
+
+async def search_entries(session, query: str, exclude=()):
+    """Top SEARCH_RESULTS entries for `query` whose code is not in `exclude`."""
+    if SEARCH_BACKEND == "local":
+        if not typeahead_index.ready:
+            await run_in_threadpool(typeahead_index.ensure_loaded)
+        # Sub-millisecond, so neither cached nor moved off the event loop
+        return typeahead_index.search(query, SEARCH_RESULTS, exclude)
+
+    key = _cache_key(query)
+    candidates = search_cache.get(key)
+    if candidates is None:
+        generation = entry_events.generation()
+        candidates = await _run_search(session, query, (), SEARCH_CANDIDATES)
+        search_cache.put(key, candidates, generation)
+
+    excluded = set(exclude)
+    entries = [entry for entry in candidates if entry["code"] not in excluded][:SEARCH_RESULTS]
+    if len(entries) < SEARCH_RESULTS and len(candidates) == SEARCH_CANDIDATES:
+        # The exclusions used up the cached candidates; more matches may exist
+        entries = await _run_search(session, query, excluded, SEARCH_RESULTS)
+    return entries
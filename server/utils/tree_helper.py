@@ -0,0 +1,210 @@
+"""PrimeVue tree building and payload projection for the entry browse endpoints."""
+from utils.hierarchy import node_type
+from utils.queries import register, run_query_async
+
+# Fields a tree entry can be projected to with `fields=`
+TREE_FIELDS = ("key", "label", "data", "leaf", "loading", "nodeType", "parents")
+
+# Deepest subtree one request may prefetch
+MAX_TREE_DEPTH = 5
+
+# Large properties left out of list payloads unless asked for with `include=`
+HEAVY_PROPERTIES = ("sequence", "features")
+
+# Lookup helpers maintained by the write paths, never part of an API payload
+INTERNAL_PROPERTIES = ("normLabel", "normAltLabels")
+
+def parse_fields(fields: str = None):
+    """Parse a comma separated `fields` parameter; None means every field.
+
+    Raises ValueError on unknown field names.
+    """
+    if fields is None:
+        return None
+    selected = tuple(field.strip() for field in fields.split(",") if field.strip())
+    unknown = [field for field in selected if field not in TREE_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields {', '.join(unknown)}; expected any of {', '.join(TREE_FIELDS)}")
+    return selected
+
+def parse_include(include: str = None):
+    """Properties to leave out of `data` given an `include` parameter.
+
+    By default heavy properties are dropped; `include=sequence` keeps that
+    one and `include=*` keeps them all.
+    """
+    requested = {name.strip() for name in (include or "").split(",") if name.strip()}
+    if "*" in requested:
+        return list(INTERNAL_PROPERTIES)
+    return list(INTERNAL_PROPERTIES) + [name for name in HEAVY_PROPERTIES if name not in requested]
+
+def project_properties(properties, exclude):
+    """Copy of a node's properties without the `exclude`d keys."""
+    if properties is None:
+        return None
+    return {key: value for key, value in properties.items() if key not in exclude}
+
+def project_entry_data(entries: list, exclude):
+    """Apply `project_properties` to the `data` of entries built from cached nodes."""
+    for entry in entries:
+        entry["data"] = project_properties(entry["data"], exclude)
+    return entries
+
+def _pairs_to_dict(pairs):
+    # Projection happens server side, so only the kept properties cross the wire
+    return None if pairs is None else dict(pairs)
+
+# Roots of a database keyed by notation (identifier when there is none). Each
+# branch starts from an index range scan on the prefix, beginning right after
+# the `$after` cursor ("" for the first page); the second only picks up nodes
+# the first cannot see, so no node is returned twice.
+_ROOTS_OF_DATABASE = """
+    CALL {
+        MATCH (e:AllNodes)
+        WHERE e.notation STARTS WITH $prefix AND e.notation > $after
+        RETURN e, e.notation AS key
+        UNION
+        MATCH (e:AllNodes)
+        WHERE e.identifier STARTS WITH $prefix AND NOT coalesce(e.notation, "") STARTS WITH $prefix
+            AND coalesce(e.notation, e.identifier) > $after
+        RETURN e, coalesce(e.notation, e.identifier) AS key
+    }
+    WITH e, key
+    WHERE NOT (e)-[]->()
+"""
+
+ROOT_ENTRIES = register("root_entries", _ROOTS_OF_DATABASE + """
+    WITH DISTINCT key, e
+    ORDER BY key
+    LIMIT coalesce($limit, 9223372036854775807)
+    RETURN e.prefLabel AS prefLabel,
+        key AS notation,
+        EXISTS(()-[]->(e)) AS hasIncomingRelationships,
+        CASE WHEN $withData THEN [property IN keys(e) WHERE NOT property IN $exclude | [property, e[property]]] END AS data,
+        labels(e) AS nodeLabel
+""", params={"prefix": "MPO:", "after": "", "limit": 100, "withData": True, "exclude": []})
+
+ROOT_COUNT = register("root_count", _ROOTS_OF_DATABASE + """
+    RETURN count(DISTINCT key) AS total
+""", params={"prefix": "MPO:", "after": ""})
+
+# Parents are looked up by identifier or notation, each through its own index
+CHILDREN_ENTRIES = register("children_entries", """
+    UNWIND $keys AS parentKey
+    CALL {
+        WITH parentKey
+        MATCH (parent:AllNodes {identifier: parentKey})
+        RETURN parent
+        UNION
+        WITH parentKey
+        MATCH (parent:AllNodes {notation: parentKey})
+        RETURN parent
+    }
+    MATCH (child:AllNodes)-[:SUBCLASS_OF]->(parent)
+    WITH parentKey, child, labels(child) AS nodeLabel
+    MATCH (child)-[:SUBCLASS_OF]->(allParents)
+    RETURN
+        parentKey,
+        EXISTS(()-[]->(child)) AS hasIncomingRelationships,
+        nodeLabel AS nodeLabel,
+        child.identifier AS identifier,
+        child.prefLabel AS prefLabel,
+        CASE WHEN $withData THEN [property IN keys(child) WHERE NOT property IN $exclude | [property, child[property]]] END AS data,
+        collect({ name: allParents.prefLabel, code: allParents.identifier }) AS parents
+""", params={"keys": ["MPO:0000001"], "withData": True, "exclude": []})
+
+async def fetch_root_entries(session, database: str, with_data: bool = True, exclude=(), after: str = None, limit: int = None):
+    """Root entries (no outgoing relationship) of a database from Neo4j, in notation order.
+
+    With `limit`, returns at most that many roots after the notation `after`.
+    Returns `(entries, has_more)`, `has_more` telling whether roots remain
+    past the page.
+    """
+    result = await run_query_async(
+        session,
+        ROOT_ENTRIES,
+        prefix=database + ":",
+        after=after or "",
+        # One extra row tells whether there is a next page
+        limit=None if limit is None else limit + 1,
+        withData=with_data,
+        exclude=list(exclude)
+    )
+    records = [record async for record in result]
+    has_more = limit is not None and len(records) > limit
+    entry_dict = {}
+    for record in records[:limit]:
+        notation = record["notation"]
+        entry_dict[notation] = {
+            "key": notation,
+            "label": record["prefLabel"],
+            "data": _pairs_to_dict(record["data"]),
+            "leaf": not record["hasIncomingRelationships"],
+            "loading": True,
+            "nodeType": node_type(record["nodeLabel"])
+        }
+    return list(entry_dict.values()), has_more
+
+async def count_root_entries(session, database: str):
+    """Number of roots `fetch_root_entries` returns unpaginated."""
+    result = await run_query_async(
+        session,
+        ROOT_COUNT,
+        prefix=database + ":",
+        after=""
+    )
+    record = await result.single()
+    return record["total"]
+
+async def fetch_children_entries(session, keys: list, with_data: bool = True, exclude=()):
+    """Children of several nodes (by identifier or notation) in one query: `{key: [entries]}`."""
+    result = await run_query_async(
+        session,
+        CHILDREN_ENTRIES,
+        keys=keys,
+        withData=with_data,
+        exclude=list(exclude)
+    )
+    children = {key: [] for key in keys}
+    async for record in result:
+        children[record["parentKey"]].append({
+            "key": record["identifier"],
+            "label": record["prefLabel"],
+            "data": _pairs_to_dict(record["data"]),
+            "leaf": not record["hasIncomingRelationships"],
+            "loading": True,
+            "nodeType": node_type(record["nodeLabel"]),
+            "parents": record["parents"]
+        })
+    return children
+
+async def expand_tree(entries: list, depth: int, fetch_children):
+    """Prefetch `depth - 1` further levels below `entries`, one fetch per level.
+
+    `fetch_children(keys)` is awaited and returns `{key: [entries]}`. Expanded
+    entries get a `children` list and `loading: False`.
+    """
+    level = entries
+    for _ in range(depth - 1):
+        expandable = [entry for entry in level if not entry["leaf"]]
+        if not expandable:
+            break
+        children = await fetch_children([entry["key"] for entry in expandable])
+        level = []
+        for entry in expandable:
+            entry["children"] = children.get(entry["key"], [])
+            entry["loading"] = False
+            level.extend(entry["children"])
+    return entries
+
+def project_entries(entries: list, fields):
+    """Keep only `fields` (plus any prefetched `children`) on every entry, recursively."""
+    if fields is None:
+        return entries
+    projected = []
+    for entry in entries:
+        lean = {field: entry[field] for field in fields if field in entry}
+        if "children" in entry:
+            lean["children"] = project_entries(entry["children"], fields)
+        projected.append(lean)
+    return projected
@@ -0,0 +1,296 @@
+"""In-process typeahead search over prefLabel, altLabel and identifier.
+
+An alternative to the `entityLabelIndex` fulltext index, selected with
+SEARCH_BACKEND=local (see utils.search). Every label is normalized and kept
+in two structures:
+
+- a sorted array of (word-start suffix, term) pairs, so "hep" and "b vir"
+  both find "hepatitis b virus" with one bisect;
+- a trigram index over the distinct words, so when prefixes find too little
+  a misspelled word ("hepatits") is corrected to its closest words and the
+  corrected query is looked up again, ranked below exact prefix matches.
+
+A `LazyIndex` (see utils.entry_events).
+"""
+import heapq
+import logging
+import math
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+from database import get_neo4j_driver
+from utils import entry_events
+from utils.entry_events import LazyIndex, as_list, identifier_values
+from utils.label_index import normalize_label
+from utils.queries import register, run_query
+
+logger = logging.getLogger(__name__)
+
+# Relative weight of a match per field
+FIELD_WEIGHTS = {"prefLabel": 1.0, "altLabel": 0.9, "identifier": 0.8}
+
+# Most prefix matches looked at per query; very short prefixes match thousands
+PREFIX_SCAN_LIMIT = 200
+
+# Trigram similarity a word needs to count as a correction of a misspelled one
+FUZZY_THRESHOLD = 0.5
+
+# Closest words tried per misspelled word, and corrected queries tried per search
+FUZZY_CORRECTIONS = 3
+FUZZY_VARIANTS = 4
+
+# Fuzzy scores are scaled below the weakest exact prefix match
+FUZZY_SCALE = 0.25
+
+TYPEAHEAD_ENTRIES = register("typeahead_entries", """
+    MATCH (n:AllNodes)
+    WHERE n.identifier IS NOT NULL OR n.notation IS NOT NULL
+    RETURN n.identifier AS identifier, n.notation AS notation, n.prefLabel AS prefLabel, n.altLabel AS altLabel
+""", scans=True)
+
+def normalize_query(text):
+    """Lower-cased with whitespace collapsed, or None if empty."""
+    text = normalize_label(text)
+    return " ".join(text.split()) if text else None
+
+def trigrams(word):
+    """Trigrams of a word padded at the start only, so typed prefixes share them."""
+    padded = "  " + word
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class TypeaheadIndex(LazyIndex):
+    def __init__(self):
+        super().__init__()
+        self._reset()
+
+    def _reset(self):
+        self._fields = {}       # key (identifier or notation) -> {"identifier", "notation", "prefLabel", "altLabel"}
+        self._entries = {}      # key -> (code, name, term ids)
+        self._terms = []        # term id -> (text, key, weight, is a label), None once removed
+        self._free_terms = []   # ids of removed terms, reused by the next ones added
+        self._words = []        # sorted (word-start suffix, term id, word index)
+        self._vocabulary = {}   # word -> number of terms using it
+        self._trigrams = defaultdict(set)  # trigram -> words
+
+    def __len__(self):
+        return len(self._entries)
+
+    # Building
+
+    def _add_term(self, text, key, weight, label=True, bulk=False):
+        if self._free_terms:
+            term_id = self._free_terms.pop()
+            self._terms[term_id] = (text, key, weight, label)
+        else:
+            term_id = len(self._terms)
+            self._terms.append((text, key, weight, label))
+        # Only label words are candidates for spelling corrections
+        for word in set(text.split(" ")) if label else ():
+            if word not in self._vocabulary:
+                self._vocabulary[word] = 0
+                for gram in trigrams(word):
+                    self._trigrams[gram].add(word)
+            self._vocabulary[word] += 1
+        start = 0
+        for word_index, word in enumerate(text.split(" ")):
+            item = (text[start:], term_id, word_index)
+            if bulk:
+                self._words.append(item)
+            else:
+                insort(self._words, item)
+            start += len(word) + 1
+        return term_id
+
+    def _remove_term(self, term_id):
+        text, _, _, label = self._terms[term_id]
+        self._terms[term_id] = None
+        for word in set(text.split(" ")) if label else ():
+            self._vocabulary[word] -= 1
+            if not self._vocabulary[word]:
+                del self._vocabulary[word]
+                for gram in trigrams(word):
+                    self._trigrams[gram].discard(word)
+                    if not self._trigrams[gram]:
+                        del self._trigrams[gram]
+        start = 0
+        for word_index, word in enumerate(text.split(" ")):
+            position = bisect_left(self._words, (text[start:], term_id, word_index))
+            if position < len(self._words) and self._words[position][1] == term_id:
+                self._words.pop(position)
+            start += len(word) + 1
+        # No word points at it any more
+        self._free_terms.append(term_id)
+
+    def _add_entry(self, key, fields, bulk=False):
+        self._fields[key] = fields
+        pref_labels = as_list(fields.get("prefLabel"))
+        texts = [(normalize_query(label), FIELD_WEIGHTS["prefLabel"], True) for label in pref_labels]
+        texts += [(normalize_query(label), FIELD_WEIGHTS["altLabel"], True) for label in as_list(fields.get("altLabel"))]
+        codes = identifier_values(fields.get("notation")) + identifier_values(fields.get("identifier"))
+        texts += [(normalize_query(code), FIELD_WEIGHTS["identifier"], False) for code in codes]
+        seen = set()
+        term_ids = []
+        for text, weight, label in texts:
+            if isinstance(text, str) and text not in seen:
+                seen.add(text)
+                term_ids.append(self._add_term(text, key, weight, label, bulk))
+        code = codes[0] if codes else None
+        name = pref_labels[0] if pref_labels else None
+        self._entries[key] = (code, name, tuple(term_ids))
+
+    def _remove_entry(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            for term_id in entry[2]:
+                self._remove_term(term_id)
+        return self._fields.pop(key, {})
+
+    def build(self, rows):
+        """Replace the index with `(identifier, notation, prefLabel, altLabel)` rows."""
+        with self._lock:
+            self._reset()
+            for identifier, notation, pref_label, alt_label in rows:
+                # Loaded terms may hold several identifiers; the first one keys the entry
+                keys = identifier_values(identifier) or identifier_values(notation)
+                if not keys:
+                    continue
+                key = keys[0]
+                fields = {"identifier": identifier, "notation": notation, "prefLabel": pref_label, "altLabel": alt_label}
+                self._add_entry(key, fields, bulk=True)
+            self._words.sort()
+
+    def load(self):
+        """Rebuild the index from the graph."""
+        with get_neo4j_driver().session() as session:
+            self.build(
+                (record["identifier"], record["notation"], record["prefLabel"], record["altLabel"])
+                for record in run_query(session, TYPEAHEAD_ENTRIES)
+            )
+        logger.info("Typeahead index loaded with %d entries and %d terms", len(self._entries), len(self._words))
+
+    def patch(self, identifier, change):
+        data = change.get("data") or {}
+        fields = self._remove_entry(identifier)
+        # Updates only overwrite the properties they send
+        fields = {**fields, "identifier": identifier}
+        for name in ("notation", "prefLabel", "altLabel"):
+            if name in data:
+                fields[name] = data[name]
+        self._add_entry(identifier, fields)
+
+    # Queries
+
+    def _prefix_scores(self, query, scores):
+        words = self._words
+        position = bisect_left(words, (query,))
+        end = min(len(words), position + PREFIX_SCAN_LIMIT)
+        while position < end:
+            suffix, term_id, word_index = words[position]
+            if not suffix.startswith(query):
+                break
+            text, key, weight, _ = self._terms[term_id]
+            coverage = len(query) / len(text)
+            if word_index == 0:
+                # Whole-label matches first, then the closest-length label prefixes
+                score = 3.0 if suffix == query else 2.0 + coverage
+            else:
+                score = 1.0 + coverage
+            score *= weight
+            if score > scores.get(key, 0):
+                scores[key] = score
+            position += 1
+
+    def _has_prefix(self, prefix):
+        position = bisect_left(self._words, (prefix,))
+        return position < len(self._words) and self._words[position][0].startswith(prefix)
+
+    def _corrections(self, word, partial):
+        """Up to FUZZY_CORRECTIONS `(similarity, word)` from the vocabulary, closest first.
+
+        The last word of a query may still be being typed (`partial`), so
+        there the share of its trigrams found in a word counts, not their overlap.
+        """
+        postings = sorted((self._trigrams.get(gram, ()) for gram in trigrams(word)), key=len)
+        grams = len(postings)
+        # Either similarity needs at least `needed` shared trigrams, so every
+        # correction shows up in one of the rarest grams - needed + 1 postings
+        needed = max(1, math.ceil(FUZZY_THRESHOLD * grams))
+        shared = defaultdict(int)
+        for posting in postings[:grams - needed + 1]:
+            for candidate in posting:
+                shared[candidate] += 1
+        for posting in postings[grams - needed + 1:]:
+            for candidate in shared:
+                if candidate in posting:
+                    shared[candidate] += 1
+        corrections = []
+        for candidate, common in shared.items():
+            if partial:
+                similarity = common / grams
+            else:
+                # A word of n letters has at most n trigrams
+                similarity = common / (grams + len(candidate) - common)
+            if similarity >= FUZZY_THRESHOLD:
+                corrections.append((similarity, -len(candidate), candidate))
+        return [(similarity, candidate) for similarity, _, candidate in heapq.nlargest(FUZZY_CORRECTIONS, corrections)]
+
+    def _fuzzy_scores(self, query, scores):
+        words = query.split(" ")
+        options = []
+        for index, word in enumerate(words):
+            partial = index == len(words) - 1
+            if len(word) < 3 or word in self._vocabulary or (partial and self._has_prefix(word)):
+                options.append([(1.0, word)])
+                continue
+            corrections = self._corrections(word, partial)
+            if not corrections:
+                return
+            options.append(corrections)
+
+        # Beam over the words, keeping the most similar corrected queries
+        variants = [(1.0, ())]
+        for choices in options:
+            variants = heapq.nlargest(
+                FUZZY_VARIANTS,
+                ((similarity * word_similarity, words + (word,))
+                 for similarity, words in variants for word_similarity, word in choices),
+                key=lambda variant: variant[0]
+            )
+        for similarity, words in variants:
+            variant = " ".join(words)
+            if variant == query:
+                continue
+            variant_scores = {}
+            self._prefix_scores(variant, variant_scores)
+            for key, score in variant_scores.items():
+                score *= similarity * FUZZY_SCALE
+                if score > scores.get(key, 0):
+                    scores[key] = score
+
+    def search(self, query, limit=10, exclude=()):
+        """Top `limit` entries as `{"name", "code", "score"}`, skipping codes in `exclude`.
+
+        Prefix matches rank above fuzzy ones; fuzzy matching only runs when
+        prefixes found fewer than `limit` entries.
+        """
+        query = normalize_query(query)
+        if not query:
+            return []
+        excluded = set(exclude)
+        scores = {}
+        with self._lock:
+            self._prefix_scores(query, scores)
+            if len(scores) < limit + len(excluded):
+                self._fuzzy_scores(query, scores)
+            entries = self._entries
+            ranked = heapq.nlargest(
+                limit,
+                ((score, key) for key, score in scores.items() if entries[key][0] not in excluded)
+            )
+            return [
+                {"name": entries[key][1], "code": entries[key][0], "score": round(score, 4)}
+                for score, key in ranked
+            ]
+
+typeahead_index = TypeaheadIndex()
+entry_events.add_listener(typeahead_index.apply_change)